@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Per-message CPU cost of the server's response path (codec.ResponseEncoder)
+
+Runs the decode + encode steps of WebSocketServer.handle_message for a typical
+client ping in every RESPONSE_MODE and installed JSON_BACKEND, and reports CPU
+time per message relative to the legacy dict + json.dumps path. The binary
+subprotocol (framing.py) is measured alongside as the `binary` mode.
+
+Usage:
+    python bench/encoder_bench.py [--iterations 200000] [--payload-bytes 0]
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'terraform', '05-server-application', 'app'))
+
+from codec import RESPONSE_MODES, ResponseEncoder, json_backend  # noqa: E402
+from framing import encode_ping  # noqa: E402
+
+
+def sample_message(payload_bytes: int) -> str:
+    message = {
+        "type": "ping",
+        "seq": 123456,
+        "sent_ns": time.monotonic_ns(),
+        "client_id": "envoy-poc-client-app-7d9c8b6f5-abcde",
+        "pod_name": "envoy-poc-client-app-7d9c8b6f5-abcde",
+        "pod_ip": "10.0.12.34",
+        "connection_id": 3,
+        "timestamp": "2026-01-01T00:00:00.000000",
+        "message": "Hello from envoy-poc-client-app-7d9c8b6f5-abcde connection #3"
+    }
+    if payload_bytes:
+        message["payload"] = "x" * payload_bytes
+    return json.dumps(message)
+
+
+def run(encoder: ResponseEncoder, message: str, iterations: int) -> float:
+    """CPU seconds per message for decode (when the mode parses) + encode"""
+    loads = encoder.json.loads
+    parses = encoder.parses
+    encode = encoder.encode
+    started = time.process_time()
+    for _ in range(iterations):
+        data = loads(message) if parses else None
+        encode(message, data)
+    return (time.process_time() - started) / iterations
+
+
+def run_binary(encoder: ResponseEncoder, frame: bytes, iterations: int) -> float:
+    """CPU seconds per message for a binary PING -> REPLY"""
+    encode_binary = encoder.encode_binary
+    started = time.process_time()
+    for _ in range(iterations):
+        encode_binary(frame)
+    return (time.process_time() - started) / iterations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200000)
+    parser.add_argument('--payload-bytes', type=int, default=0, help='extra payload added to the ping')
+    args = parser.parse_args()
+
+    message = sample_message(args.payload_bytes)
+    backends = [json_backend(name) for name in ('json', 'orjson', 'msgspec')
+                if name == 'json' or importlib.util.find_spec(name)]
+
+    results = []
+    for mode in RESPONSE_MODES:
+        # legacy is always stdlib json; echo-raw never decodes, so the backend does not matter
+        for backend in backends if mode == 'splice' else backends[:1]:
+            encoder = ResponseEncoder('10.0.1.23', 'envoy-poc-app-server-5f7d8c9b4-xyz12', mode, backend)
+            run(encoder, message, min(args.iterations, 10000))  # warm up
+            results.append((mode, backend.name, run(encoder, message, args.iterations)))
+
+    frame = encode_ping(123456, time.monotonic_ns(), b'x' * args.payload_bytes)
+    encoder = ResponseEncoder('10.0.1.23', 'envoy-poc-app-server-5f7d8c9b4-xyz12', 'splice', backends[0])
+    run_binary(encoder, frame, min(args.iterations, 10000))
+    results.append(('binary', '-', run_binary(encoder, frame, args.iterations)))
+
+    baseline = next(cost for mode, _, cost in results if mode == 'legacy')
+    print(f"Message size: {len(message)} bytes JSON, {len(frame)} bytes binary, {args.iterations} iterations\n")
+    print("| mode | backend | CPU µs/msg | vs legacy |")
+    print("|------|---------|-----------:|----------:|")
+    for mode, backend, cost in results:
+        print(f"| {mode} | {backend} | {cost * 1e6:.2f} | {cost / baseline:.0%} |")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+High-frequency Envoy admin stats collector
+
+Polls `/stats` on one or more Envoy admin endpoints every `--interval` seconds (1s by
+default, sub-second works) and keeps only the selected stats:
+- circuit breakers: `cluster.<name>.circuit_breakers.<priority>.*`
+- local rate limiting: `<prefix>.http_local_rate_limit.*`
+- upstream connections: `cluster.<name>.upstream_cx_active`
+- Lua filter: `http.<prefix>.lua.*`
+
+The text response is streamed and parsed line by line, so a large stats dump is never
+held in memory; the same regex is also passed to Envoy as `filter=` so most of it is not
+sent at all. Each target keeps one persistent admin connection. Counters are turned into
+per-second deltas (a counter that went backwards means Envoy restarted: the new value is
+the delta); gauges (`*_active`, `*_open`, `remaining_*`) are kept as values. The last
+`--ring-size` samples per target are kept in a fixed-size ring buffer.
+
+Served on `--port`:
+- /metrics: Prometheus text (latest value and per-second rate per target and stat)
+- /summary?window=SECONDS: JSON per target and stat over the window (counter total, average
+  and peak rate; gauge last, min and max), used by bench/harness.py for its report
+- /health
+
+Usage:
+    python bench/envoy_stats.py --target 127.0.0.1:9901 [--target ...] [--interval 0.5]
+        [--port 9902] [--ring-size 600] [--filter REGEX] [--print]
+    ENVOY_STATS_TARGETS=10.0.1.5:9901,10.0.2.7:9901 python bench/envoy_stats.py --print
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import os
+import re
+import signal
+import time
+import urllib.parse
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger('envoy-stats')
+
+DEFAULT_FILTER = r'circuit_breakers\.|local_?rate_?limit|upstream_cx_active$|\.lua\.'
+# Envoy's text format does not say which stats are gauges; these suffixes are
+GAUGE_PATTERN = re.compile(r'(_active|_open|\.remaining_[a-z_]+)$')
+
+READ_SIZE = 65536
+
+
+def parse_address(value: str) -> Tuple[str, int]:
+    host, _, port = value.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+class StatsTarget:
+    """One Envoy admin endpoint: its connection, latest values and ring of samples"""
+
+    def __init__(self, address: str, pattern: re.Pattern, ring_size: int):
+        self.address = address
+        self.host, self.port = parse_address(address)
+        self.pattern = pattern
+        self.path = '/stats?usedonly&filter=' + urllib.parse.quote(pattern.pattern.decode(), safe='')
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.values: Dict[str, float] = {}
+        self.rates: Dict[str, float] = {}
+        self.sampled_at = 0.0  # time.monotonic() of the last good sample
+        # (wall time, values, per-second rates) per sample, oldest dropped first
+        self.ring: Deque[Tuple[float, Dict[str, float], Dict[str, float]]] = collections.deque(maxlen=ring_size)
+        self.scrapes = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.duration = 0.0
+
+    # ---- HTTP ---------------------------------------------------------------
+
+    async def _connect(self) -> None:
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def _body(self) -> AsyncIterator[bytes]:
+        """Response body pieces; leaves the connection ready for the next request"""
+        if self.writer is None:
+            await self._connect()
+        self.writer.write(f'GET {self.path} HTTP/1.1\r\nHost: {self.address}\r\n\r\n'.encode())
+        head = await self.reader.readuntil(b'\r\n\r\n')
+        status, *header_lines = head.decode('latin-1').split('\r\n')
+        if status.split(' ', 2)[1] != '200':
+            raise ConnectionError(f'HTTP {status}')
+        headers = {}
+        for line in header_lines:
+            name, sep, value = line.partition(':')
+            if sep:
+                headers[name.strip().lower()] = value.strip().lower()
+        if headers.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await self.reader.readuntil(b'\r\n')).split(b';', 1)[0], 16)
+                if size == 0:
+                    await self.reader.readuntil(b'\r\n')
+                    break
+                yield await self.reader.readexactly(size)
+                await self.reader.readexactly(2)
+        elif 'content-length' in headers:
+            remaining = int(headers['content-length'])
+            while remaining > 0:
+                piece = await self.reader.read(min(READ_SIZE, remaining))
+                if not piece:
+                    raise ConnectionError('connection closed mid-body')
+                remaining -= len(piece)
+                yield piece
+        else:
+            while True:
+                piece = await self.reader.read(READ_SIZE)
+                if not piece:
+                    break
+                yield piece
+            self.close()
+        if headers.get('connection') == 'close':
+            self.close()
+
+    async def fetch(self) -> Dict[str, float]:
+        """{stat: value} for the stats matching the pattern, parsed as the body streams in"""
+        values: Dict[str, float] = {}
+        pending = b''
+        async for piece in self._body():
+            lines = (pending + piece).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                self._parse(line, values)
+        self._parse(pending, values)
+        return values
+
+    def _parse(self, line: bytes, values: Dict[str, float]) -> None:
+        name, sep, value = line.partition(b': ')
+        if not sep or not self.pattern.search(name):
+            return
+        try:
+            values[name.decode()] = float(value)
+        except ValueError:
+            pass  # histogram summaries ("P0(nan,0) P25(...) ...")
+
+    # ---- sampling -----------------------------------------------------------
+
+    async def sample(self, timeout: float) -> None:
+        started = time.monotonic()
+        try:
+            values = await asyncio.wait_for(self.fetch(), timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError, ValueError, IndexError) as e:
+            self.close()
+            self.errors += 1
+            if self.last_error != repr(e):
+                logger.warning(f"{self.address}: {e!r}")
+            self.last_error = repr(e)
+            return
+        now = time.monotonic()
+        self.duration = now - started
+        self.last_error = None
+        self.scrapes += 1
+        rates: Dict[str, float] = {}
+        if self.sampled_at:
+            elapsed = now - self.sampled_at
+            for name, value in values.items():
+                if GAUGE_PATTERN.search(name) or name not in self.values:
+                    continue
+                delta = value - self.values[name]
+                rates[name] = (value if delta < 0 else delta) / elapsed
+        self.values, self.rates, self.sampled_at = values, rates, now
+        self.ring.append((time.time(), values, rates))
+
+    def summary(self, window: float) -> Dict[str, Dict[str, float]]:
+        """Per stat over the samples of the last `window` seconds"""
+        since = time.time() - window
+        samples = [s for s in self.ring if s[0] >= since]
+        if not samples:
+            return {}
+        first, last = samples[0], samples[-1]
+        span = last[0] - first[0]
+        stats = {}
+        for name, value in sorted(last[1].items()):
+            if GAUGE_PATTERN.search(name):
+                seen = [s[1][name] for s in samples if name in s[1]]
+                stats[name] = {'last': value, 'min': min(seen), 'max': max(seen)}
+            else:
+                total = value - first[1].get(name, 0.0)
+                if total < 0:
+                    # Envoy restarted inside the window: add up the per-interval deltas instead
+                    total = sum(b[2].get(name, 0.0) * (b[0] - a[0]) for a, b in zip(samples, samples[1:]))
+                peak = max((s[2].get(name, 0.0) for s in samples), default=0.0)
+                stats[name] = {'total': round(total, 3), 'rate_avg': round(total / span, 3) if span else 0.0,
+                               'rate_max': round(peak, 3)}
+        return stats
+
+
+class Collector:
+    """Samples all targets concurrently on a fixed schedule"""
+
+    def __init__(self, targets: List[str], interval: float, ring_size: int, pattern: str,
+                 concurrency: int = 64):
+        compiled = re.compile(pattern.encode())
+        self.targets = [StatsTarget(t, compiled, ring_size) for t in targets]
+        self.interval = interval
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.ticks = 0
+        self.overruns = 0
+
+    async def _sample(self, target: StatsTarget) -> None:
+        async with self.semaphore:
+            await target.sample(self.interval)
+
+    async def run(self, on_tick=None) -> None:
+        deadline = time.monotonic()
+        while True:
+            await asyncio.gather(*(self._sample(t) for t in self.targets))
+            self.ticks += 1
+            if on_tick is not None:
+                on_tick(self)
+            deadline += self.interval
+            delay = deadline - time.monotonic()
+            if delay < 0:
+                # Slower than the interval: skip the missed ticks rather than bursting to catch up
+                self.overruns += 1
+                deadline = time.monotonic()
+                delay = 0
+            await asyncio.sleep(delay)
+
+    def close(self) -> None:
+        for target in self.targets:
+            target.close()
+
+    # ---- reporting ----------------------------------------------------------
+
+    def render_metrics(self) -> str:
+        def label(target: StatsTarget, stat: Optional[str] = None) -> str:
+            return f'target="{target.address}"' + (f',stat="{stat}"' if stat else '')
+
+        lines = ['# HELP envoy_stats_value Latest value of a selected Envoy stat',
+                 '# TYPE envoy_stats_value gauge']
+        lines += [f'envoy_stats_value{{{label(t, n)}}} {v}' for t in self.targets for n, v in sorted(t.values.items())]
+        lines += ['# HELP envoy_stats_rate Per-second rate of a selected Envoy counter over the last interval',
+                  '# TYPE envoy_stats_rate gauge']
+        lines += [f'envoy_stats_rate{{{label(t, n)}}} {round(v, 3)}'
+                  for t in self.targets for n, v in sorted(t.rates.items())]
+        lines += ['# HELP envoy_stats_scrapes_total Successful admin /stats fetches',
+                  '# TYPE envoy_stats_scrapes_total counter']
+        lines += [f'envoy_stats_scrapes_total{{{label(t)}}} {t.scrapes}' for t in self.targets]
+        lines += ['# HELP envoy_stats_scrape_errors_total Failed admin /stats fetches',
+                  '# TYPE envoy_stats_scrape_errors_total counter']
+        lines += [f'envoy_stats_scrape_errors_total{{{label(t)}}} {t.errors}' for t in self.targets]
+        lines += ['# HELP envoy_stats_scrape_duration_seconds Duration of the last admin /stats fetch',
+                  '# TYPE envoy_stats_scrape_duration_seconds gauge']
+        lines += [f'envoy_stats_scrape_duration_seconds{{{label(t)}}} {round(t.duration, 6)}' for t in self.targets]
+        lines += ['# HELP envoy_stats_overruns_total Ticks where sampling all targets took longer than the interval',
+                  '# TYPE envoy_stats_overruns_total counter',
+                  f'envoy_stats_overruns_total {self.overruns}']
+        return '\n'.join(lines) + '\n'
+
+    def summary(self, window: float) -> Dict:
+        return {
+            'interval': self.interval,
+            'window': window,
+            'targets': {t.address: {'scrapes': t.scrapes, 'errors': t.errors, 'stats': t.summary(window)}
+                        for t in self.targets},
+        }
+
+    def print_tick(self) -> None:
+        """--print: one line per stat that is non-zero or moving"""
+        stamp = time.strftime('%H:%M:%S')
+        for target in self.targets:
+            if target.last_error:
+                print(f'{stamp} {target.address} error: {target.last_error}', flush=True)
+                continue
+            for name, value in sorted(target.values.items()):
+                rate = target.rates.get(name)
+                if rate:
+                    print(f'{stamp} {target.address} {name} {value:.0f} (+{rate:.1f}/s)')
+                elif value and GAUGE_PATTERN.search(name):
+                    print(f'{stamp} {target.address} {name} {value:.0f}')
+        print(flush=True)
+
+
+# ---- HTTP endpoint --------------------------------------------------------
+
+async def serve_http(collector: Collector, port: int) -> asyncio.AbstractServer:
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+            target = request.split(b' ', 2)[1].decode()
+            url = urllib.parse.urlsplit(target)
+            if url.path == '/metrics':
+                status, content_type, body = '200 OK', 'text/plain; version=0.0.4', collector.render_metrics()
+            elif url.path == '/summary':
+                window = float(urllib.parse.parse_qs(url.query).get('window', ['60'])[0])
+                status, content_type, body = '200 OK', 'application/json', json.dumps(collector.summary(window))
+            elif url.path == '/health':
+                status, content_type, body = '200 OK', 'application/json', json.dumps(
+                    {'status': 'healthy', 'targets': len(collector.targets), 'ticks': collector.ticks})
+            else:
+                status, content_type, body = '404 Not Found', 'text/plain', 'not found\n'
+            payload = body.encode()
+            writer.write(f'HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(payload)}\r\n'
+                         f'Connection: close\r\n\r\n'.encode() + payload)
+            await writer.drain()
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, IndexError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, '0.0.0.0', port)
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    collector = Collector(args.target, args.interval, args.ring_size, args.filter, args.concurrency)
+    server = await serve_http(collector, args.port) if args.port else None
+    if server:
+        logger.info(f"Serving /metrics and /summary on :{args.port}")
+    logger.info(f"Sampling {len(collector.targets)} target(s) every {args.interval}s")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    runner = asyncio.ensure_future(collector.run(Collector.print_tick if args.print else None))
+    await stop.wait()
+    runner.cancel()
+    collector.close()
+    if server:
+        server.close()
+        await server.wait_closed()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', action='append', default=[], help='Envoy admin host:port, repeatable')
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds between samples (default 1)')
+    parser.add_argument('--ring-size', type=int, default=600, help='samples kept per target (default 600)')
+    parser.add_argument('--filter', default=DEFAULT_FILTER, help='regex selecting the stats to keep')
+    parser.add_argument('--port', type=int, default=9902, help='/metrics and /summary port, 0 to disable')
+    parser.add_argument('--concurrency', type=int, default=64, help='targets fetched at the same time')
+    parser.add_argument('--print', action='store_true', help='print non-zero stats and rates every sample')
+    args = parser.parse_args()
+    args.target += [t.strip() for t in os.getenv('ENVOY_STATS_TARGETS', '').split(',') if t.strip()]
+    if not args.target:
+        parser.error('no targets: pass --target or set ENVOY_STATS_TARGETS')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
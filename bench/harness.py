@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""
+Local end-to-end benchmark: client -> stand-in proxy -> N servers on one machine
+
+Starts `servers` WebSocketServer processes (05-server-application), a proxy in front
+of them (tcp_proxy.py, or envoy when the scenario asks for it and the binary is on
+PATH) and the client (07-client-application) in CLIENT_MODE=load. After `warmup`
+seconds it measures for `duration` seconds and writes report.json and report.md:
+- throughput: replies received by the client and messages handled by the servers per second
+- latency: client round-trip, handshake and time-to-first-message percentiles (whole run)
+- per component: CPU (% of one core, average and peak, and µs per reply) and RSS (peak), from /proc
+- with envoy: circuit breaker, local rate limit, upstream cx_active and Lua stats sampled every
+  second by envoy_stats.py (counter totals and rates, gauge ranges)
+
+Scenarios are JSON files (see bench/scenarios/):
+    {"name": "steady-chatter", "servers": 2, "proxy": "tcp", "warmup": 5, "duration": 30,
+     "server_env": {...}, "client_env": {"LOAD_RATE": "200", "LOAD_TARGET_CONNECTIONS": "500", ...}}
+
+Usage:
+    python bench/harness.py bench/scenarios/steady-chatter.json [--duration 60] [--servers 4]
+        [--proxy tcp|envoy] [--client-env KEY=VALUE] [--server-env KEY=VALUE]
+        [--output-dir DIR] [--baseline report.json [--tolerance 0.1]] [--save-baseline PATH]
+
+With --baseline, key metrics are compared against a stored report and the exit status is 1
+when any of them is worse by more than --tolerance.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SERVER_APP = os.path.join(ROOT, 'terraform', '05-server-application', 'app')
+CLIENT_APP = os.path.join(ROOT, 'terraform', '07-client-application', 'app')
+TCP_PROXY = os.path.join(ROOT, 'bench', 'tcp_proxy.py')
+ENVOY_STATS = os.path.join(ROOT, 'bench', 'envoy_stats.py')
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+# (metric path in the report, True if higher is better)
+COMPARED_METRICS = [
+    ('throughput.client_replies_per_sec', True),
+    ('latency.rtt.p50_ms', False),
+    ('latency.rtt.p99_ms', False),
+    ('latency.connect.p99_ms', False),
+    ('client.connections_failed', False),
+]
+
+
+# ---- processes ------------------------------------------------------------
+
+class Component:
+    """A benchmark process with its log file and /proc resource samples"""
+
+    def __init__(self, name: str, argv: List[str], cwd: str, env: Dict[str, str], log_dir: str):
+        self.name = name
+        self.log_path = os.path.join(log_dir, f'{name}.log')
+        self.log = open(self.log_path, 'w')
+        self.process = subprocess.Popen(argv, cwd=cwd, env={**os.environ, **env},
+                                         stdout=self.log, stderr=subprocess.STDOUT)
+        self.samples: List[Tuple[float, float, int]] = []  # (wall time, cpu seconds, rss bytes)
+
+    def pids(self) -> List[int]:
+        """The process and its descendants (WORKERS=N servers fork workers)"""
+        pids = [self.process.pid]
+        try:
+            children = {}
+            for entry in os.listdir('/proc'):
+                if entry.isdigit():
+                    try:
+                        with open(f'/proc/{entry}/stat') as f:
+                            ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+                    except (OSError, IndexError, ValueError):
+                        continue
+                    children.setdefault(ppid, []).append(int(entry))
+            for pid in pids:
+                pids.extend(children.get(pid, []))
+        except OSError:
+            pass
+        return pids
+
+    def sample(self) -> None:
+        cpu, rss = 0.0, 0
+        for pid in self.pids():
+            try:
+                with open(f'/proc/{pid}/stat') as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+                cpu += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS  # utime + stime
+                with open(f'/proc/{pid}/statm') as f:
+                    rss += int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+            except (OSError, IndexError, ValueError):
+                continue
+        self.samples.append((time.monotonic(), cpu, rss))
+
+    def resources(self, since: float) -> Optional[Dict[str, float]]:
+        window = [s for s in self.samples if s[0] >= since]
+        if len(window) < 2:
+            return None
+        elapsed = window[-1][0] - window[0][0]
+        peaks = [(b[1] - a[1]) / (b[0] - a[0]) for a, b in zip(window, window[1:]) if b[0] > a[0]]
+        return {
+            'cpu_seconds': round(window[-1][1] - window[0][1], 3),
+            'cpu_percent_avg': round(100 * (window[-1][1] - window[0][1]) / elapsed, 1),
+            'cpu_percent_peak': round(100 * max(peaks), 1) if peaks else 0.0,
+            'rss_mb_peak': round(max(s[2] for s in window) / 2 ** 20, 1),
+        }
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def stop(self, signum: int = signal.SIGTERM, timeout: float = 15) -> None:
+        if self.alive():
+            self.process.send_signal(signum)
+            try:
+                self.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.log.close()
+
+
+def envoy_config(port: int, admin_port: int, backends: List[int]) -> Dict:
+    """Minimal Envoy bootstrap: WebSocket upgrades routed round-robin to the servers"""
+    return {
+        'admin': {'address': {'socket_address': {'address': '127.0.0.1', 'port_value': admin_port}}},
+        'static_resources': {
+            'listeners': [{
+                'name': 'websocket',
+                'address': {'socket_address': {'address': '127.0.0.1', 'port_value': port}},
+                'filter_chains': [{'filters': [{
+                    'name': 'envoy.filters.network.http_connection_manager',
+                    'typed_config': {
+                        '@type': 'type.googleapis.com/envoy.extensions.filters.network.'
+                                 'http_connection_manager.v3.HttpConnectionManager',
+                        'stat_prefix': 'bench',
+                        'upgrade_configs': [{'upgrade_type': 'websocket'}],
+                        'route_config': {'virtual_hosts': [{
+                            'name': 'servers', 'domains': ['*'],
+                            'routes': [{'match': {'prefix': '/'}, 'route': {'cluster': 'servers', 'timeout': '0s'}}],
+                        }]},
+                        'http_filters': [{
+                            'name': 'envoy.filters.http.router',
+                            'typed_config': {'@type': 'type.googleapis.com/envoy.extensions.filters.http.router.v3.Router'},
+                        }],
+                    },
+                }]}],
+            }],
+            'clusters': [{
+                'name': 'servers',
+                'type': 'STATIC',
+                'lb_policy': 'ROUND_ROBIN',
+                'connect_timeout': '1s',
+                # The defaults (1024) would cap a connection-storm scenario
+                'circuit_breakers': {'thresholds': [{'max_connections': 1000000, 'max_pending_requests': 1000000,
+                                                     'max_requests': 1000000}]},
+                'load_assignment': {'cluster_name': 'servers', 'endpoints': [{'lb_endpoints': [
+                    {'endpoint': {'address': {'socket_address': {'address': '127.0.0.1', 'port_value': p}}}}
+                    for p in backends
+                ]}]},
+            }],
+        },
+    }
+
+
+# ---- measurements ---------------------------------------------------------
+
+def http_get(url: str, timeout: float = 2) -> Optional[str]:
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.read().decode()
+    except OSError:
+        return None
+
+
+def scrape(url: str) -> Dict[str, float]:
+    """Prometheus text -> {metric name: value summed over label sets}"""
+    values: Dict[str, float] = {}
+    for line in (http_get(url) or '').splitlines():
+        if not line or line.startswith('#'):
+            continue
+        name, _, value = line.rpartition(' ')
+        name = name.split('{', 1)[0]
+        try:
+            values[name] = values.get(name, 0.0) + float(value)
+        except ValueError:
+            continue
+    return values
+
+
+def wait_until(check, timeout: float, what: str) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if check():
+            return
+        time.sleep(0.2)
+    raise RuntimeError(f'timed out waiting for {what}')
+
+
+def lookup(report: Dict, path: str):
+    value = report
+    for part in path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[Dict]:
+    """Key metrics against the baseline; `regression` marks changes worse than tolerance"""
+    rows = []
+    paths = list(COMPARED_METRICS)
+    for name in sorted(report.get('components', {})):
+        paths += [(f'components.{name}.cpu_us_per_reply', False), (f'components.{name}.rss_mb_peak', False)]
+    for path, higher_is_better in paths:
+        current, previous = lookup(report, path), lookup(baseline, path)
+        if not isinstance(current, (int, float)) or not isinstance(previous, (int, float)):
+            continue
+        change = (current - previous) / previous if previous else 0.0
+        worse = -change if higher_is_better else change
+        rows.append({'metric': path, 'baseline': previous, 'current': current,
+                     'change': round(change, 4), 'regression': worse > tolerance and current != previous})
+    return rows
+
+
+def render_markdown(report: Dict) -> str:
+    lines = [f"# Benchmark: {report['scenario']['name']}", '',
+             f"{report['scenario'].get('description', '')}".strip(), '',
+             f"- started: {report['started_at']}, proxy: {report['proxy']}, servers: {report['scenario']['servers']}",
+             f"- measured {report['measured_seconds']}s after {report['scenario']['warmup']}s warmup", '',
+             '## Throughput', '',
+             '| metric | value |', '|--------|------:|']
+    lines += [f'| {k} | {v} |' for k, v in report['throughput'].items()]
+    lines += ['', '## Client', '', '| metric | value |', '|--------|------:|']
+    lines += [f'| {k} | {v} |' for k, v in report['client'].items()]
+    latency = report.get('latency') or {}
+    lines += ['', '## Latency (ms)', '', '| histogram | n | p50 | p90 | p99 | p99.9 | max |',
+              '|-----------|--:|----:|----:|----:|------:|----:|']
+    for name in ('rtt', 'connect', 'first_message'):
+        s = latency.get(name)
+        if s:
+            lines.append(f"| {name} | {s['count']} | {s['p50_ms']} | {s['p90_ms']} | {s['p99_ms']} "
+                         f"| {s['p99.9_ms']} | {s['max_ms']} |")
+    envoy = report.get('envoy')
+    if envoy:
+        lines += ['', '## Envoy stats', '', '| stat | total | rate avg/s | rate max/s | last | min | max |',
+                  '|------|------:|-----------:|-----------:|-----:|----:|----:|']
+        for name, s in envoy.items():
+            lines.append(f"| {name} | {s.get('total', '-')} | {s.get('rate_avg', '-')} | {s.get('rate_max', '-')} "
+                         f"| {s.get('last', '-')} | {s.get('min', '-')} | {s.get('max', '-')} |")
+    lines += ['', '## Resources', '', '| component | CPU avg % | CPU peak % | CPU s | CPU µs/reply | RSS peak MB |',
+              '|-----------|----------:|-----------:|------:|-------------:|------------:|']
+    for name, r in report['components'].items():
+        if r:
+            lines.append(f"| {name} | {r['cpu_percent_avg']} | {r['cpu_percent_peak']} | {r['cpu_seconds']} "
+                         f"| {r.get('cpu_us_per_reply', '-')} | {r['rss_mb_peak']} |")
+        else:
+            lines.append(f'| {name} | - | - | - | - | - |')
+    if report.get('comparison'):
+        lines += ['', f"## vs baseline ({report['baseline']})", '',
+                  '| metric | baseline | current | change |', '|--------|---------:|--------:|-------:|']
+        for row in report['comparison']:
+            flag = ' ⚠' if row['regression'] else ''
+            lines.append(f"| {row['metric']} | {row['baseline']} | {row['current']} | {row['change']:+.1%}{flag} |")
+    return '\n'.join(lines) + '\n'
+
+
+# ---- run ------------------------------------------------------------------
+
+def parse_env(pairs: List[str]) -> Dict[str, str]:
+    env = {}
+    for pair in pairs:
+        key, sep, value = pair.partition('=')
+        if not sep:
+            raise SystemExit(f'expected KEY=VALUE, got {pair!r}')
+        env[key] = value
+    return env
+
+
+def run(scenario: Dict, args: argparse.Namespace) -> Dict:
+    servers = scenario['servers']
+    base = args.base_port
+    proxy_port, client_health = base, base + 1
+    server_ports = [(base + 10 + i, base + 110 + i) for i in range(servers)]
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    proxy_kind = scenario.get('proxy', 'tcp')
+    if proxy_kind == 'envoy' and not shutil.which('envoy'):
+        print('envoy not found on PATH, using tcp_proxy.py instead', file=sys.stderr)
+        proxy_kind = 'tcp'
+
+    components: List[Component] = []
+    started_at = datetime.now().isoformat(timespec='seconds')
+    try:
+        for i, (port, health) in enumerate(server_ports):
+            components.append(Component(f'server-{i}', [sys.executable, 'server.py'], SERVER_APP, {
+                'SERVER_HOST': '127.0.0.1', 'SERVER_PORT': str(port), 'HEALTH_PORT': str(health),
+                'HOSTNAME': f'bench-server-{i}', 'POD_IP': f'127.0.0.{i + 1}',
+                **{k: str(v) for k, v in scenario.get('server_env', {}).items()},
+            }, args.output_dir))
+        for _, health in server_ports:
+            wait_until(lambda: http_get(f'http://127.0.0.1:{health}/health') is not None, 20, f'server on {health}')
+
+        if proxy_kind == 'envoy':
+            config_path = os.path.join(args.output_dir, 'envoy.json')
+            with open(config_path, 'w') as f:
+                json.dump(envoy_config(proxy_port, base + 2, [p for p, _ in server_ports]), f, indent=2)
+            components.append(Component('proxy', ['envoy', '-c', config_path, '--concurrency',
+                                                  str(scenario.get('proxy_concurrency', 2))],
+                                        ROOT, {}, args.output_dir))
+            wait_until(lambda: http_get(f'http://127.0.0.1:{base + 2}/ready') is not None, 20, 'envoy')
+            components.append(Component('envoy-stats', [sys.executable, ENVOY_STATS, '--interval', '1',
+                                                        '--target', f'127.0.0.1:{base + 2}', '--port', str(base + 3)],
+                                        ROOT, {}, args.output_dir))
+        else:
+            components.append(Component('proxy', [sys.executable, TCP_PROXY, '--listen', f'127.0.0.1:{proxy_port}']
+                                        + [a for p, _ in server_ports for a in ('--backend', f'127.0.0.1:{p}')],
+                                        ROOT, {}, args.output_dir))
+            time.sleep(0.5)
+
+        latency_path = os.path.join(args.output_dir, 'latency.json')
+        client = Component('client', [sys.executable, 'client.py'], CLIENT_APP, {
+            'CLIENT_MODE': 'load', 'CLIENT_ID': 'bench-client', 'HOSTNAME': 'bench-client',
+            'ENVOY_ENDPOINT': f'ws://127.0.0.1:{proxy_port}', 'HEALTH_PORT': str(client_health),
+            'LATENCY_DUMP_PATH': latency_path, 'LATENCY_REPORT_INTERVAL': '3600',
+            **{k: str(v) for k, v in scenario.get('client_env', {}).items()},
+        }, args.output_dir)
+        components.append(client)
+
+        def snapshot() -> Tuple[float, Dict[str, float], Dict[str, float]]:
+            """(time, client metrics, server metrics summed over all servers)"""
+            totals: Dict[str, float] = {}
+            for _, health in server_ports:
+                for name, value in scrape(f'http://127.0.0.1:{health}/metrics').items():
+                    totals[name] = totals.get(name, 0.0) + value
+            return time.monotonic(), scrape(f'http://127.0.0.1:{client_health}/metrics'), totals
+
+        def tick(until: float) -> None:
+            while time.monotonic() < until:
+                for component in components:
+                    component.sample()
+                dead = [c.name for c in components if not c.alive()]
+                if dead:
+                    raise RuntimeError(f"{', '.join(dead)} exited early, see {args.output_dir}")
+                time.sleep(min(1.0, max(0.0, until - time.monotonic())))
+
+        tick(time.monotonic() + scenario['warmup'])
+        first = snapshot()
+        tick(first[0] + scenario['duration'])
+        for component in components:
+            component.sample()
+        last = snapshot()
+        envoy_stats = None
+        if proxy_kind == 'envoy':
+            body = http_get(f'http://127.0.0.1:{base + 3}/summary?window={scenario["duration"]}')
+            envoy_stats = json.loads(body)['targets'].get(f'127.0.0.1:{base + 2}', {}).get('stats') if body else None
+    finally:
+        # Client first so it dumps its latency histograms, then proxy, then servers
+        for component in reversed(components):
+            component.stop(signal.SIGINT if component.name == 'client' else signal.SIGTERM)
+
+    elapsed = last[0] - first[0]
+
+    def rate(before: Dict[str, float], after: Dict[str, float], name: str) -> float:
+        return round((after.get(name, 0) - before.get(name, 0)) / elapsed, 1)
+
+    replies = last[1].get('ws_client_messages_received_total', 0) - first[1].get('ws_client_messages_received_total', 0)
+    resources = {c.name: c.resources(first[0]) for c in components}
+    for usage in resources.values():
+        if usage and replies:
+            # Efficiency that stays comparable when throughput changes between runs
+            usage['cpu_us_per_reply'] = round(usage['cpu_seconds'] * 1e6 / replies, 1)
+
+    latency = None
+    if os.path.exists(latency_path):
+        with open(latency_path) as f:
+            latency = json.load(f)['summary']
+
+    return {
+        'scenario': scenario,
+        'proxy': proxy_kind,
+        'started_at': started_at,
+        'measured_seconds': round(elapsed, 2),
+        'throughput': {
+            'client_replies_per_sec': rate(first[1], last[1], 'ws_client_messages_received_total'),
+            'client_sends_per_sec': rate(first[1], last[1], 'ws_client_messages_sent_total'),
+            'server_messages_per_sec': rate(first[2], last[2], 'ws_server_messages_received_total'),
+            'client_bytes_received_per_sec': rate(first[1], last[1], 'ws_client_message_bytes_received_total'),
+        },
+        'client': {
+            'connections_active': int(last[1].get('ws_client_connections_active', 0)),
+            'connections_opened': int(last[1].get('ws_client_connections_opened_total', 0)),
+            'connections_failed': int(last[1].get('ws_client_connections_failed_total', 0)),
+            'lost_replies': latency.get('lost_replies') if latency else None,
+        },
+        'latency': latency,
+        'envoy': envoy_stats,
+        'components': resources,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('scenario', help='scenario JSON file')
+    parser.add_argument('--servers', type=int, help='override the number of server processes')
+    parser.add_argument('--duration', type=float, help='override the measured seconds')
+    parser.add_argument('--warmup', type=float, help='override the warmup seconds')
+    parser.add_argument('--proxy', choices=('tcp', 'envoy'), help='override the proxy')
+    parser.add_argument('--client-env', action='append', default=[], metavar='KEY=VALUE')
+    parser.add_argument('--server-env', action='append', default=[], metavar='KEY=VALUE')
+    parser.add_argument('--base-port', type=int, default=19000)
+    parser.add_argument('--output-dir', help='default: bench/results/<scenario>-<timestamp>')
+    parser.add_argument('--baseline', help='report.json to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='allowed relative regression (default 0.10)')
+    parser.add_argument('--save-baseline', metavar='PATH', help='also copy report.json to PATH')
+    args = parser.parse_args()
+
+    with open(args.scenario) as f:
+        scenario = json.load(f)
+    scenario.setdefault('name', os.path.splitext(os.path.basename(args.scenario))[0])
+    scenario.setdefault('servers', 2)
+    scenario.setdefault('warmup', 5)
+    scenario.setdefault('duration', 30)
+    for key in ('servers', 'duration', 'warmup', 'proxy'):
+        if getattr(args, key) is not None:
+            scenario[key] = getattr(args, key)
+    scenario['client_env'] = {**scenario.get('client_env', {}), **parse_env(args.client_env)}
+    scenario['server_env'] = {**scenario.get('server_env', {}), **parse_env(args.server_env)}
+    args.output_dir = args.output_dir or os.path.join(
+        ROOT, 'bench', 'results', f"{scenario['name']}-{datetime.now():%Y%m%d-%H%M%S}")
+
+    report = run(scenario, args)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if lookup(baseline, 'scenario.name') != scenario['name']:
+            print(f"warning: baseline is from scenario {lookup(baseline, 'scenario.name')!r}", file=sys.stderr)
+        report['baseline'] = args.baseline
+        report['comparison'] = compare(report, baseline, args.tolerance)
+
+    markdown = render_markdown(report)
+    with open(os.path.join(args.output_dir, 'report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    with open(os.path.join(args.output_dir, 'report.md'), 'w') as f:
+        f.write(markdown)
+    if args.save_baseline:
+        shutil.copyfile(os.path.join(args.output_dir, 'report.json'), args.save_baseline)
+    print(markdown)
+    print(f'Results in {args.output_dir}')
+    if any(row['regression'] for row in report.get('comparison', [])):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
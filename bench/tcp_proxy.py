@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Stand-in for Envoy in local benchmarks: a round-robin TCP forwarder
+
+Each accepted connection is paired with a connection to the next backend and bytes
+are copied in both directions, so the WebSocket upgrade and frames pass through
+unchanged. Reading from one side pauses while the other side's write buffer is full,
+so a slow peer cannot make the proxy buffer without bound.
+
+Usage:
+    python bench/tcp_proxy.py --listen 127.0.0.1:19000 --backend 127.0.0.1:19010 [--backend ...]
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import signal
+from typing import Iterator, List, Optional, Tuple
+
+logger = logging.getLogger('tcp-proxy')
+
+
+def parse_address(value: str) -> Tuple[str, int]:
+    host, _, port = value.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+class Forwarder(asyncio.Protocol):
+    """One side of a proxied connection; writes everything it reads to its peer"""
+
+    def __init__(self, peer: Optional['Forwarder'] = None):
+        self.peer = peer
+        self.transport: Optional[asyncio.Transport] = None
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self.transport = transport
+
+    def data_received(self, data: bytes) -> None:
+        self.peer.transport.write(data)
+
+    def eof_received(self) -> bool:
+        if self.peer is not None and self.peer.transport.can_write_eof():
+            self.peer.transport.write_eof()
+            return True
+        return False
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        if self.peer is not None and self.peer.transport is not None:
+            self.peer.transport.close()
+
+    # The peer reads only as fast as this side can write
+    def pause_writing(self) -> None:
+        self.peer.transport.pause_reading()
+
+    def resume_writing(self) -> None:
+        self.peer.transport.resume_reading()
+
+
+class Downstream(Forwarder):
+    """Client side: connects to a backend before it starts reading"""
+
+    def __init__(self, backends: Iterator[Tuple[str, int]]):
+        super().__init__()
+        self.backends = backends
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        super().connection_made(transport)
+        transport.pause_reading()
+        asyncio.ensure_future(self.connect(next(self.backends)))
+
+    async def connect(self, backend: Tuple[str, int]) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            _, self.peer = await loop.create_connection(lambda: Forwarder(self), *backend)
+        except OSError as e:
+            logger.warning(f"Backend {backend[0]}:{backend[1]} unavailable: {e}")
+            self.transport.close()
+            return
+        if self.transport.is_closing():
+            self.peer.transport.close()
+            return
+        self.transport.resume_reading()
+
+
+async def serve(listen: Tuple[str, int], backends: List[Tuple[str, int]]) -> None:
+    loop = asyncio.get_running_loop()
+    rotation = itertools.cycle(backends)
+    server = await loop.create_server(lambda: Downstream(rotation), *listen, backlog=4096, reuse_address=True)
+    logger.info(f"Forwarding {listen[0]}:{listen[1]} -> {', '.join(f'{h}:{p}' for h, p in backends)}")
+    stop = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+    async with server:
+        await stop.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--listen', default='127.0.0.1:19000')
+    parser.add_argument('--backend', action='append', required=True, help='host:port, repeatable')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(serve(parse_address(args.listen), [parse_address(b) for b in args.backend]))
+
+
+if __name__ == '__main__':
+    main()
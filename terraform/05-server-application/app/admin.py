@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Minimal HTTP admin server running on the application's asyncio loop
+
+Shared between 05-server-application/app and 07-client-application/app; keep
+both copies identical.
+
+Serves /health, /metrics and any other registered route without a second
+thread: requests are parsed with asyncio streams, handlers run on the same
+loop as the WebSocket traffic, and every response closes the connection.
+"""
+
+import asyncio
+import inspect
+import json
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Union
+from urllib.parse import parse_qsl, urlsplit
+
+logger = logging.getLogger(__name__)
+
+REASONS = {
+    200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found',
+    405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large',
+    500: 'Internal Server Error', 503: 'Service Unavailable',
+}
+
+
+class Request:
+    __slots__ = ('method', 'path', 'query', 'headers', 'body')
+
+    def __init__(self, method: str, path: str, query: Dict[str, str],
+                 headers: Dict[str, str], body: bytes):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body or b'{}')
+
+
+class Response:
+    __slots__ = ('status', 'body', 'content_type')
+
+    def __init__(self, body: Union[bytes, str] = b'', status: int = 200,
+                 content_type: str = 'text/plain; charset=utf-8'):
+        self.status = status
+        self.body = body.encode() if isinstance(body, str) else body
+        self.content_type = content_type
+
+
+def json_response(data, status: int = 200) -> Response:
+    return Response(json.dumps(data), status, 'application/json')
+
+
+Handler = Callable[[Request], Union[Response, Awaitable[Response]]]
+
+
+class AdminServer:
+    """Route table plus an asyncio HTTP/1.1 listener"""
+
+    MAX_HEADER_BYTES = 16 * 1024
+    MAX_BODY_BYTES = 1024 * 1024
+    READ_TIMEOUT = 5.0
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.routes: Dict[Tuple[str, str], Handler] = {}
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    def route(self, method: str, path: str, handler: Handler) -> None:
+        self.routes[(method.upper(), path)] = handler
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(
+            self._handle, self.host, self.port, limit=self.MAX_HEADER_BYTES)
+        logger.info(f"Admin server started on http://{self.host}:{self.port} "
+                    f"({', '.join(sorted({p for _, p in self.routes}))})")
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        head = await reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = lines[0].split(' ', 2)
+        except ValueError:
+            return None
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        length = headers.get('content-length', '0') or '0'
+        if not (length.isascii() and length.isdigit()):
+            # Malformed (non-numeric or negative): 400, not 413
+            return None
+        length = int(length)
+        if length > self.MAX_BODY_BYTES:
+            raise ValueError('body too large')
+        body = await reader.readexactly(length) if length else b''
+        url = urlsplit(target)
+        return Request(method.upper(), url.path, dict(parse_qsl(url.query)), headers, body)
+
+    async def _dispatch(self, request: Request) -> Response:
+        handler = self.routes.get((request.method, request.path))
+        if handler is None:
+            if any(path == request.path for _, path in self.routes):
+                return Response('Method Not Allowed\n', 405)
+            return Response('Not Found\n', 404)
+        result = handler(request)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            try:
+                request = await asyncio.wait_for(self._read_request(reader), self.READ_TIMEOUT)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return
+            except ValueError:
+                response = Response('Payload Too Large\n', 413)
+            else:
+                if request is None:
+                    response = Response('Bad Request\n', 400)
+                else:
+                    try:
+                        response = await self._dispatch(request)
+                    except Exception as e:
+                        logger.error(f"Admin handler error on {request.path}: {e}")
+                        response = json_response({'error': str(e)}, 500)
+
+            head = (
+                f"HTTP/1.1 {response.status} {REASONS.get(response.status, 'OK')}\r\n"
+                f"Content-Type: {response.content_type}\r\n"
+                f"Content-Length: {len(response.body)}\r\n"
+                f"Connection: close\r\n\r\n"
+            )
+            writer.write(head.encode('latin-1') + response.body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
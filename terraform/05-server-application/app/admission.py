@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Per-connection and per-client message admission for the WebSocket server
+
+Envoy's local_ratelimit only limits upgrades; once a socket is open nothing stops a client
+from flooding it. Two token buckets are checked for every incoming message:
+- one per connection: MESSAGE_RATE_LIMIT messages/second, bursts of MESSAGE_BURST
+- one per X-Client-ID, shared by all of that client's connections in this process:
+  CLIENT_RATE_LIMIT messages/second, bursts of CLIENT_BURST
+
+The check runs in the connection's frame reader, on the first frame of each message:
+before UTF-8 decoding, before the message is queued and long before json.loads. When a
+bucket is empty, RATE_LIMIT_ACTION decides what happens:
+- drop: the message (with its continuation frames) is discarded without a reply
+- delay: reading from that socket pauses until a token is available, so TCP backpressure
+  slows the client down and nothing is dropped
+- close: the connection is closed with code 1008 (policy violation); later frames are
+  discarded uncounted while it closes
+
+A rate of 0 (the default for both) disables that bucket; with both disabled the stock
+protocol class is used and there is no per-message cost at all. With WORKERS=N each
+worker keeps its own client buckets.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+from functools import partial
+from typing import Any, Dict, List, Optional
+
+from websockets.frames import OP_CONT
+from websockets.server import WebSocketServerProtocol
+
+from metrics import Registry
+
+logger = logging.getLogger(__name__)
+
+ACTIONS = ('drop', 'delay', 'close')
+BUCKETS = ('connection', 'client')
+
+RATE_LIMIT_CLOSE_CODE = 1008
+
+
+class TokenBucket:
+    """`rate` tokens per second up to `burst`; starts full"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now: float) -> float:
+        """Available tokens at `now`"""
+        tokens = self.tokens + (now - self.updated) * self.rate
+        self.tokens = tokens if tokens < self.burst else self.burst
+        self.updated = now
+        return self.tokens
+
+    def wait(self, now: float) -> float:
+        """Seconds until one token is available (0 if it is already)"""
+        tokens = self.refill(now)
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+
+class AdmissionPolicy:
+    """Bucket settings, the shared per-client buckets and the outcome counters"""
+
+    def __init__(self, registry: Registry, action: Optional[str] = None):
+        self.connection_rate = float(os.getenv('MESSAGE_RATE_LIMIT', '0'))
+        self.connection_burst = float(os.getenv('MESSAGE_BURST', '0')) or max(1.0, self.connection_rate)
+        self.client_rate = float(os.getenv('CLIENT_RATE_LIMIT', '0'))
+        self.client_burst = float(os.getenv('CLIENT_BURST', '0')) or max(1.0, self.client_rate)
+        for name, rate, burst in (('MESSAGE_BURST', self.connection_rate, self.connection_burst),
+                                  ('CLIENT_BURST', self.client_rate, self.client_burst)):
+            if rate > 0 and burst < 1:
+                # A bucket capped below one token never admits a message
+                raise ValueError(f"{name} must be at least 1, got {burst:g}")
+        self.action = (action or os.getenv('RATE_LIMIT_ACTION', 'drop')).lower()
+        if self.action not in ACTIONS:
+            raise ValueError(f"Unknown RATE_LIMIT_ACTION: {self.action} (expected one of {', '.join(ACTIONS)})")
+        # client ID -> [bucket, open connections]; dropped with the client's last connection
+        self.clients: Dict[str, List[Any]] = {}
+
+        limited = registry.counter('rate_limited_messages_total',
+                                   'Messages over a token bucket, by action taken and bucket', ['action', 'bucket'])
+        self.limited = {(action, bucket): limited.labels(action, bucket) for action in ACTIONS for bucket in BUCKETS}
+        self.delay_seconds = registry.counter('rate_limit_delay_seconds_total',
+                                              'Time connections spent paused waiting for tokens')
+        registry.gauge('rate_limited_clients', 'Client IDs with a token bucket').set_function(lambda: len(self.clients))
+
+    @property
+    def enabled(self) -> bool:
+        return self.connection_rate > 0 or self.client_rate > 0
+
+    def server_kwargs(self) -> Dict[str, Any]:
+        """websockets.serve() arguments; empty when admission is disabled"""
+        if not self.enabled:
+            return {}
+        return {'create_protocol': partial(AdmissionProtocol, admission=self)}
+
+    def describe(self) -> str:
+        if not self.enabled:
+            return 'off'
+        parts = []
+        if self.connection_rate > 0:
+            parts.append(f"connection {self.connection_rate:g}/s burst {self.connection_burst:g}")
+        if self.client_rate > 0:
+            parts.append(f"client {self.client_rate:g}/s burst {self.client_burst:g}")
+        return f"{', '.join(parts)}, action={self.action}"
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'action': self.action,
+            'connection_rate': self.connection_rate,
+            'connection_burst': self.connection_burst,
+            'client_rate': self.client_rate,
+            'client_burst': self.client_burst,
+            'clients': len(self.clients),
+        }
+
+    # ---- buckets ------------------------------------------------------------
+
+    def connection_bucket(self, now: float) -> Optional[TokenBucket]:
+        if self.connection_rate <= 0:
+            return None
+        return TokenBucket(self.connection_rate, self.connection_burst, now)
+
+    def acquire_client(self, client_id: str, now: float) -> Optional[TokenBucket]:
+        if self.client_rate <= 0:
+            return None
+        entry = self.clients.get(client_id)
+        if entry is None:
+            entry = self.clients[client_id] = [TokenBucket(self.client_rate, self.client_burst, now), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def release_client(self, client_id: str) -> None:
+        entry = self.clients.get(client_id)
+        if entry is not None:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self.clients[client_id]
+
+
+class AdmissionProtocol(WebSocketServerProtocol):
+    """Server protocol that applies the AdmissionPolicy to each message as its first frame arrives"""
+
+    def __init__(self, *args, admission: AdmissionPolicy, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.admission = admission
+        self.client_id: Optional[str] = None
+        self.connection_tokens: Optional[TokenBucket] = None
+        self.client_tokens: Optional[TokenBucket] = None
+        self.discarding = False  # skipping the continuation frames of a dropped message
+        self.closing: Optional[asyncio.Task] = None  # close started by RATE_LIMIT_ACTION=close
+
+    def connection_open(self) -> None:
+        super().connection_open()
+        now = self.loop.time()
+        self.client_id = sys.intern(self.request_headers.get('X-Client-ID', 'unknown'))
+        self.connection_tokens = self.admission.connection_bucket(now)
+        self.client_tokens = self.admission.acquire_client(self.client_id, now)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        if self.client_tokens is not None:
+            self.client_tokens = None
+            self.admission.release_client(self.client_id)
+        super().connection_lost(exc)
+
+    def _wait(self, now: float):
+        """(seconds until both buckets have a token, the bucket that is short)"""
+        wait, short = 0.0, None
+        if self.connection_tokens is not None:
+            wait = self.connection_tokens.wait(now)
+            if wait:
+                short = 'connection'
+        if self.client_tokens is not None:
+            client_wait = self.client_tokens.wait(now)
+            if client_wait > wait:
+                wait, short = client_wait, 'client'
+        return wait, short
+
+    def _take(self) -> None:
+        if self.connection_tokens is not None:
+            self.connection_tokens.tokens -= 1
+        if self.client_tokens is not None:
+            self.client_tokens.tokens -= 1
+
+    async def read_data_frame(self, max_size: Optional[int]):
+        while True:
+            frame = await super().read_data_frame(max_size)
+            if frame is None:
+                return None
+            if self.closing is not None:
+                # Rate-limit close in progress: nothing else from this connection is processed
+                continue
+            if frame.opcode == OP_CONT:
+                if self.discarding:
+                    self.discarding = not frame.fin
+                    continue
+                return frame
+            if await self._admit():
+                return frame
+            # Dropped (or closing): skip the rest of this message
+            self.discarding = not frame.fin
+
+    async def _admit(self) -> bool:
+        """Whether the message that just started may be processed"""
+        admission = self.admission
+        wait, short = self._wait(self.loop.time())
+        if not wait:
+            self._take()
+            return True
+        action = admission.action
+        admission.limited[action, short].inc()
+        if action == 'delay':
+            # Not reading this socket meanwhile: the kernel buffers fill and the client blocks
+            while wait:
+                admission.delay_seconds.inc(wait)
+                await asyncio.sleep(wait)
+                wait, short = self._wait(self.loop.time())
+            self._take()
+            return True
+        if action == 'close' and self.open:
+            logger.warning("Closing %s: %s message rate limit exceeded", self.client_id, short)
+            self.closing = asyncio.create_task(self.close(RATE_LIMIT_CLOSE_CODE, 'message rate limit exceeded'))
+        return False
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Broadcast/fan-out to connected WebSocket clients
+
+1. A broadcast is encoded once per wire format (a JSON text frame and, for clients
+   on the binary subprotocol, a BROADCAST frame) and the same bytes are written to
+   every matching connection
+2. Connections whose socket is keeping up are written synchronously
+   (write_frame_sync): no per-client task, coroutine or re-serialization
+3. A connection whose transport buffer is above BROADCAST_HIGH_WATER gets a bounded
+   outbox and a writer task that drains it as the socket catches up
+4. When an outbox is full, BROADCAST_POLICY decides what happens:
+   - drop: the new broadcast is dropped for that connection
+   - coalesce: only the newest pending broadcast per topic is kept; if the outbox is
+     still full the oldest pending broadcast is dropped
+   - disconnect: the connection is closed with 1008 (slow consumer)
+
+Memory per slow client is therefore bounded by the transport high-water mark plus
+BROADCAST_OUTBOX_MESSAGES / BROADCAST_OUTBOX_BYTES.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Collection, Dict, Iterable, Iterator, Optional
+
+import websockets
+
+from framing import BINARY_SUBPROTOCOL, encode_broadcast
+from metrics import LATENCY_BUCKETS, Registry
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ('drop', 'coalesce', 'disconnect')
+RESULTS = ('sent', 'queued', 'coalesced', 'dropped', 'disconnected', 'closed')
+
+SLOW_CONSUMER_CLOSE_CODE = 1008
+
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+
+
+class BroadcastFrame:
+    """One broadcast, encoded once and shared by every recipient"""
+
+    __slots__ = ('topic', 'text', 'binary', 'size')
+
+    def __init__(self, topic: Optional[str], text: bytes, binary: bytes):
+        self.topic = topic
+        self.text = text
+        self.binary = binary
+        self.size = max(len(text), len(binary))
+
+
+class Outbox:
+    """Broadcasts waiting for one slow connection; only exists while it is backed up"""
+
+    __slots__ = ('frames', 'bytes', 'task', 'closing')
+
+    def __init__(self):
+        self.frames: deque = deque()
+        self.bytes = 0
+        self.task: Optional[asyncio.Task] = None
+        self.closing = False
+
+    def append(self, frame: BroadcastFrame) -> None:
+        self.frames.append(frame)
+        self.bytes += frame.size
+
+    def popleft(self) -> BroadcastFrame:
+        frame = self.frames.popleft()
+        self.bytes -= frame.size
+        return frame
+
+    def remove_topic(self, topic: Optional[str]) -> bool:
+        """Drop a pending broadcast with the same topic; returns True if one was replaced"""
+        for frame in self.frames:
+            if frame.topic == topic:
+                self.frames.remove(frame)
+                self.bytes -= frame.size
+                return True
+        return False
+
+
+def parse_broadcast_request(body: Any) -> Dict[str, Any]:
+    """Validate a POST /admin/broadcast body into broadcast() keyword arguments"""
+    if not isinstance(body, dict) or 'message' not in body:
+        raise ValueError('body must be a JSON object with a "message" field')
+    client_ids = body.get('client_ids')
+    if client_ids is not None and not (
+            isinstance(client_ids, list) and all(isinstance(c, str) for c in client_ids)):
+        raise ValueError('"client_ids" must be a list of strings')
+    for field in ('topic', 'client_prefix'):
+        if body.get(field) is not None and not isinstance(body[field], str):
+            raise ValueError(f'"{field}" must be a string')
+    return {
+        'message': body['message'],
+        'topic': body.get('topic'),
+        'client_ids': client_ids,
+        'client_prefix': body.get('client_prefix'),
+    }
+
+
+class Broadcaster:
+    """Fans messages out to a collection of connections with per-connection backpressure"""
+
+    def __init__(self, connections: Collection[websockets.WebSocketServerProtocol], encoder,
+                 registry: Registry, policy: Optional[str] = None):
+        self.connections = connections
+        self.encoder = encoder
+        self.policy = (policy or os.getenv('BROADCAST_POLICY', 'drop')).lower()
+        if self.policy not in POLICIES:
+            raise ValueError(f"Unknown BROADCAST_POLICY: {self.policy}")
+        self.high_water = int(os.getenv('BROADCAST_HIGH_WATER', str(64 * 1024)))
+        self.max_messages = int(os.getenv('BROADCAST_OUTBOX_MESSAGES', '64'))
+        self.max_bytes = int(os.getenv('BROADCAST_OUTBOX_BYTES', str(1024 * 1024)))
+        self.outboxes: Dict[websockets.WebSocketServerProtocol, Outbox] = {}
+
+        self.broadcasts = registry.counter('broadcasts_total', 'Broadcasts published')
+        deliveries = registry.counter('broadcast_deliveries_total', 'Per-connection broadcast outcomes', ['result'])
+        self.results = {result: deliveries.labels(result) for result in RESULTS}
+        self.fanout_seconds = registry.histogram('broadcast_fanout_seconds', 'Time to fan one broadcast out', LATENCY_BUCKETS)
+        registry.gauge('broadcast_outboxes', 'Connections with pending broadcasts').set_function(
+            lambda: len(self.outboxes))
+        registry.gauge('broadcast_outbox_bytes', 'Bytes of broadcasts pending in outboxes').set_function(
+            lambda: sum(outbox.bytes for outbox in self.outboxes.values()))
+
+    # ---- public API ---------------------------------------------------------
+
+    def broadcast(self, message: Any, topic: Optional[str] = None,
+                  client_ids: Optional[Iterable[str]] = None,
+                  client_prefix: Optional[str] = None) -> Dict[str, int]:
+        """Send `message` to all (or the matching) connections; returns per-result counts.
+
+        Must be called from the event loop that owns the connections.
+        """
+        started = time.perf_counter()
+        frame = self.encode(message, topic)
+        counts = dict.fromkeys(RESULTS, 0)
+        matched = 0
+        for websocket in self.select(client_ids, client_prefix):
+            matched += 1
+            counts[self._deliver(websocket, frame)] += 1
+        for result, count in counts.items():
+            if count:
+                self.results[result].inc(count)
+        self.broadcasts.inc()
+        self.fanout_seconds.observe(time.perf_counter() - started)
+        counts['matched'] = matched
+        return counts
+
+    def select(self, client_ids: Optional[Iterable[str]] = None,
+               client_prefix: Optional[str] = None) -> Iterator[websockets.WebSocketServerProtocol]:
+        """Connections matching the X-Client-ID filters (all when no filter is given)"""
+        wanted = set(client_ids) if client_ids is not None else None
+        # Copy: writes and closes below may change the live set
+        for websocket in list(self.connections):
+            if wanted is None and not client_prefix:
+                yield websocket
+                continue
+            client_id = websocket.request_headers.get('X-Client-ID', '')
+            if wanted is not None and client_id in wanted:
+                yield websocket
+            elif client_prefix and client_id.startswith(client_prefix):
+                yield websocket
+
+    def encode(self, message: Any, topic: Optional[str] = None) -> BroadcastFrame:
+        encoder = self.encoder
+        dumps = encoder.json.dumps
+        body = dumps(message)
+        text = (
+            '{"type":"broadcast","timestamp":"' + encoder.clock.isoformat()
+            + f'","pod_ip":{dumps(encoder.pod_ip)},"pod_name":{dumps(encoder.pod_name)}'
+            + f',"topic":{dumps(topic)},"message":' + body + '}'
+        )
+        return BroadcastFrame(topic, text.encode(), encode_broadcast(body.encode()))
+
+    def discard(self, websocket: websockets.WebSocketServerProtocol) -> None:
+        """Forget a closed connection's pending broadcasts"""
+        outbox = self.outboxes.pop(websocket, None)
+        if outbox is not None and outbox.task is not None:
+            outbox.task.cancel()
+
+    # ---- delivery -----------------------------------------------------------
+
+    @staticmethod
+    def _write(websocket: websockets.WebSocketServerProtocol, frame: BroadcastFrame) -> None:
+        if websocket.subprotocol == BINARY_SUBPROTOCOL:
+            websocket.write_frame_sync(True, OP_BINARY, frame.binary)
+        else:
+            websocket.write_frame_sync(True, OP_TEXT, frame.text)
+
+    def _deliver(self, websocket: websockets.WebSocketServerProtocol, frame: BroadcastFrame) -> str:
+        if not websocket.open:
+            return 'closed'
+        outbox = self.outboxes.get(websocket)
+        if outbox is None:
+            transport = websocket.transport
+            if transport.get_write_buffer_size() < self.high_water:
+                self._write(websocket, frame)
+                return 'sent'
+            outbox = self.outboxes[websocket] = Outbox()
+            outbox.task = asyncio.create_task(self._flush(websocket, outbox))
+        elif outbox.closing:
+            return 'disconnected'
+
+        result = 'queued'
+        if self.policy == 'coalesce' and outbox.remove_topic(frame.topic):
+            result = 'coalesced'
+        if len(outbox.frames) >= self.max_messages or outbox.bytes + frame.size > self.max_bytes:
+            if self.policy == 'disconnect':
+                self._disconnect(websocket, outbox)
+                return 'disconnected'
+            if self.policy == 'drop' or not outbox.frames:
+                return 'dropped'
+            # coalesce: make room by dropping the stalest pending broadcast
+            outbox.popleft()
+            self.results['dropped'].inc()
+        outbox.append(frame)
+        return result
+
+    async def _flush(self, websocket: websockets.WebSocketServerProtocol, outbox: Outbox) -> None:
+        """Write queued broadcasts as the connection's transport drains"""
+        try:
+            while outbox.frames and not outbox.closing:
+                # Returns once the transport is below the connection's write_limit
+                await websocket.drain()
+                if not websocket.open:
+                    break
+                self._write(websocket, outbox.popleft())
+        except (websockets.exceptions.ConnectionClosed, ConnectionError):
+            pass
+        finally:
+            if self.outboxes.get(websocket) is outbox and not outbox.closing:
+                del self.outboxes[websocket]
+
+    def _disconnect(self, websocket: websockets.WebSocketServerProtocol, outbox: Outbox) -> None:
+        client_id = websocket.request_headers.get('X-Client-ID', 'unknown')
+        logger.warning(f"Disconnecting slow consumer {client_id}: {len(outbox.frames)} broadcasts "
+                       f"({outbox.bytes} bytes) pending")
+        outbox.closing = True
+        outbox.frames.clear()
+        outbox.bytes = 0
+        if outbox.task is not None:
+            outbox.task.cancel()
+        asyncio.create_task(websocket.close(SLOW_CONSUMER_CLOSE_CODE, 'slow consumer'))
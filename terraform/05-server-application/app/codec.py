@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Response encoding for the WebSocket server
+
+The reply to every message has the same shape:
+    {"timestamp": ..., "pod_ip": ..., "pod_name": ..., "received_message": ..., "server_info": {...}}
+
+ResponseEncoder builds the constant parts once at startup and splices in the
+timestamp and the echoed payload, instead of building a dict and re-serializing
+everything per message:
+1. splice (default): the request is parsed (validating it and feeding logs), but the
+   reply embeds the original request text verbatim instead of re-encoding it
+2. echo-raw: the request is not parsed at all; JSON objects are echoed verbatim
+3. legacy: the original dict + stdlib json.dumps path, kept for benchmarking
+
+JSON_BACKEND selects json (stdlib), orjson or msgspec; auto picks the fastest installed.
+
+Connections that negotiated the binary subprotocol (see framing.py) bypass JSON
+entirely: encode_binary() echoes seq/sent_ns and the payload in a fixed header.
+"""
+
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Callable, Optional, Tuple, Type
+
+import framing
+
+logger = logging.getLogger(__name__)
+
+SERVER_INFO = {"version": "1.0.0", "type": "websocket-server"}
+
+RESPONSE_MODES = ('splice', 'echo-raw', 'legacy')
+
+
+class JsonBackend:
+    """loads/dumps pair with a common error type; dumps always returns str"""
+
+    def __init__(self, name: str, loads: Callable[[str], Any], dumps: Callable[[Any], str],
+                 decode_errors: Tuple[Type[Exception], ...]):
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+        self.DecodeError = decode_errors
+
+
+def _stdlib_backend() -> JsonBackend:
+    return JsonBackend('json', json.loads, json.dumps, (json.JSONDecodeError,))
+
+
+def _orjson_backend() -> JsonBackend:
+    import orjson
+    return JsonBackend('orjson', orjson.loads, lambda obj: orjson.dumps(obj).decode(),
+                       (orjson.JSONDecodeError,))
+
+
+def _msgspec_backend() -> JsonBackend:
+    import msgspec
+    encoder = msgspec.json.Encoder()
+    decoder = msgspec.json.Decoder()
+    return JsonBackend('msgspec', decoder.decode, lambda obj: encoder.encode(obj).decode(),
+                       (msgspec.DecodeError,))
+
+
+_BACKENDS = {'json': _stdlib_backend, 'orjson': _orjson_backend, 'msgspec': _msgspec_backend}
+
+
+def json_backend(name: Optional[str] = None) -> JsonBackend:
+    """Resolve JSON_BACKEND; unavailable optional backends fall back to the stdlib"""
+    name = (name or os.getenv('JSON_BACKEND', 'auto')).lower()
+    candidates = ['orjson', 'msgspec', 'json'] if name == 'auto' else [name, 'json']
+    for candidate in candidates:
+        factory = _BACKENDS.get(candidate)
+        if factory is None:
+            raise ValueError(f"Unknown JSON_BACKEND: {name}")
+        try:
+            return factory()
+        except ImportError:
+            if name != 'auto':
+                logger.warning(f"JSON backend {candidate} is not installed; falling back to json")
+    return _stdlib_backend()
+
+
+class UtcClock:
+    """ISO-8601 UTC timestamps with the date/time prefix formatted once per second"""
+
+    __slots__ = ('_second', '_prefix')
+
+    def __init__(self):
+        self._second = -1
+        self._prefix = ''
+
+    def isoformat(self) -> str:
+        now = time.time()
+        second = int(now)
+        if second != self._second:
+            self._second = second
+            self._prefix = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(second))
+        return f"{self._prefix}.{int((now - second) * 1e6):06d}Z"
+
+
+class ResponseEncoder:
+    """Builds reply frames from pre-encoded constant fragments"""
+
+    def __init__(self, pod_ip: str, pod_name: str, mode: Optional[str] = None,
+                 backend: Optional[JsonBackend] = None):
+        self.mode = (mode or os.getenv('RESPONSE_MODE', 'splice')).lower()
+        if self.mode not in RESPONSE_MODES:
+            raise ValueError(f"Unknown RESPONSE_MODE: {self.mode}")
+        self.json = backend or json_backend()
+        self.pod_ip = pod_ip
+        self.pod_name = pod_name
+        self.clock = UtcClock()
+
+        dumps = self.json.dumps
+        self._head = '{"timestamp":"'
+        self._middle = (
+            f'","pod_ip":{dumps(pod_ip)},"pod_name":{dumps(pod_name)},"received_message":'
+        )
+        self._tail = f',"server_info":{dumps(SERVER_INFO)}}}'
+
+    @property
+    def parses(self) -> bool:
+        """Whether requests must be decoded before replying"""
+        return self.mode != 'echo-raw'
+
+    def splice(self, received_json: str) -> str:
+        """Reply embedding an already valid JSON value verbatim"""
+        return self._head + self.clock.isoformat() + self._middle + received_json + self._tail
+
+    def encode_text(self, message: str) -> str:
+        """Reply for a plain-text (non-JSON) message, echoed as {"message": ...}"""
+        return self.splice('{"message":' + self.json.dumps(message) + '}')
+
+    def encode(self, message: str, data: Any) -> str:
+        """Reply for `message`; `data` is its decoded form (None when not parsed)"""
+        if self.mode == 'legacy':
+            return json.dumps({
+                "timestamp": datetime.utcnow().isoformat() + "Z",
+                "pod_ip": self.pod_ip,
+                "pod_name": self.pod_name,
+                "received_message": data if data is not None else {"message": message},
+                "server_info": SERVER_INFO
+            })
+        if data is not None:
+            # Already validated by the decoder: embed the original text as-is
+            return self.splice(message)
+        if self.mode == 'echo-raw' and message.startswith('{') and message.rstrip().endswith('}'):
+            # Trusted without parsing; malformed objects are echoed malformed
+            return self.splice(message)
+        return self.encode_text(message)
+
+    def encode_binary(self, frame: bytes) -> bytes:
+        """REPLY frame for a binary PING; raises framing.FramingError for anything else"""
+        seq, sent_ns, payload = framing.decode_ping(frame)
+        return framing.encode_reply(seq, sent_ns, time.time_ns() // 1000, payload)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+permessage-deflate policy shared by the WebSocket server and client
+
+WS_COMPRESSION picks what is offered (client) or accepted (server):
+- off: no compression extension
+- deflate: the websockets defaults (12-bit windows, memLevel 5, context takeover on
+  both sides); each connection keeps a compressor and a decompressor between messages
+- small: small windows (COMPRESSION_WINDOW_BITS, default 10) and no context takeover,
+  so zlib state only exists while a message is being compressed
+- threshold: like small, but messages under COMPRESSION_MIN_BYTES (default 512) are
+  sent uncompressed; short pings gain nothing from deflate
+
+COMPRESSION_MEM_LEVEL (default 4 for small/threshold, 5 for deflate) sets the zlib
+memLevel used for outgoing messages. Compression ratio, time spent in zlib and an
+estimate of the zlib memory held per connection are exported through the metrics
+Registry.
+
+This file is shared between the server and client applications: keep both copies identical.
+"""
+
+import os
+import time
+import weakref
+from typing import Any, Dict, List, Optional, Sequence
+
+from websockets.extensions.permessage_deflate import (
+    ClientPerMessageDeflateFactory,
+    PerMessageDeflate,
+    ServerPerMessageDeflateFactory,
+)
+from websockets.frames import CTRL_OPCODES, OP_CONT
+
+from metrics import Registry
+
+MODES = ('off', 'deflate', 'small', 'threshold')
+
+# zlib needs about 7 KiB per inflate stream on top of the window
+_INFLATE_OVERHEAD = 7 * 1024
+
+
+class CompressionStats:
+    """Process-wide compression counters plus the live extensions for memory estimates"""
+
+    def __init__(self, registry: Registry):
+        self.extensions: 'weakref.WeakSet[MeteredPerMessageDeflate]' = weakref.WeakSet()
+        messages = registry.counter('compression_messages_total', 'Data messages by compression outcome',
+                                    ['direction', 'result'])
+        raw = registry.counter('compression_raw_bytes_total', 'Message bytes before compression / after decompression',
+                               ['direction'])
+        wire = registry.counter('compression_wire_bytes_total', 'Message bytes as sent / received on the wire',
+                                ['direction'])
+        seconds = registry.counter('compression_seconds_total', 'Time spent in zlib', ['direction'])
+        self.compressed = messages.labels('send', 'compressed')
+        self.skipped = messages.labels('send', 'skipped')
+        self.decompressed = messages.labels('recv', 'compressed')
+        self.sent_raw, self.sent_wire = raw.labels('send'), wire.labels('send')
+        self.recv_raw, self.recv_wire = raw.labels('recv'), wire.labels('recv')
+        self.compress_seconds, self.decompress_seconds = seconds.labels('send'), seconds.labels('recv')
+        ratio = registry.gauge('compression_ratio', 'Wire bytes / raw bytes of compressed messages (worst process)',
+                               ['direction'], aggregate='max')
+        ratio.labels('send').set_function(lambda: self.ratio(self.sent_wire, self.sent_raw))
+        ratio.labels('recv').set_function(lambda: self.ratio(self.recv_wire, self.recv_raw))
+        registry.gauge('compression_connections', 'Open connections with permessage-deflate').set_function(
+            lambda: len(self.extensions))
+        registry.gauge('compression_context_bytes', 'Estimated zlib memory kept between messages').set_function(
+            self.context_bytes)
+
+    @staticmethod
+    def ratio(wire, raw) -> float:
+        return wire.value / raw.value if raw.value else 0.0
+
+    def context_bytes(self) -> int:
+        return sum(extension.context_bytes for extension in list(self.extensions))
+
+
+class MeteredPerMessageDeflate(PerMessageDeflate):
+    """PerMessageDeflate that records its cost and can leave small messages uncompressed"""
+
+    def __init__(self, negotiated: PerMessageDeflate, stats: CompressionStats, min_bytes: int = 0):
+        super().__init__(negotiated.remote_no_context_takeover, negotiated.local_no_context_takeover,
+                         negotiated.remote_max_window_bits, negotiated.local_max_window_bits,
+                         negotiated.compress_settings)
+        self.stats = stats
+        self.min_bytes = min_bytes
+        self.context_bytes = 0
+        if not self.local_no_context_takeover:
+            mem_level = self.compress_settings.get('memLevel', 8)
+            self.context_bytes += (1 << (self.local_max_window_bits + 2)) + (1 << (mem_level + 9))
+        if not self.remote_no_context_takeover:
+            self.context_bytes += (1 << self.remote_max_window_bits) + _INFLATE_OVERHEAD
+        stats.extensions.add(self)
+
+    def encode(self, frame):
+        if frame.opcode in CTRL_OPCODES:
+            return frame
+        stats = self.stats
+        # Only whole messages can be skipped: continuation frames follow the first frame's rsv1
+        if frame.opcode is not OP_CONT and frame.fin and len(frame.data) < self.min_bytes:
+            stats.skipped.inc()
+            return frame
+        started = time.perf_counter()
+        encoded = super().encode(frame)
+        stats.compress_seconds.inc(time.perf_counter() - started)
+        stats.compressed.inc()
+        stats.sent_raw.inc(len(frame.data))
+        stats.sent_wire.inc(len(encoded.data))
+        return encoded
+
+    def decode(self, frame, *, max_size: Optional[int] = None):
+        if frame.opcode in CTRL_OPCODES or not (frame.rsv1 or (frame.opcode is OP_CONT and self.decode_cont_data)):
+            return frame
+        stats = self.stats
+        started = time.perf_counter()
+        decoded = super().decode(frame, max_size=max_size)
+        stats.decompress_seconds.inc(time.perf_counter() - started)
+        stats.decompressed.inc()
+        stats.recv_wire.inc(len(frame.data))
+        stats.recv_raw.inc(len(decoded.data))
+        return decoded
+
+
+class _MeteredServerFactory(ServerPerMessageDeflateFactory):
+    def __init__(self, policy: 'CompressionPolicy', **kwargs):
+        super().__init__(**kwargs)
+        self.policy = policy
+
+    def process_request_params(self, params, accepted_extensions):
+        response, negotiated = super().process_request_params(params, accepted_extensions)
+        return response, self.policy.wrap(negotiated)
+
+
+class _MeteredClientFactory(ClientPerMessageDeflateFactory):
+    def __init__(self, policy: 'CompressionPolicy', **kwargs):
+        super().__init__(**kwargs)
+        self.policy = policy
+
+    def process_response_params(self, params, accepted_extensions):
+        return self.policy.wrap(super().process_response_params(params, accepted_extensions))
+
+
+class CompressionPolicy:
+    """WS_COMPRESSION settings turned into websockets extension factories"""
+
+    def __init__(self, mode: Optional[str] = None, registry: Optional[Registry] = None):
+        mode = (mode or os.getenv('WS_COMPRESSION', 'deflate')).lower()
+        if mode == 'none':
+            mode = 'off'
+        if mode not in MODES:
+            raise ValueError(f"Unknown WS_COMPRESSION: {mode} (expected one of {', '.join(MODES)})")
+        self.mode = mode
+        small = mode in ('small', 'threshold')
+        self.window_bits = int(os.getenv('COMPRESSION_WINDOW_BITS', '10' if small else '12'))
+        self.mem_level = int(os.getenv('COMPRESSION_MEM_LEVEL', '4' if small else '5'))
+        self.no_context_takeover = small
+        self.min_bytes = int(os.getenv('COMPRESSION_MIN_BYTES', '512')) if mode == 'threshold' else 0
+        self.stats = CompressionStats(registry or Registry())
+
+    def wrap(self, negotiated: PerMessageDeflate) -> MeteredPerMessageDeflate:
+        return MeteredPerMessageDeflate(negotiated, self.stats, self.min_bytes)
+
+    def _factory_kwargs(self) -> Dict[str, Any]:
+        return {
+            'server_no_context_takeover': self.no_context_takeover,
+            'client_no_context_takeover': self.no_context_takeover,
+            'server_max_window_bits': self.window_bits,
+            'client_max_window_bits': self.window_bits,
+            'compress_settings': {'memLevel': self.mem_level},
+        }
+
+    def server_kwargs(self) -> Dict[str, Any]:
+        """compression/extensions arguments for websockets.serve()"""
+        extensions: List[ServerPerMessageDeflateFactory] = []
+        if self.mode != 'off':
+            extensions.append(_MeteredServerFactory(self, **self._factory_kwargs()))
+        return {'compression': None, 'extensions': extensions}
+
+    def client_kwargs(self) -> Dict[str, Any]:
+        """compression/extensions arguments for websockets.connect()"""
+        extensions: Sequence[ClientPerMessageDeflateFactory] = []
+        if self.mode != 'off':
+            extensions = [_MeteredClientFactory(self, **self._factory_kwargs())]
+        return {'compression': None, 'extensions': extensions}
+
+    def describe(self) -> str:
+        if self.mode == 'off':
+            return 'off'
+        takeover = 'no context takeover' if self.no_context_takeover else 'context takeover'
+        threshold = f", min {self.min_bytes} bytes" if self.min_bytes else ''
+        return f"{self.mode} ({self.window_bits}-bit window, memLevel {self.mem_level}, {takeover}{threshold})"
+
+    def report(self) -> Dict[str, Any]:
+        stats = self.stats
+        return {
+            'mode': self.mode,
+            'connections': len(stats.extensions),
+            'context_bytes': stats.context_bytes(),
+            'send_ratio': round(stats.ratio(stats.sent_wire, stats.sent_raw), 3),
+            'recv_ratio': round(stats.ratio(stats.recv_wire, stats.recv_raw), 3),
+        }
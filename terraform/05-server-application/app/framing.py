@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Compact binary framing for client/server messages
+
+Shared between 05-server-application/app and 07-client-application/app; keep
+both copies identical.
+
+Negotiated with the Sec-WebSocket-Protocol header (BINARY_SUBPROTOCOL); clients
+that do not offer it keep using JSON text frames. Per-connection identity is
+exchanged once at handshake instead of on every message:
+- client -> server: X-Client-ID, X-Pod-Name, X-Pod-IP, X-Connection-ID request headers
+- server -> client: X-Server-Pod-IP, X-Server-Pod-Name response headers
+
+Binary frames are a fixed network-order header followed by an opaque payload:
+    PING       type:u8 seq:u32 sent_ns:u64                    payload
+    REPLY      type:u8 seq:u32 sent_ns:u64 server_time_us:u64 echoed payload
+    BROADCAST  type:u8                                        payload
+"""
+
+import struct
+from typing import Tuple
+
+BINARY_SUBPROTOCOL = 'envoy-poc.bin.v1'
+
+PING = 1
+REPLY = 2
+BROADCAST = 3
+
+_PING = struct.Struct('!BIQ')
+_REPLY = struct.Struct('!BIQQ')
+_TYPE = struct.Struct('!B')
+
+SEQ_MASK = 0xFFFFFFFF
+
+
+class FramingError(ValueError):
+    """Frame too short or of an unexpected type"""
+
+
+def frame_type(frame: bytes) -> int:
+    if not frame:
+        raise FramingError('empty frame')
+    return frame[0]
+
+
+def encode_ping(seq: int, sent_ns: int, payload: bytes = b'') -> bytes:
+    return _PING.pack(PING, seq & SEQ_MASK, sent_ns) + payload
+
+
+def decode_ping(frame: bytes) -> Tuple[int, int, bytes]:
+    """Returns (seq, sent_ns, payload)"""
+    if len(frame) < _PING.size or frame[0] != PING:
+        raise FramingError('not a PING frame')
+    _, seq, sent_ns = _PING.unpack_from(frame)
+    return seq, sent_ns, frame[_PING.size:]
+
+
+def encode_reply(seq: int, sent_ns: int, server_time_us: int, payload: bytes = b'') -> bytes:
+    return _REPLY.pack(REPLY, seq & SEQ_MASK, sent_ns, server_time_us) + payload
+
+
+def decode_reply(frame: bytes) -> Tuple[int, int, int, bytes]:
+    """Returns (seq, sent_ns, server_time_us, payload)"""
+    if len(frame) < _REPLY.size or frame[0] != REPLY:
+        raise FramingError('not a REPLY frame')
+    _, seq, sent_ns, server_time_us = _REPLY.unpack_from(frame)
+    return seq, sent_ns, server_time_us, frame[_REPLY.size:]
+
+
+def encode_broadcast(payload: bytes) -> bytes:
+    return _TYPE.pack(BROADCAST) + payload
+
+
+def decode_broadcast(frame: bytes) -> bytes:
+    if not frame or frame[0] != BROADCAST:
+        raise FramingError('not a BROADCAST frame')
+    return frame[1:]
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Per-connection memory settings and accounting for the WebSocket server
+
+MEMORY_PROFILE picks the websockets.serve() limits that decide what an open
+connection costs:
+- default: 1 MiB messages, 32 queued messages, 64 KiB read/write buffers and
+  permessage-deflate (each deflate context keeps its own zlib window, about 300 KiB)
+- idle: for many mostly-idle sockets; 64 KiB messages, 4 queued messages, 4 KiB
+  read/write buffers and no compression
+
+Individual limits can be overridden with WS_MAX_SIZE, WS_MAX_QUEUE, WS_READ_LIMIT,
+WS_WRITE_LIMIT, WS_COMPRESSION (a compression.py mode), WS_PING_INTERVAL (0 disables
+keepalive pings) and WS_PING_TIMEOUT.
+
+Each open connection is tracked by a ConnectionRecord (__slots__, no per-connection
+formatted strings); read buffers, queues and broadcast outboxes only grow while data
+is actually pending.
+"""
+
+import os
+import resource
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+PROFILES: Dict[str, Dict[str, Any]] = {
+    'default': {
+        'max_size': 1024 * 1024,
+        'max_queue': 32,
+        'read_limit': 64 * 1024,
+        'write_limit': 64 * 1024,
+        'compression': 'deflate',
+        'ping_interval': 30.0,
+        'ping_timeout': 10.0,
+    },
+    'idle': {
+        'max_size': 64 * 1024,
+        'max_queue': 4,
+        'read_limit': 4 * 1024,
+        'write_limit': 4 * 1024,
+        'compression': 'off',
+        'ping_interval': 30.0,
+        'ping_timeout': 10.0,
+    },
+}
+
+_OVERRIDES = (
+    ('WS_MAX_SIZE', 'max_size', int),
+    ('WS_MAX_QUEUE', 'max_queue', int),
+    ('WS_READ_LIMIT', 'read_limit', int),
+    ('WS_WRITE_LIMIT', 'write_limit', int),
+    ('WS_PING_INTERVAL', 'ping_interval', float),
+    ('WS_PING_TIMEOUT', 'ping_timeout', float),
+)
+
+
+class MemoryProfile:
+    """websockets.serve() limits for one MEMORY_PROFILE plus env overrides"""
+
+    __slots__ = ('name', 'settings')
+
+    def __init__(self, name: str, settings: Dict[str, Any]):
+        self.name = name
+        self.settings = settings
+
+    def serve_kwargs(self) -> Dict[str, Any]:
+        """Everything but compression, which compression.CompressionPolicy turns into extensions"""
+        kwargs = dict(self.settings)
+        del kwargs['compression']
+        if not kwargs['ping_interval']:
+            kwargs['ping_interval'] = None
+        return kwargs
+
+    def describe(self) -> str:
+        s = self.settings
+        return (f"{self.name} (max_size={s['max_size']}, max_queue={s['max_queue']}, "
+                f"read_limit={s['read_limit']}, write_limit={s['write_limit']}, "
+                f"compression={s['compression']}, ping_interval={s['ping_interval'] or 'off'})")
+
+
+def memory_profile_from_env() -> MemoryProfile:
+    name = os.getenv('MEMORY_PROFILE', 'default').lower()
+    if name not in PROFILES:
+        raise ValueError(f"Unknown MEMORY_PROFILE: {name} (expected one of {', '.join(PROFILES)})")
+    settings = dict(PROFILES[name])
+    for env, key, cast in _OVERRIDES:
+        if os.getenv(env):
+            settings[key] = cast(os.environ[env])
+    if os.getenv('WS_COMPRESSION'):
+        # Validated by compression.CompressionPolicy
+        settings['compression'] = os.environ['WS_COMPRESSION'].lower()
+    return MemoryProfile(name, settings)
+
+
+class ConnectionRecord:
+    """What the server keeps about one open connection besides the protocol object"""
+
+    __slots__ = ('client_id', 'connected_at', 'messages', 'busy', 'trace_id')
+
+    def __init__(self, client_id: str):
+        # Many connections share a client ID: keep one copy of the string
+        self.client_id = sys.intern(client_id)
+        self.connected_at = time.monotonic()
+        self.messages = 0
+        self.busy = False  # a message is being processed (the reply is not sent yet)
+        self.trace_id = 0  # connection number in the traffic trace (traffic.py), when capturing
+
+
+def describe_peer(websocket) -> str:
+    """'ip:port' of a connection, formatted only when it is actually logged"""
+    address = websocket.remote_address
+    return f"{address[0]}:{address[1]}" if address else 'unknown'
+
+
+def process_rss_bytes(pid: Optional[int] = None) -> int:
+    """Current RSS of a process (this one by default); peak RSS where /proc is unavailable"""
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        if pid is not None:
+            return 0
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def buffer_sizes(websocket) -> Dict[str, int]:
+    """Bytes and messages currently held for one connection by websockets/asyncio"""
+    transport = websocket.transport
+    reader = getattr(websocket, 'reader', None)
+    return {
+        'read_buffer_bytes': len(getattr(reader, '_buffer', b'')),
+        'recv_queue_messages': len(websocket.messages),
+        'write_buffer_bytes': transport.get_write_buffer_size() if transport is not None else 0,
+    }
+
+
+def connection_report(connections: Mapping[Any, ConnectionRecord], baseline_rss: int,
+                      profile: MemoryProfile, outbox_bytes: int = 0, top: int = 10) -> Dict[str, Any]:
+    """Body of GET /debug/connections"""
+    rss = process_rss_bytes()
+    count = len(connections)
+    totals = {'read_buffer_bytes': 0, 'recv_queue_messages': 0, 'write_buffer_bytes': 0}
+    compressed = 0
+    busiest: List[Dict[str, Any]] = []
+    now = time.monotonic()
+    for websocket, record in list(connections.items()):
+        sizes = buffer_sizes(websocket)
+        for key, value in sizes.items():
+            totals[key] += value
+        if websocket.extensions:
+            compressed += 1
+        if top:
+            busiest.append({'client_id': record.client_id, 'peer': describe_peer(websocket),
+                            'age_seconds': round(now - record.connected_at, 1),
+                            'messages': record.messages, **sizes})
+    busiest.sort(key=lambda c: (c['write_buffer_bytes'] + c['read_buffer_bytes'], c['messages']), reverse=True)
+    return {
+        'profile': profile.name,
+        'settings': profile.settings,
+        'connections': count,
+        'compressed_connections': compressed,
+        'rss_bytes': rss,
+        'baseline_rss_bytes': baseline_rss,
+        # Growth since the server started listening, spread over the open connections
+        'bytes_per_connection': round((rss - baseline_rss) / count) if count else None,
+        'buffers': {**totals, 'broadcast_outbox_bytes': outbox_bytes},
+        'top': busiest[:top],
+    }
+
+
+def worker_report(workers: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Per-worker RSS and connections for the WORKERS=N supervisor"""
+    rows = []
+    for w in workers:
+        rss = process_rss_bytes(w['pid']) if w.get('pid') else 0
+        rows.append({'index': w['index'], 'pid': w['pid'], 'connections': int(w['connected_clients']),
+                     'rss_bytes': rss})
+    connections = sum(r['connections'] for r in rows)
+    rss_total = sum(r['rss_bytes'] for r in rows)
+    return {
+        'connections': connections,
+        'rss_bytes': rss_total,
+        'bytes_per_connection': round(rss_total / connections) if connections else None,
+        'workers': rows,
+    }
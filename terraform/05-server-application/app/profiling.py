@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+On-demand profiling and event-loop diagnostics on the admin (health) port
+
+- GET /debug/profile?seconds=10&hz=100: sample the event-loop thread's stack for the window
+  and return collapsed stacks (`frame;frame;frame count` lines, the input format of
+  flamegraph.pl, speedscope and inferno); `format=top` returns the hottest functions as JSON.
+  POST /debug/profile/start?hz=100 and POST /debug/profile/stop do the same for an open-ended
+  window (capped at PROFILE_MAX_SECONDS)
+- GET/POST /debug/slow-callbacks?threshold_ms=100 (enabled=false to turn off): asyncio debug
+  mode with slow-callback reporting; reports are logged, counted in `slow_callbacks_total` and
+  the most recent ones are returned by GET
+- GET /debug/tasks: live asyncio tasks grouped by coroutine (the innermost application
+  coroutine each task is parked in, e.g. client_handler or handle_messages)
+
+Nothing runs while these are off: the sampler is a thread that only exists during a profile,
+and asyncio debug mode is only on between enabling and disabling it. With worker processes the
+supervisor forwards /debug/* to one worker (`?worker=N`, default 0).
+
+This file is shared between the server and client applications: keep both copies identical.
+"""
+
+import asyncio
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Counter, Deque, Dict, Optional, Tuple
+
+from admin import AdminServer, Request, Response, json_response
+from metrics import Registry
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEBUG_ROUTES = (
+    ('GET', '/debug/profile'),
+    ('POST', '/debug/profile/start'),
+    ('POST', '/debug/profile/stop'),
+    ('GET', '/debug/slow-callbacks'),
+    ('POST', '/debug/slow-callbacks'),
+    ('GET', '/debug/tasks'),
+)
+
+MAX_HZ = 1000
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '300'))
+SLOW_CALLBACKS_KEPT = 50
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack from a background thread at `hz` samples/second"""
+
+    def __init__(self, thread_id: int, hz: float, max_seconds: float):
+        self.thread_id = thread_id
+        self.interval = 1.0 / hz
+        self.max_seconds = max_seconds
+        self.stacks: Counter[Tuple[str, ...]] = collections.Counter()
+        self.samples = 0
+        self.started = time.monotonic()
+        self.stopped: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def _run(self) -> None:
+        labels: Dict[Any, str] = {}  # code object -> "file.py:qualname"
+        deadline = self.started + self.max_seconds
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = (f"{os.path.basename(code.co_filename)}:"
+                                            f"{getattr(code, 'co_qualname', code.co_name)}")
+                stack.append(label)
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[tuple(stack)] += 1
+            self.samples += 1
+        self.stopped = time.monotonic()
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return ''.join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top(self, limit: int = 30) -> Dict[str, Any]:
+        """Functions by samples spent in them (self) and under them (total)"""
+        own: Counter[str] = collections.Counter()
+        total: Counter[str] = collections.Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for label in set(stack):
+                total[label] += count
+        samples = self.samples or 1
+        return {
+            'samples': self.samples,
+            'seconds': round((self.stopped or time.monotonic()) - self.started, 3),
+            'self': [{'function': f, 'samples': n, 'percent': round(100 * n / samples, 1)}
+                     for f, n in own.most_common(limit)],
+            'total': [{'function': f, 'samples': n, 'percent': round(100 * n / samples, 1)}
+                      for f, n in total.most_common(limit)],
+        }
+
+
+class SlowCallbackMonitor(logging.Filter):
+    """Counts and keeps asyncio's 'Executing <handle> took N seconds' debug-mode reports"""
+
+    def __init__(self, registry: Registry):
+        super().__init__()
+        self.enabled = False
+        self.threshold = 0.1
+        self.recent: Deque[Dict[str, Any]] = collections.deque(maxlen=SLOW_CALLBACKS_KEPT)
+        self.count = registry.counter('slow_callbacks_total',
+                                      'Event-loop callbacks slower than the slow-callback threshold (while enabled)')
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if isinstance(record.msg, str) and record.msg.startswith('Executing') and len(record.args or ()) == 2:
+            self.count.inc()
+            callback, seconds = record.args
+            self.recent.append({'at': round(record.created, 3), 'seconds': round(seconds, 4),
+                                'callback': str(callback)[:500]})
+        return True
+
+    def enable(self, threshold: float) -> None:
+        loop = asyncio.get_running_loop()
+        loop.slow_callback_duration = threshold
+        loop.set_debug(True)
+        self.threshold = threshold
+        if not self.enabled:
+            logging.getLogger('asyncio').addFilter(self)
+            self.enabled = True
+        logger.warning(f"asyncio debug mode on: reporting callbacks slower than {threshold * 1000:g}ms")
+
+    def disable(self) -> None:
+        asyncio.get_running_loop().set_debug(False)
+        if self.enabled:
+            logging.getLogger('asyncio').removeFilter(self)
+            self.enabled = False
+        logger.info("asyncio debug mode off")
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'threshold_ms': round(self.threshold * 1000, 3),
+            'reported': int(self.count.value),
+            'recent': list(self.recent),
+        }
+
+
+def _awaited(coro) -> Any:
+    """What a coroutine / generator / async generator is currently suspended on"""
+    for attribute in ('cr_await', 'gi_yieldfrom', 'ag_await'):
+        inner = getattr(coro, attribute, None)
+        if inner is not None:
+            return inner
+    return None
+
+
+def _code(coro) -> Any:
+    for attribute in ('cr_code', 'gi_code', 'ag_code'):
+        code = getattr(coro, attribute, None)
+        if code is not None:
+            return code
+    return None
+
+
+def task_report() -> Dict[str, Any]:
+    """Live tasks of the running loop, by coroutine"""
+    by_coroutine: Counter[str] = collections.Counter()
+    top_level: Counter[str] = collections.Counter()
+    tasks = asyncio.all_tasks()
+    for task in tasks:
+        coro = task.get_coro()
+        top = getattr(coro, '__qualname__', type(coro).__name__)
+        top_level[top] += 1
+        # Innermost coroutine defined in the application (library wrappers such as the
+        # websockets connection handler are skipped), else the task's own coroutine
+        name = top
+        while coro is not None:
+            code = _code(coro)
+            if code is not None and code.co_filename.startswith(APP_DIR):
+                name = getattr(coro, '__qualname__', name)
+            coro = _awaited(coro)
+        by_coroutine[name] += 1
+    return {
+        'total': len(tasks),
+        'by_coroutine': dict(by_coroutine.most_common()),
+        'top_level': dict(top_level.most_common()),
+    }
+
+
+class DebugEndpoints:
+    """/debug/profile, /debug/slow-callbacks and /debug/tasks for this process's event loop"""
+
+    def __init__(self, registry: Registry):
+        self.profiler: Optional[SamplingProfiler] = None
+        self.slow_callbacks = SlowCallbackMonitor(registry)
+        # The admin server runs on the event loop, and so does the code worth profiling
+        self.loop_thread = threading.get_ident()
+        self.routes = {
+            ('GET', '/debug/profile'): self.http_profile,
+            ('POST', '/debug/profile/start'): self.http_profile_start,
+            ('POST', '/debug/profile/stop'): self.http_profile_stop,
+            ('GET', '/debug/slow-callbacks'): self.http_slow_callbacks,
+            ('POST', '/debug/slow-callbacks'): self.http_slow_callbacks_toggle,
+            ('GET', '/debug/tasks'): self.http_tasks,
+        }
+
+    def attach(self, admin: AdminServer) -> None:
+        for (method, path), handler in self.routes.items():
+            admin.route(method, path, handler)
+
+    async def call(self, payload: Dict[str, Any]) -> Tuple[int, bytes, str]:
+        """A request forwarded from the supervisor (WorkerChannel 'debug' call)"""
+        handler = self.routes.get((payload['method'], payload['path']))
+        if handler is None:
+            return 404, b'Not Found\n', 'text/plain; charset=utf-8'
+        response = handler(Request(payload['method'], payload['path'], payload['query'], {}, b''))
+        if asyncio.iscoroutine(response):
+            response = await response
+        return response.status, response.body, response.content_type
+
+    # ---- profiler -------------------------------------------------------------
+
+    def _start(self, request: Request, max_seconds: float) -> Optional[Response]:
+        if self.profiler is not None and self.profiler.running:
+            return json_response({'error': 'a profile is already running'}, 409)
+        try:
+            hz = float(request.query.get('hz', '100'))
+        except ValueError:
+            return json_response({'error': 'hz must be a number'}, 400)
+        if not 0 < hz <= MAX_HZ:
+            return json_response({'error': f'hz must be in (0, {MAX_HZ}]'}, 400)
+        self.profiler = SamplingProfiler(self.loop_thread, hz, max_seconds)
+        self.profiler.start()
+        logger.info(f"Profiling the event loop at {hz:g} Hz for up to {max_seconds:g}s")
+        return None
+
+    def _result(self, request: Request) -> Response:
+        profiler = self.profiler
+        profiler.stop()
+        logger.info(f"Profile finished: {profiler.samples} samples")
+        if request.query.get('format', 'collapsed') == 'top':
+            return json_response(profiler.top())
+        return Response(profiler.collapsed())
+
+    async def http_profile(self, request: Request) -> Response:
+        """Profile for ?seconds=N (default 10) and return the result"""
+        try:
+            seconds = float(request.query.get('seconds', '10'))
+        except ValueError:
+            return json_response({'error': 'seconds must be a number'}, 400)
+        if not 0 < seconds <= PROFILE_MAX_SECONDS:
+            return json_response({'error': f'seconds must be in (0, {PROFILE_MAX_SECONDS:g}]'}, 400)
+        error = self._start(request, seconds)
+        if error is not None:
+            return error
+        profiler = self.profiler
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            if profiler.running:
+                profiler.stop()
+        return self._result(request)
+
+    def http_profile_start(self, request: Request) -> Response:
+        error = self._start(request, PROFILE_MAX_SECONDS)
+        if error is not None:
+            return error
+        return json_response({'status': 'started', 'max_seconds': PROFILE_MAX_SECONDS}, 202)
+
+    def http_profile_stop(self, request: Request) -> Response:
+        if self.profiler is None:
+            return json_response({'error': 'no profile was started'}, 409)
+        return self._result(request)
+
+    # ---- slow callbacks and tasks ---------------------------------------------
+
+    def http_slow_callbacks(self, request: Request) -> Response:
+        return json_response(self.slow_callbacks.report())
+
+    def http_slow_callbacks_toggle(self, request: Request) -> Response:
+        if request.query.get('enabled', 'true').lower() in ('0', 'false', 'no', 'off'):
+            self.slow_callbacks.disable()
+        else:
+            try:
+                threshold = float(request.query.get('threshold_ms', '100')) / 1000
+            except ValueError:
+                return json_response({'error': 'threshold_ms must be a number'}, 400)
+            self.slow_callbacks.enable(threshold)
+        return json_response(self.slow_callbacks.report())
+
+    def http_tasks(self, request: Request) -> Response:
+        return json_response(task_report())
+
+
+def forward_debug_routes(admin: AdminServer, supervisor) -> None:
+    """Supervisor side: serve /debug/* by forwarding to worker ?worker=N (default 0)"""
+    def forward(method: str, path: str):
+        async def handler(request: Request) -> Response:
+            try:
+                index = int(request.query.get('worker', '0'))
+            except ValueError:
+                return json_response({'error': 'worker must be an integer'}, 400)
+            if not 0 <= index < len(supervisor.workers):
+                return json_response({'error': f'worker must be in [0, {len(supervisor.workers)})'}, 400)
+            try:
+                seconds = float(request.query.get('seconds', '0'))
+            except ValueError:
+                seconds = 0.0
+            try:
+                result = await supervisor.call(supervisor.workers[index], 'debug',
+                                               {'method': method, 'path': path, 'query': request.query},
+                                               timeout=seconds + 15)
+            except (ConnectionError, asyncio.TimeoutError) as e:
+                return json_response({'error': f'worker {index} did not answer: {e!r}'}, 503)
+            if result is None:
+                return json_response({'error': f'worker {index} failed to handle {path}'}, 500)
+            status, body, content_type = result
+            return Response(body, status, content_type)
+        return handler
+
+    for method, path in DEBUG_ROUTES:
+        admin.route(method, path, forward(method, path))
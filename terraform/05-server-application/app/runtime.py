@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Event-loop backend selection and startup timing shared by the server and client
+
+LOOP=uvloop (default) runs the application on uvloop when it is installed and falls back
+to the standard asyncio loop (with a warning) when it is not; LOOP=asyncio always uses the
+standard loop.
+
+`startup` records when the process reached each startup phase (imports done, health
+server bound, first connection accepted, ...), in seconds since the process started.
+Process start is read from /proc, so interpreter start-up and imports are included.
+
+This file is shared between the server and client applications: keep both copies identical.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Coroutine, Dict, Optional
+
+from metrics import Registry
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('asyncio', 'uvloop')
+
+
+def _process_started_monotonic() -> float:
+    """time.monotonic() value at process start (the import time of this module without /proc)"""
+    try:
+        with open('/proc/self/stat') as f:
+            # Fields after the ")" that ends the command name; starttime is field 22 overall
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        age = uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+        return time.monotonic() - max(0.0, age)
+    except (OSError, ValueError, IndexError):
+        return time.monotonic()
+
+
+PROCESS_STARTED = _process_started_monotonic()
+
+
+class StartupTimer:
+    """Seconds from process start to each named phase; only the first mark of a phase counts"""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self.gauge = None
+
+    def mark(self, phase: str) -> None:
+        if phase in self.phases:
+            return
+        elapsed = round(time.monotonic() - PROCESS_STARTED, 4)
+        self.phases[phase] = elapsed
+        if self.gauge is not None:
+            self.gauge.labels(phase).set(elapsed)
+        logger.info("Startup: %s after %.3fs", phase, elapsed)
+
+    def attach_metrics(self, registry: Registry) -> None:
+        self.gauge = registry.gauge('startup_seconds', 'Seconds from process start to each startup phase',
+                                    ['phase'], aggregate='max')
+        for phase, elapsed in self.phases.items():
+            self.gauge.labels(phase).set(elapsed)
+
+
+startup = StartupTimer()
+
+
+def select_loop(backend: Optional[str] = None) -> str:
+    """Install the LOOP backend's event loop policy; returns the backend actually used"""
+    backend = (backend or os.getenv('LOOP', 'uvloop')).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown LOOP: {backend} (expected one of {', '.join(BACKENDS)})")
+    if backend == 'uvloop':
+        try:
+            import uvloop
+        except ImportError:
+            logger.warning("LOOP=uvloop but uvloop is not installed; using the asyncio event loop")
+            return 'asyncio'
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    else:
+        asyncio.set_event_loop_policy(None)
+    return backend
+
+
+def run(main: Coroutine[Any, Any, Any]) -> Any:
+    """asyncio.run() on the LOOP backend"""
+    try:
+        backend = select_loop()
+    except ValueError:
+        main.close()
+        raise
+    logger.info("Event loop: %s", backend)
+    return asyncio.run(main)
+
+
+def loop_backend() -> str:
+    """Backend of the running loop: 'uvloop' or 'asyncio'"""
+    return 'uvloop' if type(asyncio.get_running_loop()).__module__.startswith('uvloop') else 'asyncio'
+
+
+def loop_report(lag_monitor) -> Dict[str, Any]:
+    """Loop section of the /health body"""
+    return {
+        'backend': loop_backend(),
+        'lag_seconds': round(lag_monitor.lag.value, 6),
+        'lag_max_seconds': round(lag_monitor.lag_max.value, 6),
+    }
@@ -6,7 +6,19 @@ This is a minimalist WebSocket server that:
 1. Opens and holds WebSocket connections from clients
 2. Waits for messages over the WebSocket pipe
 3. Responds with current timestamp and pod's IP address
-4. Provides HTTP health endpoint for Kubernetes health checks
+4. Provides HTTP health and Prometheus metrics endpoints on the same asyncio loop
+5. Broadcasts messages to all or a filtered subset of clients (POST /admin/broadcast)
+
+Clients may negotiate the compact binary subprotocol from framing.py instead of JSON.
+MEMORY_PROFILE=idle shrinks per-connection buffers and limits for many idle sockets;
+GET /debug/connections reports what each connection costs (see memory.py).
+Logs are JSON lines written by a background thread; per-message lines are sampled (logutil.py).
+Per-connection and per-client token buckets limit message rates before decoding (admission.py).
+TRACE_CAPTURE_PATH records connection opens, message sizes and closes as a binary trace
+that the client can replay (traffic.py).
+/debug/profile, /debug/slow-callbacks and /debug/tasks profile the event loop on demand (profiling.py).
+On SIGTERM the server drains: it stops accepting, reports 503 on /health and closes
+connections with 1001 spread over DRAIN_WINDOW seconds, after their in-flight replies.
 """
 
 import asyncio
@@ -15,51 +27,96 @@ import json
 import socket
 import os
 import logging
+import time
 from datetime import datetime
-from typing import Set
+from typing import Dict, Optional, Set
 import signal
 import sys
-from http.server import HTTPServer, BaseHTTPRequestHandler
-import threading
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from admin import AdminServer, Request, Response, json_response
+from admission import AdmissionPolicy
+from broadcast import Broadcaster, parse_broadcast_request
+from codec import ResponseEncoder
+from compression import CompressionPolicy
+from framing import BINARY_SUBPROTOCOL, FramingError
+from logutil import attach_metrics, configure_logging, message_sampler, shutdown_logging
+from memory import ConnectionRecord, connection_report, describe_peer, memory_profile_from_env, process_rss_bytes, worker_report
+from metrics import FAST_BUCKETS, LoopLagMonitor, Registry
+from profiling import DebugEndpoints, forward_debug_routes
+from runtime import loop_backend, loop_report, run, startup
+from traffic import CLIENT_MESSAGE, CLOSE, SERVER_MESSAGE, message_size, trace_writer_from_env
+from workers import WorkerChannel, WorkerSupervisor
+
+# Configure logging (queue-backed; see logutil.py)
+configure_logging()
 logger = logging.getLogger(__name__)
+startup.mark('imports')
 
-class HealthCheckHandler(BaseHTTPRequestHandler):
-    """HTTP handler for health check endpoint"""
-    
-    def do_GET(self):
-        if self.path == '/health':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            health_data = {
-                'status': 'healthy',
-                'timestamp': datetime.utcnow().isoformat(),
-                'pod_ip': os.getenv('POD_IP', 'unknown'),
-                'pod_name': os.getenv('HOSTNAME', 'unknown')
-            }
-            self.wfile.write(json.dumps(health_data).encode())
-        else:
-            self.send_response(404)
-            self.end_headers()
+DRAIN_TICK = 0.05  # seconds between close batches while draining
+
+class ServerMetrics:
+    """Hot-path counters and histograms for the WebSocket server"""
     
-    def log_message(self, format, *args):
-        # Suppress default HTTP server logging to reduce noise
-        pass
+    def __init__(self):
+        self.registry = Registry(prefix='ws_server_')
+        r = self.registry
+        self.connections_active = r.gauge('connections_active', 'Currently connected WebSocket clients')
+        self.connections_opened = r.counter('connections_opened_total', 'WebSocket connections accepted')
+        self.connections_closed = r.counter('connections_closed_total', 'WebSocket connections closed')
+        self.connections_drained = r.counter('connections_drained_total', 'Connections closed with 1001 while draining')
+        self.draining = r.gauge('draining', '1 while the server is draining connections for shutdown')
+        self.messages_received = r.counter('messages_received_total', 'Messages received from clients')
+        self.messages_sent = r.counter('messages_sent_total', 'Messages sent to clients')
+        self.bytes_received = r.counter('message_bytes_received_total', 'Payload size of received messages')
+        self.bytes_sent = r.counter('message_bytes_sent_total', 'Payload size of sent messages')
+        self.message_errors = r.counter('message_errors_total', 'Messages that failed to process')
+        self.binary_messages = r.counter('binary_messages_received_total', 'Messages received as binary frames')
+        self.binary_connections = r.counter('binary_connections_total', 'Connections that negotiated the binary subprotocol')
+        self.json_decode_seconds = r.histogram('json_decode_seconds', 'Time spent decoding request JSON', FAST_BUCKETS)
+        self.json_encode_seconds = r.histogram('json_encode_seconds', 'Time spent encoding response JSON', FAST_BUCKETS)
+        self.send_queue_bytes = r.gauge('send_queue_bytes', 'Bytes buffered for sending across all connections')
+        self.send_queue_bytes_max = r.gauge('send_queue_bytes_max', 'Largest per-connection send buffer')
+        self.recv_queue_messages = r.gauge('recv_queue_messages', 'Received messages not yet processed across all connections')
+        self.resident_memory = r.gauge('resident_memory_bytes', 'Resident set size of the server process')
+        self.loop_lag = LoopLagMonitor(r)
+        startup.attach_metrics(r)
 
 class WebSocketServer:
-    def __init__(self, host: str = "0.0.0.0", port: int = 8080):
+    def __init__(self, host: str = "0.0.0.0", port: int = 8080, health_port: int = 8081,
+                 worker: Optional[int] = None):
         self.host = host
         self.port = port
-        self.connected_clients: Set[websockets.WebSocketServerProtocol] = set()
+        self.health_port = health_port
+        self.connected_clients: Dict[websockets.WebSocketServerProtocol, ConnectionRecord] = {}
+        self.memory_profile = memory_profile_from_env()
+        self.baseline_rss = 0  # RSS when the server starts listening, before any connection
+        self.draining = False
+        # Closes are spread over drain_window; a busy connection gets up to drain_reply_timeout
+        # to send its reply first. The close reason carries a retry hint for clients.
+        self.drain_window = float(os.getenv('DRAIN_WINDOW', '10'))
+        self.drain_reply_timeout = float(os.getenv('DRAIN_REPLY_TIMEOUT', '2'))
+        self.drain_retry_after = int(os.getenv('DRAIN_RETRY_AFTER', '2'))
         self.pod_ip = self._get_pod_ip()
         self.pod_name = os.getenv('HOSTNAME', 'unknown-pod')
-        self.health_server = None
+        self.started_at = time.time()
+        self.encoder = ResponseEncoder(self.pod_ip, self.pod_name)
+        self.metrics = ServerMetrics()
+        self.metrics.connections_active.set_function(lambda: len(self.connected_clients))
+        self.metrics.registry.add_collector(self._collect_queue_depths)
+        self.metrics.resident_memory.set_function(process_rss_bytes)
+        self.compression = CompressionPolicy(self.memory_profile.settings['compression'], self.metrics.registry)
+        self.admission = AdmissionPolicy(self.metrics.registry)
+        self.message_log = message_sampler()
+        self.trace = trace_writer_from_env(f".w{worker}" if worker is not None else '')
+        attach_metrics(self.metrics.registry)
+        self.admin = AdminServer(self.host, self.health_port)
+        self.admin.route('GET', '/health', self.http_health)
+        self.admin.route('GET', '/metrics', self.http_metrics)
+        self.broadcaster = Broadcaster(self.connected_clients, self.encoder, self.metrics.registry)
+        self.admin.route('POST', '/admin/broadcast', self.http_broadcast)
+        self.admin.route('GET', '/debug/connections', self.http_debug_connections)
+        self.debug = DebugEndpoints(self.metrics.registry)
+        self.debug.attach(self.admin)
         
     def _get_pod_ip(self) -> str:
         """Get the pod's IP address"""
@@ -77,58 +134,157 @@ class WebSocketServer:
             logger.warning(f"Could not determine pod IP: {e}")
             return "unknown"
     
-    def start_health_server(self):
-        """Start HTTP health check server on port 8081"""
-        def run_health_server():
-            try:
-                self.health_server = HTTPServer((self.host, 8081), HealthCheckHandler)
-                logger.info(f"Health check server started on http://{self.host}:8081/health")
-                self.health_server.serve_forever()
-            except Exception as e:
-                logger.error(f"Health server error: {e}")
-        
-        # Run health server in a separate thread
-        health_thread = threading.Thread(target=run_health_server, daemon=True)
-        health_thread.start()
-        return health_thread
+    def _collect_queue_depths(self) -> None:
+        """Sample per-connection buffers at scrape time rather than on every send"""
+        total = largest = queued = 0
+        for websocket in self.connected_clients:
+            transport = websocket.transport
+            size = transport.get_write_buffer_size() if transport is not None else 0
+            total += size
+            if size > largest:
+                largest = size
+            queued += len(websocket.messages)
+        self.metrics.send_queue_bytes.set(total)
+        self.metrics.send_queue_bytes_max.set(largest)
+        self.metrics.recv_queue_messages.set(queued)
+    
+    def http_health(self, request: Request) -> Response:
+        """Kubernetes liveness/readiness endpoint; 503 while draining so no new traffic is routed here"""
+        return json_response({
+            'status': 'draining' if self.draining else 'healthy',
+            'timestamp': datetime.utcnow().isoformat(),
+            'pod_ip': self.pod_ip,
+            'pod_name': self.pod_name,
+            'connected_clients': len(self.connected_clients),
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'loop': loop_report(self.metrics.loop_lag),
+            'startup_seconds': startup.phases
+        }, 503 if self.draining else 200)
+    
+    def http_metrics(self, request: Request) -> Response:
+        """Prometheus scrape endpoint"""
+        return Response(self.metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    
+    def http_debug_connections(self, request: Request) -> Response:
+        """Memory per connection and the connections holding the most buffered data (?top=N)"""
+        try:
+            top = int(request.query.get('top', '10'))
+        except ValueError:
+            return json_response({'error': 'top must be an integer'}, 400)
+        outbox_bytes = sum(outbox.bytes for outbox in self.broadcaster.outboxes.values())
+        report = connection_report(self.connected_clients, self.baseline_rss, self.memory_profile, outbox_bytes, top)
+        report['compression'] = self.compression.report()
+        report['rate_limit'] = self.admission.report()
+        return json_response(report)
+    
+    def http_broadcast(self, request: Request) -> Response:
+        """Publish a message to all (or the matching) connected clients"""
+        try:
+            kwargs = parse_broadcast_request(request.json())
+        except ValueError as e:
+            return json_response({'error': str(e)}, 400)
+        return json_response(self.broadcast(**kwargs))
     
-    async def register(self, websocket: websockets.WebSocketServerProtocol) -> None:
+    def broadcast(self, message, topic=None, client_ids=None, client_prefix=None) -> dict:
+        """Python API for broadcasts; see broadcast.Broadcaster.broadcast"""
+        result = self.broadcaster.broadcast(message, topic, client_ids, client_prefix)
+        logger.info(f"Broadcast (topic={topic}) to {result['matched']} clients: "
+                    f"{result['sent']} sent, {result['queued']} queued, {result['dropped']} dropped")
+        return result
+    
+    async def start_admin_server(self) -> None:
+        """Start the HTTP health/metrics server on the running event loop"""
+        await self.admin.start()
+        startup.mark('health_server')
+        self.metrics.loop_lag.start()
+    
+    async def register(self, websocket: websockets.WebSocketServerProtocol) -> ConnectionRecord:
         """Register a new client connection"""
-        self.connected_clients.add(websocket)
-        client_info = f"{websocket.remote_address[0]}:{websocket.remote_address[1]}"
-        logger.info(f"Client connected: {client_info}. Total clients: {len(self.connected_clients)}")
+        record = self.connected_clients[websocket] = ConnectionRecord(websocket.request_headers.get('X-Client-ID', 'unknown'))
+        self.metrics.connections_opened.inc()
+        if self.trace is not None:
+            record.trace_id = self.trace.open_connection()
+        startup.mark('first_accept')
+        if websocket.subprotocol == BINARY_SUBPROTOCOL:
+            self.metrics.binary_connections.inc()
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Client connected: %s. Total clients: %d", describe_peer(websocket), len(self.connected_clients))
+        return record
     
     async def unregister(self, websocket: websockets.WebSocketServerProtocol) -> None:
         """Unregister a client connection"""
-        self.connected_clients.discard(websocket)
-        client_info = f"{websocket.remote_address[0]}:{websocket.remote_address[1]}"
-        logger.info(f"Client disconnected: {client_info}. Total clients: {len(self.connected_clients)}")
+        record = self.connected_clients.pop(websocket, None)
+        if self.trace is not None and record is not None:
+            self.trace.record(CLOSE, record.trace_id, websocket.close_code or 0)
+        self.broadcaster.discard(websocket)
+        self.metrics.connections_closed.inc()
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Client disconnected: %s. Total clients: %d", describe_peer(websocket), len(self.connected_clients))
+    
+    async def handle_binary_message(self, websocket: websockets.WebSocketServerProtocol, frame: bytes) -> None:
+        """Reply to a binary PING frame; identity travels in the handshake headers, not per message"""
+        metrics = self.metrics
+        metrics.messages_received.inc()
+        metrics.binary_messages.inc()
+        metrics.bytes_received.inc(len(frame))
+        try:
+            reply = self.encoder.encode_binary(frame)
+        except FramingError as e:
+            metrics.message_errors.inc()
+            # Sampled per connection: a client sending garbage must not flood the log queue
+            if self.message_log.allow(websocket):
+                logger.warning("Dropping malformed binary frame (%d bytes): %s", len(frame), e)
+            return
+        await websocket.send(reply)
+        metrics.messages_sent.inc()
+        metrics.bytes_sent.inc(len(reply))
+        if self.trace is not None:
+            self.trace.record(SERVER_MESSAGE, self.connected_clients[websocket].trace_id, len(reply))
+        if logger.isEnabledFor(logging.DEBUG) and self.message_log.allow(websocket):
+            logger.debug("Processed binary message from %s: %d bytes", self.connected_clients[websocket].client_id, len(frame))
     
     async def handle_message(self, websocket: websockets.WebSocketServerProtocol, message: str) -> None:
         """Handle incoming message from client"""
+        record = self.connected_clients[websocket]
+        record.messages += 1
+        size = message_size(message)
+        if self.trace is not None:
+            self.trace.record(CLIENT_MESSAGE, record.trace_id, size)
+        if isinstance(message, bytes):
+            await self.handle_binary_message(websocket, message)
+            return
+        metrics = self.metrics
+        metrics.messages_received.inc()
+        metrics.bytes_received.inc(size)
+        encoder = self.encoder
         try:
-            # Parse incoming message
-            data = json.loads(message) if message.startswith('{') else {"message": message}
+            # Parse incoming message (skipped entirely in echo-raw mode)
+            data = None
+            if encoder.parses and message.startswith('{'):
+                started = time.perf_counter()
+                data = encoder.json.loads(message)
+                metrics.json_decode_seconds.observe(time.perf_counter() - started)
             
-            # Create response with timestamp and pod info
-            response = {
-                "timestamp": datetime.utcnow().isoformat() + "Z",
-                "pod_ip": self.pod_ip,
-                "pod_name": self.pod_name,
-                "received_message": data,
-                "server_info": {
-                    "version": "1.0.0",
-                    "type": "websocket-server"
-                }
-            }
+            # Create response with timestamp and pod info; the constant fields are
+            # pre-encoded and the received message is spliced in verbatim
+            started = time.perf_counter()
+            payload = encoder.encode(message, data)
+            metrics.json_encode_seconds.observe(time.perf_counter() - started)
             
             # Send response back to client
-            await websocket.send(json.dumps(response))
+            await websocket.send(payload)
+            metrics.messages_sent.inc()
+            size = message_size(payload)
+            metrics.bytes_sent.inc(size)
+            if self.trace is not None:
+                self.trace.record(SERVER_MESSAGE, record.trace_id, size)
             
-            client_info = f"{websocket.remote_address[0]}:{websocket.remote_address[1]}"
-            logger.info(f"Processed message from {client_info}: {data}")
+            # The payload is formatted by the log writer thread, and only for sampled messages
+            if self.message_log.allow(websocket) and logger.isEnabledFor(logging.INFO):
+                logger.info("Processed message from %s: %s", describe_peer(websocket),
+                            data if data is not None else message)
             
-        except json.JSONDecodeError:
+        except encoder.json.DecodeError:
             # Handle non-JSON messages
             response = {
                 "timestamp": datetime.utcnow().isoformat() + "Z",
@@ -139,6 +295,7 @@ class WebSocketServer:
             }
             await websocket.send(json.dumps(response))
         except Exception as e:
+            metrics.message_errors.inc()
             logger.error(f"Error handling message: {e}")
             error_response = {
                 "timestamp": datetime.utcnow().isoformat() + "Z",
@@ -150,10 +307,12 @@ class WebSocketServer:
     
     async def client_handler(self, websocket: websockets.WebSocketServerProtocol, path: str) -> None:
         """Handle individual client connections"""
-        await self.register(websocket)
+        record = await self.register(websocket)
         try:
             async for message in websocket:
+                record.busy = True
                 await self.handle_message(websocket, message)
+                record.busy = False
         except websockets.exceptions.ConnectionClosed:
             logger.info(f"Client connection closed normally")
         except Exception as e:
@@ -174,8 +333,53 @@ class WebSocketServer:
         await websocket.send(json.dumps(health_status))
         await websocket.close()
     
-    async def start_server(self) -> None:
-        """Start the WebSocket server"""
+    async def drain(self, server) -> None:
+        """Stop accepting, close every connection with 1001 over DRAIN_WINDOW, then close the server"""
+        loop = asyncio.get_running_loop()
+        self.draining = True
+        self.metrics.draining.set(1)
+        # Closing only the listening socket keeps the open connections up
+        server.server.close()
+        pending = list(self.connected_clients)
+        total = len(pending)
+        logger.info("Draining %d connections over %.1fs", total, self.drain_window)
+        reason = f"server draining; retry_after={self.drain_retry_after}" if self.drain_retry_after else "server draining"
+        started = loop.time()
+        position = 0
+        waiting = []  # (websocket, give up waiting for its reply at)
+        closing: Set[asyncio.Future] = set()
+        while position < total or waiting:
+            now = loop.time()
+            elapsed = now - started
+            due = total if elapsed >= self.drain_window else int(total * elapsed / self.drain_window)
+            batch = waiting + [(websocket, now + self.drain_reply_timeout) for websocket in pending[position:due]]
+            position = due
+            waiting = []
+            for websocket, give_up_at in batch:
+                record = self.connected_clients.get(websocket)
+                if record is None:
+                    continue
+                # Let a request that is being processed or already queued get its reply first
+                if (record.busy or websocket.messages) and now < give_up_at:
+                    waiting.append((websocket, give_up_at))
+                    continue
+                self.metrics.connections_drained.inc()
+                task = asyncio.ensure_future(websocket.close(1001, reason))
+                closing.add(task)
+                task.add_done_callback(closing.discard)
+            if position < total or waiting:
+                await asyncio.sleep(DRAIN_TICK)
+        if closing:
+            await asyncio.wait(list(closing), timeout=10)
+        logger.info("Drained %d connections in %.1fs", total, loop.time() - started)
+        # Anything still open (e.g. connected during the race with the listener close) goes now
+        server.close()
+        await server.wait_closed()
+        if self.trace is not None:
+            self.trace.close()
+    
+    async def start_server(self, reuse_port: bool = False) -> None:
+        """Start the WebSocket server (reuse_port lets several worker processes share the port)"""
         logger.info(f"Starting WebSocket server on {self.host}:{self.port}")
         logger.info(f"Pod IP: {self.pod_ip}, Pod Name: {self.pod_name}")
         
@@ -186,60 +390,192 @@ class WebSocketServer:
             else:
                 await self.client_handler(websocket, path)
         
-        # Start the server
+        # Start the server; buffer sizes, limits, compression and pings come from MEMORY_PROFILE
+        logger.info(f"Memory profile: {self.memory_profile.describe()}")
+        logger.info(f"Compression: {self.compression.describe()}")
+        logger.info(f"Message rate limit: {self.admission.describe()}")
         server = await websockets.serve(
             router,
             self.host,
             self.port,
-            ping_interval=30,  # Send ping every 30 seconds
-            ping_timeout=10,   # Wait 10 seconds for pong
-            max_size=1024*1024,  # Max message size 1MB
-            max_queue=32       # Max queued messages
+            **self.memory_profile.serve_kwargs(),
+            **self.compression.server_kwargs(),
+            **self.admission.server_kwargs(),
+            subprotocols=[BINARY_SUBPROTOCOL],
+            # Server identity is sent once per connection for binary clients
+            extra_headers={'X-Server-Pod-IP': self.pod_ip, 'X-Server-Pod-Name': self.pod_name},
+            reuse_port=reuse_port or None
         )
         
+        self.baseline_rss = process_rss_bytes()
+        startup.mark('listening')
         logger.info(f"WebSocket server started successfully on ws://{self.host}:{self.port}")
         return server
 
-def signal_handler(signum, frame):
-    """Handle shutdown signals gracefully"""
-    logger.info(f"Received signal {signum}, shutting down gracefully...")
-    sys.exit(0)
+def server_config():
+    """Get (host, port, health_port) from environment variables"""
+    return (
+        os.getenv('SERVER_HOST', '0.0.0.0'),
+        int(os.getenv('SERVER_PORT', '8080')),
+        int(os.getenv('HEALTH_PORT', '8081')),
+    )
+
+def run_worker(index: int, conn) -> None:
+    """Entry point of one worker process in WORKERS=N mode"""
+    try:
+        run(worker_main(index, conn))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # multiprocessing children skip atexit: flush the log queue here
+        shutdown_logging()
+
+async def worker_main(index: int, conn) -> None:
+    """Serve WebSockets on a shared SO_REUSEPORT socket and report stats to the supervisor"""
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+    
+    host, port, health_port = server_config()
+    server_instance = WebSocketServer(host, port, health_port, worker=index)
+    server = await server_instance.start_server(reuse_port=True)
+    server_instance.metrics.loop_lag.start()
+    
+    channel = WorkerChannel(conn)
+    channel.on('broadcast', lambda kwargs: server_instance.broadcast(**kwargs))
+    channel.on('debug', server_instance.debug.call)
+    channel.attach()
+    interval = float(os.getenv('WORKER_STATS_INTERVAL', '1'))
+    publisher = asyncio.create_task(channel.publish_stats(server_instance.metrics.registry.snapshot, interval))
+    logger.info(f"Worker {index} (pid {os.getpid()}) serving on ws://{host}:{port}")
+    
+    await stop.wait()
+    logger.info(f"Worker {index} draining...")
+    publisher.cancel()
+    await server_instance.drain(server)
+    channel.send('stats', server_instance.metrics.registry.snapshot())
+
+async def supervise(workers: int) -> None:
+    """Run WORKERS=N worker processes and serve aggregated health/metrics"""
+    host, port, health_port = server_config()
+    pod_ip = os.getenv('POD_IP', 'unknown')
+    pod_name = os.getenv('HOSTNAME', 'unknown-pod')
+    started_at = time.time()
+    supervisor = WorkerSupervisor(workers, run_worker)
+    
+    # startup_seconds is left to the workers: families here are appended to the merged worker
+    # families, so the supervisor's own phases are only on /health
+    registry = Registry(prefix='ws_server_')
+    registry.gauge('workers', 'Configured worker processes').set(workers)
+    registry.gauge('workers_alive', 'Running worker processes').set_function(
+        lambda: sum(1 for w in supervisor.workers if w.alive))
+    registry.gauge('worker_restarts', 'Worker restarts since startup').set_function(
+        lambda: sum(w.restarts for w in supervisor.workers))
+    
+    def http_health(request: Request) -> Response:
+        workers_status = supervisor.worker_status('ws_server_connections_active')
+        alive = sum(1 for w in workers_status if w['alive'])
+        status = 'draining' if supervisor.stopping else 'healthy' if alive else 'unhealthy'
+        return json_response({
+            'status': status,
+            'timestamp': datetime.utcnow().isoformat(),
+            'pod_ip': pod_ip,
+            'pod_name': pod_name,
+            'connected_clients': sum(w['connected_clients'] for w in workers_status),
+            'uptime_seconds': round(time.time() - started_at, 1),
+            'loop': {
+                'backend': loop_backend(),
+                'lag_seconds': round(max((supervisor.sample(w.snapshot, 'ws_server_event_loop_lag_seconds')
+                                    for w in supervisor.workers), default=0), 6),
+                'lag_max_seconds': round(max((supervisor.sample(w.snapshot, 'ws_server_event_loop_lag_max_seconds')
+                                        for w in supervisor.workers), default=0), 6),
+            },
+            'startup_seconds': startup.phases,
+            'workers': workers_status
+        }, 200 if status == 'healthy' else 503)
+    
+    def http_metrics(request: Request) -> Response:
+        return Response(supervisor.render_metrics(registry.snapshot()),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+    
+    admin = AdminServer(host, health_port)
+    admin.route('GET', '/health', http_health)
+    admin.route('GET', '/metrics', http_metrics)
+    
+    def http_broadcast(request: Request) -> Response:
+        # Each worker owns its own connections: fan the request out and let them deliver
+        try:
+            kwargs = parse_broadcast_request(request.json())
+        except ValueError as e:
+            return json_response({'error': str(e)}, 400)
+        delivered = sum(1 for w in supervisor.workers if supervisor.send(w, 'broadcast', kwargs))
+        return json_response({'workers': delivered}, 202 if delivered else 503)
+    
+    admin.route('POST', '/admin/broadcast', http_broadcast)
+    
+    def http_debug_connections(request: Request) -> Response:
+        # Per-worker detail (top connections, buffers) is on each worker's own report;
+        # here only RSS from /proc/<pid> against the connections each worker last reported
+        return json_response(worker_report(supervisor.worker_status('ws_server_connections_active')))
+    
+    admin.route('GET', '/debug/connections', http_debug_connections)
+    # Profiles, slow callbacks and tasks are per event loop: served by one worker (?worker=N)
+    forward_debug_routes(admin, supervisor)
+    await admin.start()
+    startup.mark('health_server')
+    
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+    
+    logger.info(f"Starting {workers} worker processes on port {port} (SO_REUSEPORT)")
+    runner = asyncio.create_task(supervisor.run())
+    await stop.wait()
+    logger.info("Supervisor draining workers...")
+    # Workers drain on SIGTERM: allow the drain window plus reply and close timeouts
+    await supervisor.stop(timeout=float(os.getenv('DRAIN_WINDOW', '10')) + 15)
+    runner.cancel()
+    await admin.stop()
+    logger.info("Server shutdown complete")
 
 async def main():
     """Main application entry point"""
-    # Setup signal handlers for graceful shutdown
-    signal.signal(signal.SIGTERM, signal_handler)
-    signal.signal(signal.SIGINT, signal_handler)
+    # SIGTERM/SIGINT start a drain instead of exiting immediately
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
     
     # Get configuration from environment variables
-    host = os.getenv('SERVER_HOST', '0.0.0.0')
-    port = int(os.getenv('SERVER_PORT', '8080'))
+    host, port, health_port = server_config()
     
     # Create and start server
-    server_instance = WebSocketServer(host, port)
+    server_instance = WebSocketServer(host, port, health_port)
     
-    # Start health check server
-    health_thread = server_instance.start_health_server()
+    # Start health check and metrics server
+    await server_instance.start_admin_server()
     
     # Start WebSocket server
     server = await server_instance.start_server()
     
     try:
         # Keep server running
-        await server.wait_closed()
-    except KeyboardInterrupt:
-        logger.info("Received keyboard interrupt, shutting down...")
+        await stop.wait()
+        logger.info("Received shutdown signal, draining connections...")
+        await server_instance.drain(server)
     except Exception as e:
         logger.error(f"Server error: {e}")
     finally:
         # Shutdown health server
-        if server_instance.health_server:
-            server_instance.health_server.shutdown()
+        await server_instance.admin.stop()
         logger.info("Server shutdown complete")
 
 if __name__ == "__main__":
+    workers = int(os.getenv('WORKERS', '1'))
     try:
-        asyncio.run(main())
+        run(supervise(workers) if workers > 1 else main())
     except KeyboardInterrupt:
         logger.info("Application interrupted by user")
     except Exception as e:
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Multi-process supervisor for the WebSocket server (WORKERS=N) and client (CLIENT_WORKERS=N)
+
+1. The parent spawns N worker processes, each running its own event loop. Server
+   workers bind the WebSocket port with SO_REUSEPORT, so the kernel spreads new
+   connections across them; client workers each host a shard of the identities
+2. Each worker publishes a metrics snapshot to the parent over a pipe every
+   WORKER_STATS_INTERVAL seconds
+3. The parent owns the health port and serves /health and /metrics aggregated
+   across workers; counters from workers that exited are retained so totals
+   stay monotonic across restarts
+4. Workers that die are restarted; SIGTERM/SIGINT are forwarded to all workers
+5. The parent can call a worker-side handler and await its result (`call`), which is
+   how per-process endpoints such as /debug/profile are served from the health port
+
+This file is shared between the server and client applications: keep both copies identical.
+"""
+
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import time
+from multiprocessing.connection import Connection
+from typing import Callable, Dict, List, Optional
+
+from metrics import merge_snapshots, render_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Workers are spawned (not forked) so they never inherit the parent's running event loop
+_mp = multiprocessing.get_context('spawn')
+
+
+class WorkerHandle:
+    """Parent-side view of one worker process"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process: Optional[multiprocessing.Process] = None
+        self.conn: Optional[Connection] = None
+        self.snapshot: List[Dict] = []
+        self.snapshot_at = 0.0
+        self.restarts = 0
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+
+class WorkerSupervisor:
+    """Spawns, monitors and aggregates worker processes"""
+
+    def __init__(self, count: int, target: Callable[[int, Connection], None]):
+        self.count = count
+        self.target = target
+        self.workers = [WorkerHandle(i) for i in range(count)]
+        self.retired: List[Dict] = []  # counters/histograms of exited worker generations
+        self.stopping = False
+        self.restart_delay = float(os.getenv('WORKER_RESTART_DELAY', '1'))
+        self.call_ids = itertools.count(1)
+        self.calls: Dict[int, asyncio.Future] = {}  # call id -> future for the worker's reply
+
+    # ---- process management -------------------------------------------------
+
+    def _spawn(self, worker: WorkerHandle) -> None:
+        loop = asyncio.get_running_loop()
+        parent_conn, child_conn = _mp.Pipe(duplex=True)
+        process = _mp.Process(target=self.target, args=(worker.index, child_conn),
+                              name=f"ws-worker-{worker.index}", daemon=True)
+        process.start()
+        child_conn.close()
+        worker.process = process
+        worker.conn = parent_conn
+        worker.snapshot = []
+        loop.add_reader(parent_conn.fileno(), self._on_readable, worker)
+        logger.info(f"Started worker {worker.index} (pid {process.pid})")
+
+    def _detach(self, worker: WorkerHandle) -> None:
+        if worker.conn is not None:
+            try:
+                asyncio.get_running_loop().remove_reader(worker.conn.fileno())
+            except (ValueError, OSError):
+                pass
+            worker.conn.close()
+            worker.conn = None
+        if worker.snapshot:
+            # Keep the exited generation's counters so aggregated totals never go backwards
+            self.retired = merge_snapshots([self.retired, worker.snapshot], include_gauges=False)
+            worker.snapshot = []
+
+    def _on_readable(self, worker: WorkerHandle) -> None:
+        try:
+            kind, payload = worker.conn.recv()
+        except (EOFError, OSError):
+            self._detach(worker)
+            return
+        self.handle_message(worker, kind, payload)
+
+    def handle_message(self, worker: WorkerHandle, kind: str, payload) -> None:
+        if kind == 'stats':
+            worker.snapshot = payload
+            worker.snapshot_at = time.time()
+        elif kind == 'reply':
+            call_id, result = payload
+            future = self.calls.get(call_id)
+            if future is not None and not future.done():
+                future.set_result(result)
+        else:
+            logger.warning(f"Unknown message {kind!r} from worker {worker.index}")
+
+    def send(self, worker: WorkerHandle, kind: str, payload=None) -> bool:
+        """Send a control message to a worker; returns False if it is not reachable"""
+        if worker.conn is None or not worker.alive:
+            return False
+        try:
+            worker.conn.send((kind, payload))
+            return True
+        except (BrokenPipeError, OSError):
+            return False
+
+    async def call(self, worker: WorkerHandle, kind: str, payload=None, timeout: float = 10.0):
+        """Run the worker's `kind` handler with `payload` and return its result"""
+        call_id = next(self.call_ids)
+        future = self.calls[call_id] = asyncio.get_running_loop().create_future()
+        try:
+            if not self.send(worker, 'call', (call_id, kind, payload)):
+                raise ConnectionError(f"worker {worker.index} is not running")
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            del self.calls[call_id]
+
+    async def run(self) -> None:
+        """Start all workers and restart any that exit until stop() is called"""
+        for worker in self.workers:
+            self._spawn(worker)
+        while not self.stopping:
+            await asyncio.sleep(self.restart_delay)
+            for worker in self.workers:
+                if self.stopping or worker.alive:
+                    continue
+                exitcode = worker.process.exitcode if worker.process else None
+                logger.warning(f"Worker {worker.index} exited with code {exitcode}; restarting")
+                self._detach(worker)
+                worker.restarts += 1
+                self._spawn(worker)
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Forward SIGTERM to all workers and wait for them to exit"""
+        self.stopping = True
+        for worker in self.workers:
+            if worker.alive:
+                worker.process.terminate()
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            while worker.process.is_alive() and time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+            if worker.process.is_alive():
+                logger.warning(f"Worker {worker.index} did not exit in time; killing")
+                worker.process.kill()
+            worker.process.join(timeout=1)
+            self._detach(worker)
+
+    # ---- aggregation --------------------------------------------------------
+
+    def merged_snapshot(self) -> List[Dict]:
+        live = [w.snapshot for w in self.workers if w.snapshot]
+        return merge_snapshots([self.retired] + live)
+
+    def render_metrics(self, extra: List[Dict] = ()) -> str:
+        return render_snapshot(self.merged_snapshot() + list(extra))
+
+    @staticmethod
+    def sample(snapshot: List[Dict], name: str, default: float = 0) -> float:
+        """Value of an unlabeled counter/gauge in a snapshot"""
+        for family in snapshot:
+            if family['name'] == name and family['samples']:
+                return family['samples'][0][1]
+        return default
+
+    def worker_status(self, connections_metric: str) -> List[Dict]:
+        return [{
+            'index': w.index,
+            'pid': w.process.pid if w.process else None,
+            'alive': w.alive,
+            'restarts': w.restarts,
+            'connected_clients': self.sample(w.snapshot, connections_metric),
+            'stats_age_seconds': round(time.time() - w.snapshot_at, 1) if w.snapshot_at else None,
+        } for w in self.workers]
+
+
+class WorkerChannel:
+    """Worker-side end of the control pipe, serviced from the worker's event loop"""
+
+    def __init__(self, conn: Connection):
+        self.conn = conn
+        self.handlers: Dict[str, Callable] = {}
+        self.closed = False
+
+    def on(self, kind: str, handler: Callable) -> None:
+        self.handlers[kind] = handler
+
+    def attach(self) -> None:
+        asyncio.get_running_loop().add_reader(self.conn.fileno(), self._on_readable)
+
+    def _on_readable(self) -> None:
+        try:
+            kind, payload = self.conn.recv()
+        except (EOFError, OSError):
+            # Parent went away: nothing left to report to
+            asyncio.get_running_loop().remove_reader(self.conn.fileno())
+            self.closed = True
+            return
+        if kind == 'call':
+            asyncio.ensure_future(self._answer(*payload))
+            return
+        handler = self.handlers.get(kind)
+        if handler is None:
+            logger.warning(f"Unknown control message {kind!r}")
+            return
+        result = handler(payload)
+        if asyncio.iscoroutine(result):
+            asyncio.ensure_future(result)
+
+    async def _answer(self, call_id: int, kind: str, payload) -> None:
+        """Run a handler for the parent's call() and send back its result (None on failure)"""
+        result = None
+        handler = self.handlers.get(kind)
+        if handler is None:
+            logger.warning(f"Unknown call {kind!r}")
+        else:
+            try:
+                result = handler(payload)
+                if asyncio.iscoroutine(result):
+                    result = await result
+            except Exception:
+                logger.exception(f"Call {kind!r} failed")
+                result = None
+        self.send('reply', (call_id, result))
+
+    def send(self, kind: str, payload=None) -> None:
+        if self.closed:
+            return
+        try:
+            self.conn.send((kind, payload))
+        except (BrokenPipeError, OSError):
+            self.closed = True
+
+    async def publish_stats(self, snapshot: Callable[[], List[Dict]], interval: float) -> None:
+        while not self.closed:
+            self.send('stats', snapshot())
+            await asyncio.sleep(interval)
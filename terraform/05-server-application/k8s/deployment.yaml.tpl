@@ -18,6 +18,10 @@ spec:
         app: ${app_name}
         component: websocket-server
         version: ${app_version}
+      annotations:
+        prometheus.io/scrape: "true"
+        prometheus.io/port: "${health_port}"
+        prometheus.io/path: "/metrics"
     spec:
       containers:
       - name: websocket-server
@@ -34,6 +38,20 @@ spec:
           value: "0.0.0.0"
         - name: SERVER_PORT
           value: "${container_port}"
+        - name: HEALTH_PORT
+          value: "${health_port}"
+        - name: WORKERS
+          value: "${workers}"
+        - name: MEMORY_PROFILE
+          value: "${memory_profile}"
+        - name: DRAIN_WINDOW
+          value: "${drain_window}"
+        - name: MESSAGE_RATE_LIMIT
+          value: "${message_rate_limit}"
+        - name: CLIENT_RATE_LIMIT
+          value: "${client_rate_limit}"
+        - name: RATE_LIMIT_ACTION
+          value: "${rate_limit_action}"
         - name: POD_IP
           valueFrom:
             fieldRef:
@@ -9,6 +9,12 @@ locals {
   container_port  = 8080
   health_port     = 8081
   replicas        = 5
+  workers         = 1  # WebSocket worker processes per pod (SO_REUSEPORT); raise with cpu_limit
+  memory_profile  = "default"  # "idle" for many long-lived idle sockets per pod (see README)
+  drain_window    = 10  # Seconds over which connections are closed on SIGTERM; keep below the 30s grace period
+  message_rate_limit = 0       # Messages/second per connection before RATE_LIMIT_ACTION applies; 0 = off
+  client_rate_limit  = 0       # Messages/second per X-Client-ID (all its connections to the pod); 0 = off
+  rate_limit_action  = "drop"  # "drop", "delay" (pause reading the socket) or "close" (code 1008)
   
   # ECR Configuration
   ecr_repository_name = "cfndev-envoy-proxy-poc-app"
@@ -56,6 +56,9 @@ if [ $? -ne 0 ]; then
 fi
 echo "✓ Successfully logged into ECR"
 
+# Shared modules must match the client's copies
+"$SCRIPT_DIR/check-shared-files.sh"
+
 # Build Docker image
 echo "Building Docker image..."
 cd "$APP_DIR"
@@ -0,0 +1,29 @@
+#!/bin/bash
+
+# Shared Module Check
+# Modules used by both the server and the client (their docstring says "keep both copies
+# identical") are copied byte-for-byte between 05-server-application/app and
+# 07-client-application/app. This fails, listing the modules, when the copies differ.
+
+set -e
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+SERVER_APP="$SCRIPT_DIR/../app"
+CLIENT_APP="$SCRIPT_DIR/../../07-client-application/app"
+MARKER="both copies identical"
+
+SHARED=$( (cd "$SERVER_APP" && grep -l "$MARKER" -- *.py; cd "$CLIENT_APP" && grep -l "$MARKER" -- *.py) | sort -u)
+
+FAILED=0
+for module in $SHARED; do
+    if ! cmp -s "$SERVER_APP/$module" "$CLIENT_APP/$module"; then
+        echo "Error: $module differs between 05-server-application/app and 07-client-application/app"
+        FAILED=1
+    fi
+done
+
+if [ $FAILED -ne 0 ]; then
+    echo "Copy the intended version over the other one before building"
+    exit 1
+fi
+echo "✓ Shared modules identical: $(echo $SHARED | tr '\n' ' ')"
@@ -9,6 +9,12 @@ resource "local_file" "deployment_manifest" {
     image_tag          = local.image_tag
     container_port     = local.container_port
     health_port        = local.health_port
+    workers            = local.workers
+    memory_profile     = local.memory_profile
+    drain_window       = local.drain_window
+    message_rate_limit = local.message_rate_limit
+    client_rate_limit  = local.client_rate_limit
+    rate_limit_action  = local.rate_limit_action
     service_name       = local.service_name
     service_port       = local.service_port
     cpu_request        = local.cpu_request
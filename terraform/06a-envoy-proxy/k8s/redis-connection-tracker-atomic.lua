@@ -36,170 +36,94 @@ local CONFIG = {
 --                    ATOMIC CONNECTION LIMIT ENFORCEMENT
 -- ==============================================================================
 
--- Redis Lua script for atomic connection checking and incrementing
-local REDIS_ATOMIC_SCRIPT = [[
-    local pod_key = KEYS[1]              -- ws:pod_conn:pod-ip
-    local max_connections = tonumber(ARGV[1])
-    local connection_id = ARGV[2]
-    local proxy_id = ARGV[3]
-    local current_time = ARGV[4]
-    
-    -- Get current connection count
-    local current_count = redis.call('GET', pod_key)
-    current_count = tonumber(current_count) or 0
-    
-    -- Check if limit would be exceeded
-    if current_count >= max_connections then
-        return {0, current_count, "LIMIT_EXCEEDED"}
-    end
-    
-    -- Atomically increment and set metadata
-    local new_count = redis.call('INCR', pod_key)
-    redis.call('EXPIRE', pod_key, 86400)  -- 24 hour TTL for pod connections
-    
-    -- Track connection details
-    local conn_detail_key = 'ws:conn:' .. connection_id
-    local conn_data = {
-        'pod_id', string.match(pod_key, 'ws:pod_conn:(.+)'),
-        'proxy_id', proxy_id,
-        'created_at', current_time,
-        'last_seen', current_time
-    }
-    redis.call('HMSET', conn_detail_key, unpack(conn_data))
-    redis.call('EXPIRE', conn_detail_key, ]] .. CONFIG.CONNECTION_TTL .. [[)
-    
-    -- Add to global connection registry
-    redis.call('SADD', 'ws:all_connections', connection_id)
-    redis.call('SADD', 'ws:active_pods', string.match(pod_key, 'ws:pod_conn:(.+)'))
-    
-    -- Increment proxy-specific counter
-    local proxy_key = 'ws:proxy:' .. proxy_id .. ':connections'
-    redis.call('INCR', proxy_key)
-    redis.call('EXPIRE', proxy_key, 86400)
-    
-    return {1, new_count, "SUCCESS"}
-]]
+-- The atomic scripts (admit, release, rate_limit) are registered in the
+-- redis-http-bridge (../redis-bridge/*.lua) and run there with EVALSHA, so each
+-- check below is a single bridge round trip.
 
--- Atomic cleanup script for connection removal
-local REDIS_CLEANUP_SCRIPT = [[
-    local pod_key = KEYS[1]              -- ws:pod_conn:pod-ip
-    local connection_id = ARGV[1]
-    local proxy_id = ARGV[2]
-    
-    -- Get current count
-    local current_count = redis.call('GET', pod_key)
-    current_count = tonumber(current_count) or 0
-    
-    if current_count <= 0 then
-        return {0, 0, "ALREADY_ZERO"}
-    end
-    
-    -- Atomically decrement
-    local new_count = redis.call('DECR', pod_key)
-    if new_count < 0 then
-        redis.call('SET', pod_key, 0)
-        new_count = 0
-    end
-    
-    -- Remove connection details
-    local conn_detail_key = 'ws:conn:' .. connection_id
-    redis.call('DEL', conn_detail_key)
-    redis.call('SREM', 'ws:all_connections', connection_id)
+-- Run commands and named scripts in one bridge call (POST /redis/pipeline).
+-- Each entry is {"COMMAND", arg, ...} or {script = name, keys = {...}, args = {...}};
+-- returns the list of {ok = ..., value = ... | error = ...} results, or nil.
+function bridge_pipeline(handle, entries)
+    local response_headers, response_body = handle:httpCall(
+        "redis_http_bridge_cluster",
+        {
+            [":method"] = "POST",
+            [":path"] = "/redis/pipeline",
+            [":authority"] = "redis-http-bridge-service",
+            ["content-type"] = "application/json"
+        },
+        cjson.encode({commands = entries}),
+        REDIS_CONFIG.TIMEOUT
+    )
     
-    -- Decrement proxy-specific counter
-    local proxy_key = 'ws:proxy:' .. proxy_id .. ':connections'
-    local proxy_count = redis.call('DECR', proxy_key)
-    if proxy_count < 0 then
-        redis.call('SET', proxy_key, 0)
+    if not response_headers or response_headers[":status"] ~= "200" then
+        handle:logErr("[REDIS-TRACKER] Redis bridge call failed: " .. (response_headers and response_headers[":status"] or "no response"))
+        return nil
     end
     
-    return {1, new_count, "SUCCESS"}
-]]
-
--- Rate limiting script
-local REDIS_RATE_LIMIT_SCRIPT = [[
-    local key = KEYS[1]
-    local current = redis.call('INCR', key)
-    if current == 1 then
-        redis.call('EXPIRE', key, 60)
+    local ok, parsed = pcall(cjson.decode, response_body)
+    if not ok or type(parsed) ~= "table" then
+        handle:logErr("[REDIS-TRACKER] Invalid Redis bridge response")
+        return nil
     end
-    return current
-]]
-
--- Get direct Redis connection using Envoy's Redis cluster
-function get_redis_connection()
-    -- Use Envoy's built-in Redis cluster for direct connections
-    return "redis_cluster"
+    return parsed.results
 end
 
--- Execute Redis command via Envoy's Redis cluster
-function execute_redis_command(handle, command, args)
-    args = args or {}
-    
-    -- Format Redis command for Envoy's Redis filter
-    local cmd_parts = {command}
-    for _, arg in ipairs(args) do
-        table.insert(cmd_parts, tostring(arg))
-    end
-    
-    -- Use Envoy's httpCall to the Redis cluster
-    local headers = {
-        [":method"] = "POST",
-        [":path"] = "/redis",
-        [":authority"] = REDIS_CONFIG.HOST,
-        ["content-type"] = "application/x-redis"
-    }
-    
-    local body = table.concat(cmd_parts, "\r\n") .. "\r\n"
-    
-    local response_headers, response_body = handle:httpCall(
-        "redis_cluster",
-        headers,
-        body,
+-- Queue bookkeeping writes in the bridge's write-behind buffer (POST /redis/batch).
+-- Only for writes the admission check does not read; the bridge answers 202
+-- without waiting for Redis. Returns true if the writes were accepted.
+function bridge_defer(handle, entries)
+    local response_headers = handle:httpCall(
+        "redis_http_bridge_cluster",
+        {
+            [":method"] = "POST",
+            [":path"] = "/redis/batch",
+            [":authority"] = "redis-http-bridge-service",
+            ["content-type"] = "application/json"
+        },
+        cjson.encode({deferred = entries}),
         REDIS_CONFIG.TIMEOUT
     )
     
-    if response_headers and response_headers[":status"] == "200" then
-        return response_body
-    else
-        handle:logErr("[REDIS-TRACKER] Redis command failed: " .. (response_headers and response_headers[":status"] or "no response"))
-        return nil
+    local status = response_headers and response_headers[":status"]
+    if status ~= "202" and status ~= "200" then
+        handle:logErr("[REDIS-TRACKER] Redis bridge batch failed: " .. (status or "no response"))
+        return false
     end
+    return true
 end
 
--- Execute Redis Lua script atomically
-function execute_redis_script(handle, script, keys, args)
-    keys = keys or {}
-    args = args or {}
-    
-    -- Build EVAL command
-    local eval_args = {"EVAL", script, tostring(#keys)}
-    
-    -- Add keys
-    for _, key in ipairs(keys) do
-        table.insert(eval_args, key)
+-- Single result of a one-entry pipeline
+function first_result(handle, results)
+    local result = results and results[1]
+    if not result then
+        return nil
     end
-    
-    -- Add arguments
-    for _, arg in ipairs(args) do
-        table.insert(eval_args, tostring(arg))
+    if not result.ok then
+        handle:logErr("[REDIS-TRACKER] Redis command failed: " .. tostring(result.error))
+        return nil
     end
-    
-    local result = execute_redis_command(handle, eval_args[1], {table.concat(eval_args, " ", 2)})
-    
-    if result then
-        -- Parse Redis response (simplified - assumes direct response)
-        -- In a real implementation, you'd parse the Redis protocol response
-        local ok, parsed = pcall(cjson.decode, result)
-        if ok then
-            return parsed
-        else
-            -- Assume it's a direct Redis response for now
-            return result
-        end
+    return result.value
+end
+
+-- Execute a Redis command through the bridge
+function execute_redis_command(handle, command, args)
+    local entry = {command}
+    for _, arg in ipairs(args or {}) do
+        table.insert(entry, tostring(arg))
     end
-    
-    return nil
+    return first_result(handle, bridge_pipeline(handle, {entry}))
+end
+
+-- Execute a named Redis Lua script atomically (EVALSHA in the bridge)
+function execute_redis_script(handle, script, keys, args)
+    local str_args = {}
+    for _, arg in ipairs(args or {}) do
+        table.insert(str_args, tostring(arg))
+    end
+    return first_result(handle, bridge_pipeline(handle, {
+        {script = script, keys = keys or {}, args = str_args}
+    }))
 end
 
 -- Enhanced atomic connection limit enforcement based on cld-2.txt
@@ -215,9 +139,9 @@ function enforce_pod_connection_limit_atomic(handle, pod_id, connection_id)
     -- Execute atomic script
     local result = execute_redis_script(
         handle,
-        REDIS_ATOMIC_SCRIPT,
+        "admit",
         {pod_key},  -- KEYS
-        {CONFIG.MAX_CONNECTIONS_PER_POD, connection_id, CONFIG.PROXY_ID, current_time}  -- ARGV
+        {CONFIG.MAX_CONNECTIONS_PER_POD, connection_id, CONFIG.PROXY_ID, current_time, CONFIG.CONNECTION_TTL}  -- ARGV
     )
     
     if not result or type(result) ~= "table" or #result < 3 then
@@ -255,7 +179,7 @@ function cleanup_connection_atomic(handle, pod_id, connection_id)
     
     local result = execute_redis_script(
         handle,
-        REDIS_CLEANUP_SCRIPT,
+        "release",
         {pod_key},  -- KEYS
         {connection_id, CONFIG.PROXY_ID}  -- ARGV
     )
@@ -284,9 +208,9 @@ function check_rate_limit_atomic(handle, requests_per_minute)
     
     local result = execute_redis_script(
         handle,
-        REDIS_RATE_LIMIT_SCRIPT,
+        "rate_limit",
         {key},  -- KEYS
-        {}      -- ARGV (none needed)
+        {60}    -- ARGV: window seconds
     )
     
     if not result then
@@ -454,7 +378,8 @@ end
 
 -- Helper function to increment rejected counter
 function increment_rejected_counter(handle)
-    execute_redis_command(handle, "INCR", {REDIS_KEYS.REJECTED_CONNECTIONS})
+    -- Monitoring only, so it is batched rather than waited for
+    bridge_defer(handle, {{"INCR", REDIS_KEYS.REJECTED_CONNECTIONS}})
 end
 
 -- Metrics handler for multi-proxy aggregation
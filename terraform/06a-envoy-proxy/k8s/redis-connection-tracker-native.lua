@@ -34,7 +34,7 @@ function log_error(message)
   -- For global logging, this function would need to be called with a handle
 end
 
--- Redis Communication through HTTP proxy
+-- Redis Communication through HTTP proxy (single command; prefer redis_pipeline)
 function redis_call(request_handle, command, ...)
   if not request_handle then
     return nil
@@ -67,6 +67,77 @@ function redis_call(request_handle, command, ...)
   end
 end
 
+-- JSON string literal for a command argument
+function json_string(value)
+  local escaped = string.gsub(tostring(value), '[%c"\\]', function(c)
+    return string.format("\\u%04x", string.byte(c))
+  end)
+  return '"' .. escaped .. '"'
+end
+
+-- JSON array of commands
+function json_commands(commands)
+  local encoded = {}
+  for i, command in ipairs(commands) do
+    local parts = {}
+    for j, part in ipairs(command) do
+      parts[j] = json_string(part)
+    end
+    encoded[i] = "[" .. table.concat(parts, ",") .. "]"
+  end
+  return "[" .. table.concat(encoded, ",") .. "]"
+end
+
+-- Run several Redis commands in one bridge round trip (POST /redis/pipeline).
+-- commands is a list of {"COMMAND", arg, ...}; returns a list of
+-- {ok = true, value = "..."} / {ok = false, error = "..."} or nil if the call failed.
+-- deferred (optional) holds bookkeeping writes nothing reads back right away: the
+-- bridge coalesces them in its write-behind buffer and they produce no results.
+-- Keys the admission check reads (ws:pod_conn:*, ws:rate_limit:*) must stay in commands.
+function redis_pipeline(request_handle, commands, deferred)
+  deferred = deferred or {}
+  if not request_handle or (#commands == 0 and #deferred == 0) then
+    return nil
+  end
+  
+  local payload = '{"commands":' .. json_commands(commands)
+  if #deferred > 0 then
+    payload = payload .. ',"deferred":' .. json_commands(deferred)
+  end
+  
+  local headers, body = request_handle:httpCall(
+    "redis_http_bridge_cluster",
+    {
+      [":method"] = "POST",
+      [":path"] = "/redis/pipeline?format=lines",
+      [":authority"] = "redis-http-bridge-service",
+      ["content-type"] = "application/json"
+    },
+    payload .. '}',
+    5000  -- 5 second timeout
+  )
+  
+  if not headers or headers[":status"] ~= "200" or not body then
+    request_handle:logError("REDIS-TRACKER: Redis pipeline failed (" .. (#commands + #deferred) .. " commands) - " .. (headers and headers[":status"] or "no response"))
+    return nil
+  end
+  
+  -- One line per command: "+value", "_" (nil) or "-error"
+  local results = {}
+  for line in string.gmatch(body, "([^\n]*)\n") do
+    local kind, rest = string.sub(line, 1, 1), string.sub(line, 2)
+    if kind == "-" then
+      request_handle:logError("REDIS-TRACKER: Redis command failed: " .. rest)
+      table.insert(results, {ok = false, error = rest})
+    elseif kind == "_" then
+      table.insert(results, {ok = true, value = nil})
+    else
+      table.insert(results, {ok = true, value = rest})
+    end
+  end
+  return results
+end
+
 -- Rate Limiting Functions
 function check_rate_limit()
   local current_time = get_current_time()
@@ -256,50 +327,41 @@ function envoy_on_request(request_handle)
   local current_time = get_current_time()
   local connection_id = generate_connection_id()
   
+  -- All request-phase bookkeeping goes to Redis in a single pipelined bridge call;
+  -- monitoring-only writes are deferred to the bridge's write-behind buffer
+  local commands = {}
+  local deferred = {}
+  local description
+
   -- Check if this is a WebSocket upgrade request
   if upgrade_header and string.lower(upgrade_header) == "websocket" then
     request_handle:logInfo("REDIS-TRACKER: WebSocket connection detected")
     
     -- DON'T track connection here - wait for response phase to get backend pod IP
     -- Just log the attempt for monitoring
-    local success, result = pcall(function()
-      redis_call(request_handle, "INCR", "ws:attempts")
-      redis_call(request_handle, "EXPIRE", "ws:attempts", 7200)
-      return "WebSocket attempt logged"
-    end)
-    
-    if success then
-      request_handle:logInfo("REDIS-TRACKER: WebSocket attempt logged")
-    else
-      request_handle:logError("REDIS-TRACKER: Failed to log WebSocket attempt: " .. tostring(result))
-    end
+    deferred = {
+      {"INCR", "ws:attempts"},
+      {"EXPIRE", "ws:attempts", 7200}
+    }
+    description = "WebSocket attempt logged"
   else
-    -- Track regular HTTP requests for rate limiting
-    local success, result = pcall(function()
-      -- Rate limiting tracking by minute
-      local minute_bucket = math.floor(current_time / 60)
-      redis_call(request_handle, "INCR", "ws:rate_limit:" .. minute_bucket)
-      redis_call(request_handle, "EXPIRE", "ws:rate_limit:" .. minute_bucket, 300) -- 5 minutes
-      
-      return "HTTP request tracked"
-    end)
-    
-    if success then
-      request_handle:logInfo("REDIS-TRACKER: HTTP request metrics posted successfully")
-    else
-      request_handle:logError("REDIS-TRACKER: Failed to post HTTP metrics: " .. tostring(result))
-    end
+    -- Track regular HTTP requests for rate limiting by minute
+    local minute_bucket = math.floor(current_time / 60)
+    commands = {
+      {"INCR", "ws:rate_limit:" .. minute_bucket},
+      {"EXPIRE", "ws:rate_limit:" .. minute_bucket, 300} -- 5 minutes
+    }
+    description = "HTTP request metrics posted"
   end
   
   -- Post test connectivity metric (keep for monitoring)
-  local success, result = pcall(function()
-    return redis_call(request_handle, "SET", "lua_test_key", "lua_working_" .. current_time)
-  end)
+  table.insert(deferred, {"SET", "lua_test_key", "lua_working_" .. current_time})
   
-  if success then
-    request_handle:logInfo("REDIS-TRACKER: Test connectivity confirmed")
+  local success, result = pcall(redis_pipeline, request_handle, commands, deferred)
+  if success and result then
+    request_handle:logInfo("REDIS-TRACKER: " .. description .. ", test connectivity confirmed")
   else
-    request_handle:logError("REDIS-TRACKER: Test connectivity failed: " .. tostring(result))
+    request_handle:logError("REDIS-TRACKER: Request bookkeeping failed: " .. tostring(result))
   end
   
   -- Store the connection_id in request headers for cleanup in response
@@ -333,27 +395,26 @@ function envoy_on_response(response_handle)
       local client_ip = get_client_ip(response_handle)
       local current_time = get_current_time()
       
-      local success, result = pcall(function()
-        -- Track WebSocket connection with BACKEND pod IP (not Envoy pod IP)
-        redis_call(response_handle, "INCR", "ws:backend_pod_conn:" .. backend_pod_ip)
-        redis_call(response_handle, "EXPIRE", "ws:backend_pod_conn:" .. backend_pod_ip, 7200)
+      -- Track WebSocket connection with BACKEND pod IP (not Envoy pod IP); none of
+      -- these keys gate admission, so they all go through the write-behind buffer
+      local success, result = pcall(redis_pipeline, response_handle, {}, {
+        {"INCR", "ws:backend_pod_conn:" .. backend_pod_ip},
+        {"EXPIRE", "ws:backend_pod_conn:" .. backend_pod_ip, 7200},
         
         -- Add to backend pod active connections
-        redis_call(response_handle, "SADD", "ws:backend_active_pods", backend_pod_ip)
-        redis_call(response_handle, "EXPIRE", "ws:backend_active_pods", 7200)
+        {"SADD", "ws:backend_active_pods", backend_pod_ip},
+        {"EXPIRE", "ws:backend_active_pods", 7200},
         
         -- Store connection metadata with backend pod IP
-        redis_call(response_handle, "HMSET", "ws:backend_conn:" .. connection_id,
+        {"HSET", "ws:backend_conn:" .. connection_id,
           "backend_pod_ip", backend_pod_ip,
           "client_ip", client_ip,
           "established_time", current_time,
-          "upstream_host", upstream_host)
-        redis_call(response_handle, "EXPIRE", "ws:backend_conn:" .. connection_id, 7200)
-        
-        return "Backend connection tracked"
-      end)
+          "upstream_host", upstream_host},
+        {"EXPIRE", "ws:backend_conn:" .. connection_id, 7200}
+      })
       
-      if success then
+      if success and result then
         response_handle:logInfo(string.format("REDIS-TRACKER: WebSocket connection tracked to backend pod: %s", 
           backend_pod_ip))
       else
@@ -375,21 +436,20 @@ function envoy_on_response(response_handle)
         if upgrade_header and string.lower(upgrade_header) == "websocket" then
           response_handle:logInfo("REDIS-TRACKER: WebSocket upgrade failed, cleaning up")
           
-          -- Decrement pod connection count
-          redis_call(response_handle, "DECR", "ws:pod_conn:" .. pod_ip)
-          
-          -- Remove from global connections registry
-          redis_call(response_handle, "SREM", "ws:all_connections", connection_id)
-          
-          -- Remove connection metadata
-          redis_call(response_handle, "DEL", "ws:conn:" .. connection_id)
-          
-          -- Decrement proxy metrics
-          redis_call(response_handle, "DECR", "ws:proxy:" .. hostname .. ":connections")
-          
-          -- Increment rejected count
-          redis_call(response_handle, "INCR", "ws:rejected")
-          redis_call(response_handle, "EXPIRE", "ws:rejected", 7200)
+          redis_pipeline(response_handle, {
+            -- Decrement pod connection count (read by the admission check: synchronous)
+            {"DECR", "ws:pod_conn:" .. pod_ip}
+          }, {
+            -- Remove from global connections registry
+            {"SREM", "ws:all_connections", connection_id},
+            -- Remove connection metadata
+            {"DEL", "ws:conn:" .. connection_id},
+            -- Decrement proxy metrics
+            {"DECR", "ws:proxy:" .. hostname .. ":connections"},
+            -- Increment rejected count
+            {"INCR", "ws:rejected"},
+            {"EXPIRE", "ws:rejected", 7200}
+          })
         end
         
         return "Cleanup completed"
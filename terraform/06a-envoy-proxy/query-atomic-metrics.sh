@@ -2,9 +2,22 @@
 
 # Query scaling metrics for 06a-envoy-proxy atomic implementation
 # Provides comprehensive monitoring of connection limits and rate limiting
+#
+# Usage: query-atomic-metrics.sh [--scan]
+#   --scan  list keys with cursor-based SCAN (redis-cli --scan) instead of KEYS, which
+#           blocks Redis for the whole keyspace, and include the redis-reconciler's
+#           drift report when it is deployed
 
 set -e
 
+SCAN_MODE=false
+for arg in "$@"; do
+    case "$arg" in
+        --scan) SCAN_MODE=true ;;
+        *) echo "Usage: $0 [--scan]"; exit 1 ;;
+    esac
+done
+
 # Source configuration
 SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 CONFIG_FILE="$SCRIPT_DIR/../../config.env"
@@ -33,6 +46,15 @@ redis_exec() {
     kubectl exec -n "$NAMESPACE" deployment/redis-atomic -c redis -- redis-cli "$@"
 }
 
+# Function to list keys matching a pattern (SCAN with --scan, KEYS otherwise)
+list_keys() {
+    if [[ "$SCAN_MODE" == "true" ]]; then
+        redis_exec --scan --pattern "$1" --count 500
+    else
+        redis_exec KEYS "$1"
+    fi
+}
+
 # Function to get metrics with error handling
 get_metric() {
     local result
@@ -44,7 +66,7 @@ get_metric() {
 echo ""
 echo "📊 PER-BACKEND-POD CONNECTION COUNTS:"
 echo "-----------------------------------------------------------"
-backend_pod_keys=$(redis_exec KEYS "ws:backend_pod_conn:*" 2>/dev/null || echo "")
+backend_pod_keys=$(list_keys "ws:backend_pod_conn:*" 2>/dev/null || echo "")
 if [[ -n "$backend_pod_keys" ]]; then
     for key in $backend_pod_keys; do
         if [[ "$key" =~ ws:backend_pod_conn:(.+) ]]; then
@@ -61,7 +83,7 @@ fi
 echo ""
 echo "📊 ENVOY-POD CONNECTION COUNTS (for comparison):"
 echo "-----------------------------------------------------------"
-pod_keys=$(redis_exec KEYS "ws:pod_conn:*" 2>/dev/null || echo "")
+pod_keys=$(list_keys "ws:pod_conn:*" 2>/dev/null || echo "")
 if [[ -n "$pod_keys" ]]; then
     for key in $pod_keys; do
         if [[ "$key" =~ ws:pod_conn:(.+) ]]; then
@@ -90,7 +112,7 @@ echo "  Total Rejected Connections: $rejected_connections"
 echo ""
 echo "🔧 PROXY-SPECIFIC METRICS:"
 echo "-----------------------------------------------------------"
-proxy_keys=$(redis_exec KEYS "ws:proxy:*:connections" 2>/dev/null || echo "")
+proxy_keys=$(list_keys "ws:proxy:*:connections" 2>/dev/null || echo "")
 if [[ -n "$proxy_keys" ]]; then
     for key in $proxy_keys; do
         if [[ "$key" =~ ws:proxy:(.+):connections ]]; then
@@ -103,6 +125,34 @@ else
     echo "  No proxy-specific metrics found"
 fi
 
+# Reconciler drift report (counters vs live ws:conn:* hashes)
+if [[ "$SCAN_MODE" == "true" ]]; then
+    echo ""
+    echo "🧮 RECONCILER (counters vs live connections):"
+    echo "-----------------------------------------------------------"
+    reconciler_state=$(kubectl exec -n "$NAMESPACE" deployment/redis-reconciler -- python3 -c \
+        "import urllib.request; print(urllib.request.urlopen('http://localhost:8080/state', timeout=5).read().decode())" \
+        2>/dev/null || echo "")
+    if [[ -n "$reconciler_state" ]]; then
+        echo "$reconciler_state" | python3 -c '
+import json, sys
+state = json.load(sys.stdin)
+conns = state["connections"]
+print("  Passes: %s (last %ss, %ss ago), repair: %s" % (
+    state["passes"], state["last_pass_seconds"], state["last_pass_age_seconds"], state["repair"]))
+print("  Connection hashes: %s, registered: %s, stale members: %s, unregistered hashes: %s" % (
+    conns["hashes"], conns["registered"], conns["stale_members"], conns["unregistered_hashes"]))
+for kind, leaked in state["leaked"].items():
+    for ident, count in sorted(leaked.items()):
+        print("  Leaked %s %s: %s" % (kind, ident, count))
+if not any(state["leaked"].values()):
+    print("  No leaked counters")
+'
+    else
+        echo "  redis-reconciler not deployed (kubectl apply -f k8s/redis-reconciler.yaml)"
+    fi
+fi
+
 # Rate limiting status
 echo ""
 echo "⚡ RATE LIMITING STATUS:"
@@ -0,0 +1,34 @@
+-- Atomic per-pod connection admission (check-and-increment)
+-- KEYS[1]  ws:pod_conn:<pod-ip>
+-- ARGV     max_connections, connection_id, proxy_id, current_time, connection_ttl
+-- Returns  {1, new_count, "SUCCESS"} or {0, current_count, "LIMIT_EXCEEDED"}
+local pod_key = KEYS[1]
+local max_connections = tonumber(ARGV[1])
+local connection_id = ARGV[2]
+local proxy_id = ARGV[3]
+local current_time = ARGV[4]
+local connection_ttl = tonumber(ARGV[5]) or 7200
+local pod_id = string.match(pod_key, 'ws:pod_conn:(.+)')
+
+local current_count = tonumber(redis.call('GET', pod_key)) or 0
+if current_count >= max_connections then
+    return {0, current_count, "LIMIT_EXCEEDED"}
+end
+
+local new_count = redis.call('INCR', pod_key)
+redis.call('EXPIRE', pod_key, 86400)
+
+local conn_detail_key = 'ws:conn:' .. connection_id
+redis.call('HSET', conn_detail_key,
+    'pod_id', pod_id, 'proxy_id', proxy_id,
+    'created_at', current_time, 'last_seen', current_time)
+redis.call('EXPIRE', conn_detail_key, connection_ttl)
+
+redis.call('SADD', 'ws:all_connections', connection_id)
+redis.call('SADD', 'ws:active_pods', pod_id)
+
+local proxy_key = 'ws:proxy:' .. proxy_id .. ':connections'
+redis.call('INCR', proxy_key)
+redis.call('EXPIRE', proxy_key, 86400)
+
+return {1, new_count, "SUCCESS"}
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+HTTP-to-Redis bridge for the Envoy Lua connection trackers
+
+Envoy's Lua filter can only reach Redis through request_handle:httpCall, so the
+trackers talk to this bridge. It runs on one asyncio loop with a pooled
+redis.asyncio client, so a slow Redis reply never blocks other requests.
+
+Endpoints:
+- POST /redis-cmd       one whitespace-separated command, plain-text reply (legacy)
+- POST /redis/pipeline  several commands and named scripts in one Redis round trip
+- POST /redis/batch     bookkeeping writes for the write-behind buffer (202, no Redis wait)
+- GET  /redis/scripts   registered scripts and their SHA1s
+- GET  /health          Redis PING
+- GET  /metrics         Prometheus text format
+
+/redis/pipeline body:
+    {"commands": [["INCR", "ws:attempts"], ["EXPIRE", "ws:attempts", 7200],
+                  {"script": "admit", "keys": ["ws:pod_conn:10.0.1.2"], "args": [2, "c1", "envoy-1", 1700000000]}],
+     "transaction": false,
+     "deferred": [["HSET", "ws:conn:c1", "status", "connected"], ["SADD", "ws:all_connections", "c1"]]}
+
+"deferred" (optional) holds writes that do not need to be visible before the reply;
+they go to the write-behind buffer (see writebehind.py) and only "commands" produce
+results. /redis/batch takes {"deferred": [...]} alone. With BATCH_MODE=off deferred
+writes run synchronously in the same pipeline.
+
+Scripts are the *.lua files next to this module, run with EVALSHA; after a Redis
+restart (NOSCRIPT) they are reloaded and the failed calls retried once, except in a
+transaction ("transaction": true), where the NOSCRIPT errors are returned as is: the
+rest of the MULTI/EXEC has already been applied. The reply is
+    {"results": [{"ok": true, "value": 1}, {"ok": false, "error": "..."}, ...]}
+or, with ?format=lines (easier to parse from Lua), one line per command:
+    +<value>    (list values are space-separated; newlines escaped as \n)
+    _           (nil)
+    -<error>
+"""
+
+import asyncio
+import glob
+import hashlib
+import logging
+import os
+import time
+from typing import Any, Dict, List, Tuple
+
+import redis.asyncio as aioredis
+from aiohttp import web
+from redis.exceptions import NoScriptError, RedisError
+
+from writebehind import WriteBehind
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('redis-bridge')
+
+MAX_PIPELINE = int(os.getenv('BRIDGE_MAX_PIPELINE', '256'))
+
+
+class ScriptRegistry:
+    """Named Lua scripts loaded from *.lua files and addressed by SHA1"""
+
+    def __init__(self, directory: str):
+        self.sources: Dict[str, str] = {}
+        self.shas: Dict[str, str] = {}
+        for path in sorted(glob.glob(os.path.join(directory, '*.lua'))):
+            name = os.path.splitext(os.path.basename(path))[0]
+            with open(path) as f:
+                source = f.read()
+            self.sources[name] = source
+            self.shas[name] = hashlib.sha1(source.encode()).hexdigest()
+
+    async def load(self, client: aioredis.Redis) -> None:
+        """SCRIPT LOAD every script (idempotent; needed after Redis restarts or flushes)"""
+        for name, source in self.sources.items():
+            await client.script_load(source)
+        logger.info(f"Loaded scripts: {', '.join(self.sources) or 'none'}")
+
+    def command(self, name: str, keys: List[Any], args: List[Any]) -> Tuple:
+        if name not in self.shas:
+            raise ValueError(f'unknown script "{name}"')
+        return ('EVALSHA', self.shas[name], len(keys), *keys, *args)
+
+
+class BridgeMetrics:
+    """Counters rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self.requests: Dict[str, int] = {}
+        self.commands = 0
+        self.command_errors = 0
+        self.script_reloads = 0
+        self.pipeline_seconds = 0.0
+        self.pipelines = 0
+
+    def request(self, endpoint: str) -> None:
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def render(self) -> str:
+        lines = ['# HELP redis_bridge_requests_total HTTP requests by endpoint',
+                 '# TYPE redis_bridge_requests_total counter']
+        lines += [f'redis_bridge_requests_total{{endpoint="{endpoint}"}} {count}'
+                  for endpoint, count in sorted(self.requests.items())]
+        for name, kind, help_text, value in (
+            ('redis_bridge_commands_total', 'counter', 'Redis commands executed', self.commands),
+            ('redis_bridge_command_errors_total', 'counter', 'Redis commands that returned an error', self.command_errors),
+            ('redis_bridge_script_reloads_total', 'counter', 'Script reloads after NOSCRIPT', self.script_reloads),
+            ('redis_bridge_pipelines_total', 'counter', 'Pipelines executed', self.pipelines),
+            ('redis_bridge_pipeline_seconds_total', 'counter', 'Time spent executing pipelines', round(self.pipeline_seconds, 6)),
+        ):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+
+def _is_arguments(value: Any) -> bool:
+    return isinstance(value, list) and all(isinstance(a, (str, int, float)) for a in value)
+
+
+def _parse_command(entry: Any) -> Tuple:
+    if entry and _is_arguments(entry):
+        return tuple(entry)
+    raise ValueError(f'invalid command entry: {entry!r}')
+
+
+def _parse_script(entry: Dict[str, Any], scripts: ScriptRegistry) -> Tuple:
+    keys, args = entry.get('keys', []), entry.get('args', [])
+    if not _is_arguments(keys) or not _is_arguments(args):
+        raise ValueError(f'script "keys" and "args" must be lists of strings or numbers: {entry!r}')
+    return scripts.command(str(entry['script']), keys, args)
+
+
+def parse_pipeline(body: Any, scripts: ScriptRegistry) -> Tuple[List[Tuple], bool, List[Tuple]]:
+    """Validate a /redis/pipeline body into (commands, transaction, deferred)"""
+    if not isinstance(body, dict):
+        raise ValueError('body must be a JSON object with a "commands" list')
+    entries = body.get('commands', [])
+    deferred = body.get('deferred', [])
+    if not isinstance(entries, list) or not isinstance(deferred, list):
+        raise ValueError('"commands" and "deferred" must be lists')
+    if not entries and not deferred:
+        raise ValueError('body must have a non-empty "commands" or "deferred" list')
+    if len(entries) > MAX_PIPELINE or len(deferred) > MAX_PIPELINE:
+        raise ValueError(f'"commands" and "deferred" hold at most {MAX_PIPELINE} entries each')
+    commands = []
+    for entry in entries:
+        if isinstance(entry, dict) and 'script' in entry:
+            commands.append(_parse_script(entry, scripts))
+        else:
+            commands.append(_parse_command(entry))
+    return commands, bool(body.get('transaction', False)), [_parse_command(e) for e in deferred]
+
+
+def _line_value(value: Any) -> str:
+    return '' if value is None else str(value).replace('\n', '\\n')
+
+
+def format_lines(results: List[Any]) -> str:
+    lines = []
+    for result in results:
+        if isinstance(result, Exception):
+            lines.append('-' + _line_value(result))
+        elif result is None:
+            lines.append('_')
+        elif isinstance(result, (list, tuple, set)):
+            lines.append('+' + ' '.join(_line_value(v) for v in result))
+        else:
+            lines.append('+' + _line_value(result))
+    return '\n'.join(lines) + '\n'
+
+
+class RedisBridge:
+    def __init__(self, client: aioredis.Redis, scripts: ScriptRegistry):
+        self.client = client
+        self.scripts = scripts
+        self.metrics = BridgeMetrics()
+        self.write_behind = WriteBehind(self.execute)
+
+    async def execute(self, commands: List[Tuple], transaction: bool = False) -> List[Any]:
+        """Run commands in one round trip; errors are returned in place, not raised"""
+        started = time.perf_counter()
+        results = await self._run(commands, transaction)
+        retry = [i for i, result in enumerate(results) if isinstance(result, NoScriptError)]
+        if retry:
+            # Redis lost its script cache (restart/flush): reload, then retry just those calls.
+            # In a transaction the other commands have already been applied by EXEC, and re-running
+            # the scripts alone would put them outside it: the NOSCRIPT errors are returned instead
+            # and the caller's next request finds the scripts loaded
+            self.metrics.script_reloads += 1
+            await self.scripts.load(self.client)
+            if not transaction:
+                for i, result in zip(retry, await self._run([commands[i] for i in retry], False)):
+                    results[i] = result
+        self.metrics.pipelines += 1
+        self.metrics.commands += len(commands)
+        self.metrics.command_errors += sum(1 for r in results if isinstance(r, Exception))
+        self.metrics.pipeline_seconds += time.perf_counter() - started
+        return results
+
+    async def _run(self, commands: List[Tuple], transaction: bool) -> List[Any]:
+        async with self.client.pipeline(transaction=transaction) as pipe:
+            for command in commands:
+                pipe.execute_command(*command)
+            return await pipe.execute(raise_on_error=False)
+
+    # ---- HTTP handlers ------------------------------------------------------
+
+    async def handle_redis_command(self, request: web.Request) -> web.Response:
+        """Legacy single-command endpoint used by the original Lua trackers"""
+        self.metrics.request('redis-cmd')
+        parts = (await request.text()).strip().split()
+        if not parts:
+            return web.Response(text='Empty command', status=400)
+        try:
+            result = (await self.execute([tuple(parts)]))[0]
+        except RedisError as e:
+            return web.Response(text=f'Error: {e}', status=500)
+        if isinstance(result, Exception):
+            return web.Response(text=f'Error: {result}', status=500)
+        return web.Response(text=str(result))
+
+    async def handle_pipeline(self, request: web.Request) -> web.Response:
+        self.metrics.request('pipeline')
+        try:
+            commands, transaction, deferred = parse_pipeline(await request.json(), self.scripts)
+            self.write_behind.validate(deferred)
+        except ValueError as e:
+            return web.json_response({'error': str(e)}, status=400)
+        if self.write_behind.enabled:
+            self.write_behind.submit(deferred)
+            deferred = []
+        try:
+            # With batching disabled the deferred writes ride along in the same round trip
+            results = (await self.execute(commands + deferred, transaction))[:len(commands)] \
+                if commands or deferred else []
+        except RedisError as e:
+            return web.json_response({'error': str(e)}, status=502)
+        if request.query.get('format') == 'lines':
+            return web.Response(text=format_lines(results))
+        return web.json_response({'results': [
+            {'ok': False, 'error': str(r)} if isinstance(r, Exception)
+            else {'ok': True, 'value': sorted(r) if isinstance(r, set) else r}
+            for r in results
+        ]})
+
+    async def handle_batch(self, request: web.Request) -> web.Response:
+        """Deferred writes only: accepted without waiting for Redis"""
+        self.metrics.request('batch')
+        try:
+            body = await request.json()
+            if not isinstance(body, dict) or 'commands' in body:
+                raise ValueError('body must be a JSON object with only a "deferred" list')
+            _, _, deferred = parse_pipeline(body, self.scripts)
+            self.write_behind.validate(deferred)
+        except ValueError as e:
+            return web.json_response({'error': str(e)}, status=400)
+        if not self.write_behind.enabled:
+            try:
+                await self.execute(deferred)
+            except RedisError as e:
+                return web.json_response({'error': str(e)}, status=502)
+            return web.json_response({'queued': 0})
+        return web.json_response({'queued': self.write_behind.submit(deferred)}, status=202)
+
+    async def handle_scripts(self, request: web.Request) -> web.Response:
+        return web.json_response(self.scripts.shas)
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        try:
+            await asyncio.wait_for(self.client.ping(), timeout=2)
+            return web.Response(text='OK')
+        except (RedisError, asyncio.TimeoutError, OSError):
+            return web.Response(text='Redis unavailable', status=503)
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.metrics.render() + self.write_behind.render(),
+                            content_type='text/plain')
+
+    async def on_startup(self, app: web.Application) -> None:
+        try:
+            await self.scripts.load(self.client)
+        except (RedisError, OSError) as e:
+            # Redis may start after the bridge; scripts are loaded on first NOSCRIPT instead
+            logger.warning(f"Could not preload scripts: {e}")
+        self.write_behind.start()
+
+    async def on_cleanup(self, app: web.Application) -> None:
+        # Pending bookkeeping writes are flushed before the pool closes
+        await self.write_behind.close()
+        await self.client.aclose()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/redis-cmd', self.handle_redis_command)
+        app.router.add_post('/redis/pipeline', self.handle_pipeline)
+        app.router.add_post('/redis/batch', self.handle_batch)
+        app.router.add_get('/redis/scripts', self.handle_scripts)
+        app.router.add_get('/health', self.handle_health)
+        app.router.add_get('/metrics', self.handle_metrics)
+        app.on_startup.append(self.on_startup)
+        app.on_cleanup.append(self.on_cleanup)
+        return app
+
+
+def create_client() -> aioredis.Redis:
+    pool = aioredis.BlockingConnectionPool(
+        host=os.getenv('REDIS_HOST', 'localhost'),
+        port=int(os.getenv('REDIS_PORT', '6379')),
+        max_connections=int(os.getenv('REDIS_POOL_SIZE', '20')),
+        timeout=float(os.getenv('REDIS_POOL_TIMEOUT', '2')),
+        socket_timeout=float(os.getenv('REDIS_SOCKET_TIMEOUT', '5')),
+        decode_responses=True,
+    )
+    return aioredis.Redis(connection_pool=pool)
+
+
+def main() -> None:
+    scripts = ScriptRegistry(os.getenv('SCRIPT_DIR', os.path.dirname(os.path.abspath(__file__))))
+    bridge = RedisBridge(create_client(), scripts)
+    web.run_app(bridge.app(), host='0.0.0.0', port=int(os.getenv('BRIDGE_PORT', '8080')))
+
+
+if __name__ == '__main__':
+    main()
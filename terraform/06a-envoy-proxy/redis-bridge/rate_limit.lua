@@ -0,0 +1,9 @@
+-- Fixed-window request counter
+-- KEYS[1]  ws:rate_limit:<minute>
+-- ARGV     window_seconds (default 60)
+-- Returns  the request count in the current window
+local current = redis.call('INCR', KEYS[1])
+if current == 1 then
+    redis.call('EXPIRE', KEYS[1], tonumber(ARGV[1]) or 60)
+end
+return current
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+Connection-tracking reconciler and metrics exporter
+
+Runs next to the redis-http-bridge and keeps an in-memory view of the tracking keys
+without ever issuing an O(N) blocking command (KEYS, SMEMBERS, HGETALL on sets):
+1. Every RECONCILE_INTERVAL seconds one cursor-based SCAN pass walks the keyspace
+   (MATCH ws:*, COUNT SCAN_COUNT); each page is classified and read back in one
+   pipeline: GET for the ws:pod_conn:*, ws:backend_pod_conn:* and ws:proxy:*:connections
+   counters, HMGET pod_id/proxy_id plus SISMEMBER ws:all_connections for ws:conn:* hashes
+2. ws:all_connections is walked with SSCAN; each page is checked with pipelined EXISTS
+   ws:conn:<id>, so registry members whose hash is gone are found without loading the set
+3. The view is updated in place as pages arrive; keys not seen by the end of a pass are
+   dropped from it. Pages are spaced by SCAN_PAUSE_MS so a pass is a trickle of small
+   commands rather than a burst
+4. After each pass every ws:pod_conn:<pod> (and ws:proxy:<id>:connections) counter is
+   compared with the live connections for it: ws:conn:* hashes that are also members of
+   ws:all_connections. Positive drift is a leaked count, e.g. from an Envoy that crashed
+   before its release ran
+
+With RECONCILE_REPAIR=on, drift seen in RECONCILE_CONFIRM_PASSES consecutive passes is
+repaired: the counter is lowered by the smallest drift observed (never below zero, in one
+script call) and stale registry members are removed with SREM. Connection hashes expire
+after the tracker's CONNECTION_TTL, so connections older than that look leaked: only
+enable repairs when the TTL exceeds connection lifetimes.
+
+Endpoints: GET /metrics (Prometheus text), GET /state (JSON), GET /health. /health fails
+when Redis does not answer or no pass has finished for RECONCILE_STALE_AFTER seconds
+(default three intervals), so a wedged reconciler gets restarted.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import redis.asyncio as aioredis
+from aiohttp import web
+from redis.exceptions import RedisError
+
+from bridge import create_client
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('redis-reconciler')
+
+ALL_CONNECTIONS = 'ws:all_connections'
+CONN_PREFIX = 'ws:conn:'
+# Counter key prefix/suffix -> kind; the id is what lies between them
+COUNTERS = (
+    ('ws:pod_conn:', '', 'pod'),
+    ('ws:backend_pod_conn:', '', 'backend_pod'),
+    ('ws:proxy:', ':connections', 'proxy'),
+)
+# Counters that have live connections to be reconciled against
+RECONCILED = ('pod', 'proxy')
+
+# Lowers a leaked counter by the confirmed drift, never below zero; returns the amount
+REPAIR_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1])) or 0
+local fix = math.min(tonumber(ARGV[1]), current)
+if fix > 0 then
+    redis.call('DECRBY', KEYS[1], fix)
+end
+return fix
+"""
+
+
+def classify(key: str) -> Tuple[Optional[str], str]:
+    """(kind, id) of a tracking key: a counter kind, 'conn', or None for keys not tracked"""
+    if key.startswith(CONN_PREFIX):
+        return 'conn', key[len(CONN_PREFIX):]
+    for prefix, suffix, kind in COUNTERS:
+        if key.startswith(prefix) and key.endswith(suffix):
+            return kind, key[len(prefix):len(key) - len(suffix)]
+    return None, key
+
+
+def counter_key(kind: str, ident: str) -> str:
+    for prefix, suffix, counter_kind in COUNTERS:
+        if counter_kind == kind:
+            return f'{prefix}{ident}{suffix}'
+    raise ValueError(kind)
+
+
+class KeyspaceView:
+    """Tracking state as of the last SCAN pages, updated in place"""
+
+    def __init__(self):
+        self.generation = 0
+        self.counters: Dict[str, Dict[str, List[int]]] = {kind: {} for _, _, kind in COUNTERS}  # id -> [value, gen]
+        self.connections: Dict[str, List[Any]] = {}  # conn id -> [pod_id, proxy_id, registered, gen]
+        self.live: Dict[str, Dict[str, int]] = {kind: {} for kind in RECONCILED}
+        self.unregistered_hashes = 0  # ws:conn:* hashes missing from ws:all_connections
+
+    def set_counter(self, kind: str, ident: str, value: int) -> None:
+        self.counters[kind][ident] = [value, self.generation]
+
+    def _count(self, pod: str, proxy: str, registered: bool, delta: int) -> None:
+        if not registered:
+            self.unregistered_hashes += delta
+            return
+        for kind, ident in (('pod', pod), ('proxy', proxy)):
+            live = self.live[kind]
+            live[ident] = live.get(ident, 0) + delta
+            if not live[ident]:
+                del live[ident]
+
+    def set_connection(self, conn_id: str, pod: str, proxy: str, registered: bool) -> None:
+        entry = self.connections.get(conn_id)
+        if entry is not None:
+            if entry[:3] == [pod, proxy, registered]:
+                entry[3] = self.generation
+                return
+            self._count(entry[0], entry[1], entry[2], -1)
+        self.connections[conn_id] = [pod, proxy, registered, self.generation]
+        self._count(pod, proxy, registered, 1)
+
+    def purge(self) -> int:
+        """Forget keys that were not seen during the pass that just finished"""
+        generation, purged = self.generation, 0
+        for counters in self.counters.values():
+            for ident in [i for i, entry in counters.items() if entry[1] != generation]:
+                del counters[ident]
+                purged += 1
+        for conn_id in [c for c, entry in self.connections.items() if entry[3] != generation]:
+            entry = self.connections.pop(conn_id)
+            self._count(entry[0], entry[1], entry[2], -1)
+            purged += 1
+        return purged
+
+    def drift(self, kind: str) -> Dict[str, int]:
+        """Counter minus live connections, for every id with either"""
+        counters, live = self.counters[kind], self.live[kind]
+        return {ident: counters.get(ident, [0])[0] - live.get(ident, 0) for ident in set(counters) | set(live)}
+
+
+class Reconciler:
+    def __init__(self, client: aioredis.Redis):
+        self.client = client
+        self.view = KeyspaceView()
+        self.interval = float(os.getenv('RECONCILE_INTERVAL', '30'))
+        self.scan_count = int(os.getenv('SCAN_COUNT', '500'))
+        self.scan_pause = float(os.getenv('SCAN_PAUSE_MS', '5')) / 1000
+        self.repair = os.getenv('RECONCILE_REPAIR', 'off').lower() in ('on', 'true', '1')
+        self.confirm_passes = max(1, int(os.getenv('RECONCILE_CONFIRM_PASSES', '2')))
+        self.stale_after = float(os.getenv('RECONCILE_STALE_AFTER', str(3 * self.interval)))
+        self.started_at = time.time()
+        self.repair_script = client.register_script(REPAIR_SCRIPT)
+        self._task: Optional[asyncio.Task] = None
+
+        # Drift and stale members as seen by recent passes (most recent last)
+        self.drift_history: Dict[str, List[Dict[str, int]]] = {kind: [] for kind in RECONCILED}
+        self.stale_history: List[Set[str]] = []
+        self.registered = 0
+
+        self.passes = 0
+        self.pass_failures = 0
+        self.scan_calls = 0
+        self.keys_scanned = 0
+        self.last_pass_seconds = 0.0
+        self.last_pass_at = 0.0
+        self.repairs: Dict[str, int] = {'counter': 0, 'counter_amount': 0, 'stale_member': 0}
+
+    # ---- scanning -----------------------------------------------------------
+
+    async def _read_page(self, keys: List[str]) -> None:
+        """Read one SCAN page back in a single pipeline and fold it into the view"""
+        tracked = [(key, *classify(key)) for key in keys]
+        tracked = [entry for entry in tracked if entry[1] is not None]
+        if not tracked:
+            return
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key, kind, ident in tracked:
+                if kind == 'conn':
+                    pipe.hmget(key, 'pod_id', 'proxy_id')
+                    pipe.sismember(ALL_CONNECTIONS, ident)
+                else:
+                    pipe.get(key)
+            results = await pipe.execute(raise_on_error=False)
+        position = 0
+        for key, kind, ident in tracked:
+            if kind == 'conn':
+                fields, registered = results[position], results[position + 1]
+                position += 2
+                if isinstance(fields, list) and any(f is not None for f in fields):
+                    self.view.set_connection(ident, fields[0] or 'unknown', fields[1] or 'unknown',
+                                             bool(registered) and not isinstance(registered, Exception))
+            else:
+                value = results[position]
+                position += 1
+                try:
+                    self.view.set_counter(kind, ident, int(value))
+                except (TypeError, ValueError):
+                    # Gone since the SCAN (None) or not a counter: skip, the next pass decides
+                    pass
+
+    async def _scan_keys(self) -> None:
+        cursor = 0
+        while True:
+            cursor, keys = await self.client.scan(cursor, match='ws:*', count=self.scan_count)
+            self.scan_calls += 1
+            self.keys_scanned += len(keys)
+            await self._read_page(keys)
+            if cursor == 0:
+                return
+            await asyncio.sleep(self.scan_pause)
+
+    async def _scan_registry(self) -> Set[str]:
+        """Members of ws:all_connections whose ws:conn:* hash no longer exists"""
+        stale: Set[str] = set()
+        registered = 0
+        cursor = 0
+        while True:
+            cursor, members = await self.client.sscan(ALL_CONNECTIONS, cursor, count=self.scan_count)
+            self.scan_calls += 1
+            registered += len(members)
+            if members:
+                async with self.client.pipeline(transaction=False) as pipe:
+                    for member in members:
+                        pipe.exists(CONN_PREFIX + member)
+                    exists = await pipe.execute(raise_on_error=False)
+                stale.update(m for m, e in zip(members, exists) if e == 0)
+            if cursor == 0:
+                # SSCAN may return a member more than once; the count is approximate under churn
+                self.registered = registered
+                return stale
+            await asyncio.sleep(self.scan_pause)
+
+    # ---- reconciliation -----------------------------------------------------
+
+    def _confirmed(self, history: List[Dict[str, int]]) -> Dict[str, int]:
+        """Ids with positive drift in each of the last confirm_passes passes, and the smallest drift"""
+        if len(history) < self.confirm_passes:
+            return {}
+        recent = history[-self.confirm_passes:]
+        confirmed = {}
+        for ident, drift in recent[-1].items():
+            smallest = min(passes.get(ident, 0) for passes in recent)
+            if drift > 0 and smallest > 0:
+                confirmed[ident] = smallest
+        return confirmed
+
+    async def _repair(self) -> None:
+        for kind in RECONCILED:
+            history = self.drift_history[kind]
+            for ident, amount in self._confirmed(history).items():
+                fixed = int(await self.repair_script(keys=[counter_key(kind, ident)], args=[amount]))
+                if fixed:
+                    self.repairs['counter'] += 1
+                    self.repairs['counter_amount'] += fixed
+                    logger.warning(f"Repaired {counter_key(kind, ident)}: -{fixed} leaked connections")
+                # Drift left after a repair must be confirmed again from scratch
+                for passes in history:
+                    passes.pop(ident, None)
+        if len(self.stale_history) >= self.confirm_passes:
+            members = sorted(set.intersection(*self.stale_history[-self.confirm_passes:]))
+            for start in range(0, len(members), self.scan_count):
+                self.repairs['stale_member'] += await self.client.srem(
+                    ALL_CONNECTIONS, *members[start:start + self.scan_count])
+            if members:
+                logger.warning(f"Removed {len(members)} stale members of {ALL_CONNECTIONS}")
+                for passes in self.stale_history:
+                    passes.difference_update(members)
+
+    async def run_pass(self) -> None:
+        started = time.perf_counter()
+        self.view.generation += 1
+        await self._scan_keys()
+        stale = await self._scan_registry()
+        self.view.purge()
+        for kind in RECONCILED:
+            history = self.drift_history[kind]
+            history.append(self.view.drift(kind))
+            del history[:-self.confirm_passes]
+        self.stale_history.append(stale)
+        del self.stale_history[:-self.confirm_passes]
+        if self.repair:
+            await self._repair()
+        self.passes += 1
+        self.last_pass_seconds = time.perf_counter() - started
+        self.last_pass_at = time.time()
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.run_pass()
+            except (RedisError, OSError) as e:
+                self.pass_failures += 1
+                logger.warning(f"Reconcile pass failed: {e}")
+            except Exception:
+                # Anything else is a bug, but the loop must outlive it; /health reports staleness
+                self.pass_failures += 1
+                logger.exception("Reconcile pass failed unexpectedly")
+            await asyncio.sleep(self.interval)
+
+    # ---- reporting ----------------------------------------------------------
+
+    def leaked(self, kind: str) -> Dict[str, int]:
+        latest = self.drift_history[kind][-1] if self.drift_history[kind] else {}
+        return {ident: drift for ident, drift in latest.items() if drift > 0}
+
+    def state(self) -> Dict[str, Any]:
+        view = self.view
+        return {
+            'passes': self.passes,
+            'last_pass_seconds': round(self.last_pass_seconds, 3),
+            'last_pass_age_seconds': round(time.time() - self.last_pass_at, 1) if self.last_pass_at else None,
+            'repair': self.repair,
+            'connections': {
+                'hashes': len(view.connections),
+                'registered': self.registered,
+                'unregistered_hashes': view.unregistered_hashes,
+                'stale_members': len(self.stale_history[-1]) if self.stale_history else 0,
+            },
+            'counters': {kind: {ident: entry[0] for ident, entry in sorted(counters.items())}
+                         for kind, counters in view.counters.items()},
+            'live': {kind: dict(sorted(live.items())) for kind, live in view.live.items()},
+            'leaked': {kind: self.leaked(kind) for kind in RECONCILED},
+            'repairs': dict(self.repairs),
+        }
+
+    def render(self) -> str:
+        view = self.view
+        lines = []
+        for kind, counters in view.counters.items():
+            name = f'redis_reconciler_{kind}_connections'
+            lines += [f'# HELP {name} ws:{kind} connection counter as last scanned', f'# TYPE {name} gauge']
+            lines += [f'{name}{{{kind}="{ident}"}} {entry[0]}' for ident, entry in sorted(counters.items())]
+        for kind in RECONCILED:
+            name = f'redis_reconciler_{kind}_live_connections'
+            lines += [f'# HELP {name} Registered ws:conn:* hashes per {kind}', f'# TYPE {name} gauge']
+            lines += [f'{name}{{{kind}="{ident}"}} {count}' for ident, count in sorted(view.live[kind].items())]
+            name = f'redis_reconciler_{kind}_leaked_connections'
+            lines += [f'# HELP {name} Counter minus live connections, where positive', f'# TYPE {name} gauge']
+            lines += [f'{name}{{{kind}="{ident}"}} {drift}' for ident, drift in sorted(self.leaked(kind).items())]
+        lines += ['# HELP redis_reconciler_repairs_total Repairs applied with RECONCILE_REPAIR=on',
+                  '# TYPE redis_reconciler_repairs_total counter',
+                  f'redis_reconciler_repairs_total{{kind="counter"}} {self.repairs["counter"]}',
+                  f'redis_reconciler_repairs_total{{kind="stale_member"}} {self.repairs["stale_member"]}']
+        state = self.state()['connections']
+        for name, kind, help_text, value in (
+            ('redis_reconciler_connection_hashes', 'gauge', 'ws:conn:* hashes seen in the last pass', state['hashes']),
+            ('redis_reconciler_registered_connections', 'gauge', 'Members of ws:all_connections', state['registered']),
+            ('redis_reconciler_unregistered_hashes', 'gauge', 'ws:conn:* hashes missing from ws:all_connections', state['unregistered_hashes']),
+            ('redis_reconciler_stale_members', 'gauge', 'ws:all_connections members without a ws:conn:* hash', state['stale_members']),
+            ('redis_reconciler_repaired_connections_total', 'counter', 'Leaked connections removed from counters', self.repairs['counter_amount']),
+            ('redis_reconciler_passes_total', 'counter', 'Completed reconcile passes', self.passes),
+            ('redis_reconciler_pass_failures_total', 'counter', 'Reconcile passes aborted by Redis errors', self.pass_failures),
+            ('redis_reconciler_scan_calls_total', 'counter', 'SCAN/SSCAN calls issued', self.scan_calls),
+            ('redis_reconciler_keys_scanned_total', 'counter', 'Keys returned by SCAN', self.keys_scanned),
+            ('redis_reconciler_last_pass_seconds', 'gauge', 'Duration of the last pass, pauses included', round(self.last_pass_seconds, 6)),
+            ('redis_reconciler_last_pass_timestamp_seconds', 'gauge', 'Unix time the last pass finished', round(self.last_pass_at, 3)),
+        ):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+    # ---- HTTP handlers ------------------------------------------------------
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.render(), content_type='text/plain')
+
+    async def handle_state(self, request: web.Request) -> web.Response:
+        return web.json_response(self.state())
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        age = time.time() - (self.last_pass_at or self.started_at)
+        if self._task is None or self._task.done() or age > self.stale_after:
+            return web.Response(text=f'No reconcile pass finished for {age:.0f}s', status=503)
+        try:
+            await asyncio.wait_for(self.client.ping(), timeout=2)
+            return web.Response(text='OK')
+        except (RedisError, asyncio.TimeoutError, OSError):
+            return web.Response(text='Redis unavailable', status=503)
+
+    async def on_startup(self, app: web.Application) -> None:
+        if self.repair:
+            try:
+                await self.client.script_load(REPAIR_SCRIPT)
+            except (RedisError, OSError) as e:
+                # Redis may start after the reconciler; the script is loaded on first NOSCRIPT instead
+                logger.warning(f"Could not preload the repair script: {e}")
+        self._task = asyncio.ensure_future(self.run())
+        logger.info(f"Reconciling every {self.interval:g}s (SCAN COUNT {self.scan_count}, "
+                    f"repair {'on' if self.repair else 'off'})")
+
+    async def on_cleanup(self, app: web.Application) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        await self.client.aclose()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle_metrics)
+        app.router.add_get('/state', self.handle_state)
+        app.router.add_get('/health', self.handle_health)
+        app.on_startup.append(self.on_startup)
+        app.on_cleanup.append(self.on_cleanup)
+        return app
+
+
+def main() -> None:
+    reconciler = Reconciler(create_client())
+    web.run_app(reconciler.app(), host='0.0.0.0', port=int(os.getenv('RECONCILER_PORT', '8080')))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+-- Atomic connection removal
+-- KEYS[1]  ws:pod_conn:<pod-ip>
+-- ARGV     connection_id, proxy_id
+-- Returns  {1, new_count, "SUCCESS"} or {0, 0, "ALREADY_ZERO"}
+local pod_key = KEYS[1]
+local connection_id = ARGV[1]
+local proxy_id = ARGV[2]
+
+local current_count = tonumber(redis.call('GET', pod_key)) or 0
+if current_count <= 0 then
+    return {0, 0, "ALREADY_ZERO"}
+end
+
+local new_count = redis.call('DECR', pod_key)
+if new_count < 0 then
+    redis.call('SET', pod_key, 0)
+    new_count = 0
+end
+
+redis.call('DEL', 'ws:conn:' .. connection_id)
+redis.call('SREM', 'ws:all_connections', connection_id)
+
+local proxy_key = 'ws:proxy:' .. proxy_id .. ':connections'
+if redis.call('DECR', proxy_key) < 0 then
+    redis.call('SET', proxy_key, 0)
+end
+
+return {1, new_count, "SUCCESS"}
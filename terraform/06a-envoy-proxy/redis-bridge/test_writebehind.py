@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Coalescing and retry rules of the write-behind buffer (python3 -m unittest test_writebehind)"""
+
+import asyncio
+import time
+import unittest
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from writebehind import Batch, WriteBehind
+
+
+def batch_of(*commands):
+    batch = Batch()
+    for command in commands:
+        batch.add(command)
+    return batch
+
+
+class BatchCommandsTest(unittest.TestCase):
+
+    def test_counters_net_to_one_incrby(self):
+        batch = batch_of(('INCR', 'ws:attempts'), ('INCRBY', 'ws:attempts', 5), ('DECR', 'ws:attempts'),
+                         ('DECRBY', 'ws:attempts', 2), ('INCR', 'ws:events'), ('DECR', 'ws:events'))
+        self.assertEqual(batch.commands(), [('INCRBY', 'ws:attempts', 3)])
+        self.assertEqual(len(batch), 6)
+
+    def test_set_members_last_operation_wins(self):
+        batch = batch_of(('SADD', 'ws:all', 'c1', 'c2'), ('SREM', 'ws:all', 'c1'), ('SADD', 'ws:all', 'c3'),
+                         ('SREM', 'ws:all', 'c3'), ('SADD', 'ws:all', 'c3'))
+        self.assertEqual(batch.commands(), [('SADD', 'ws:all', 'c2', 'c3'), ('SREM', 'ws:all', 'c1')])
+
+    def test_hash_fields_last_value_wins(self):
+        batch = batch_of(('HSET', 'ws:conn:c1', 'status', 'connecting', 'pod', 'p1'),
+                         ('HMSET', 'ws:conn:c1', 'status', 'connected'), ('EXPIRE', 'ws:conn:c1', 60),
+                         ('EXPIRE', 'ws:conn:c1', 120))
+        self.assertEqual(batch.commands(), [('HSET', 'ws:conn:c1', 'status', 'connected', 'pod', 'p1'),
+                                            ('EXPIRE', 'ws:conn:c1', 120)])
+
+    def test_del_discards_earlier_writes_and_runs_first(self):
+        batch = batch_of(('HSET', 'ws:conn:c1', 'status', 'connected'), ('INCR', 'ws:n'), ('SADD', 'ws:s', 'a'),
+                         ('DEL', 'ws:conn:c1'), ('DEL', 'ws:s'), ('HSET', 'ws:conn:c1', 'status', 'closed'),
+                         ('EXPIRE', 'ws:conn:c1', 30))
+        self.assertEqual(batch.commands(), [('DEL', 'ws:conn:c1', 'ws:s'), ('INCRBY', 'ws:n', 1),
+                                            ('HSET', 'ws:conn:c1', 'status', 'closed'),
+                                            ('EXPIRE', 'ws:conn:c1', 30)])
+
+    def test_set_replaces_value_and_clears_pending_ttl(self):
+        batch = batch_of(('EXPIRE', 'ws:k', 10), ('INCR', 'ws:k'), ('SET', 'ws:k', 'a'), ('SET', 'ws:k', 'b', 'EX', 5),
+                         ('DEL', 'ws:gone'), ('SET', 'ws:gone', 'back'))
+        self.assertEqual(batch.commands(), [('DEL', 'ws:gone'), ('SET', 'ws:k', 'b', 'EX', 5),
+                                            ('SET', 'ws:gone', 'back')])
+
+    def test_merge_applies_newer_writes_on_top(self):
+        older = batch_of(('INCR', 'ws:n'), ('SADD', 'ws:all', 'c1'), ('HSET', 'ws:conn:c1', 'status', 'connected'),
+                         ('EXPIRE', 'ws:conn:c1', 60))
+        newer = batch_of(('DECR', 'ws:n'), ('DECR', 'ws:n'), ('SREM', 'ws:all', 'c1'), ('DEL', 'ws:conn:c1'))
+        older.merge(newer)
+        self.assertEqual(older.commands(), [('DEL', 'ws:conn:c1'), ('INCRBY', 'ws:n', -1), ('SREM', 'ws:all', 'c1')])
+        self.assertEqual(len(older), 8)
+
+
+class WriteBehindRetryTest(unittest.TestCase):
+
+    def run_flushes(self, write_behind, ticks):
+        async def flushes():
+            for commands in ticks:
+                write_behind.submit(commands)
+                await write_behind.flush()
+        asyncio.run(flushes())
+
+    def test_failed_flushes_merge_into_one_retry_batch(self):
+        executed, down = [], [True]
+
+        async def execute(commands):
+            if down[0]:
+                raise RedisConnectionError('down')
+            executed.append(commands)
+            return []
+
+        write_behind = WriteBehind(execute)
+        # Far more failed ticks than the old per-tick batch limit: nothing may be dropped
+        self.run_flushes(write_behind, [[('INCR', 'ws:attempts'), ('SADD', 'ws:all', f'c{i}')] for i in range(100)])
+        self.assertEqual(write_behind.ops_dropped, 0)
+        self.assertEqual(len(write_behind.pending), 200)
+        down[0] = False
+        self.run_flushes(write_behind, [[('SREM', 'ws:all', 'c0')]])
+        self.assertIsNone(write_behind.pending)
+        self.assertEqual(executed, [[('INCRBY', 'ws:attempts', 100), ('SADD', 'ws:all', *(f'c{i}' for i in range(1, 100))),
+                                     ('SREM', 'ws:all', 'c0')]])
+
+    def test_backlog_dropped_after_max_retry_seconds(self):
+        async def execute(commands):
+            raise RedisConnectionError('down')
+
+        write_behind = WriteBehind(execute)
+        write_behind.max_retry_seconds = 60
+        self.run_flushes(write_behind, [[('INCR', 'ws:attempts')]])
+        write_behind.pending.started = time.monotonic() - 61
+        self.run_flushes(write_behind, [[('INCR', 'ws:attempts')]])
+        self.assertIsNone(write_behind.pending)
+        self.assertEqual(write_behind.ops_dropped, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Write-behind batching for non-critical connection-tracking writes
+
+Bookkeeping writes (attempt counters, connection metadata hashes, registry sets,
+TTLs) do not need to reach Redis before Envoy finishes the upgrade. They are
+coalesced in memory and flushed as one pipeline every BATCH_FLUSH_MS milliseconds,
+or as soon as BATCH_MAX_OPS operations are pending:
+- INCR/DECR/INCRBY/DECRBY on the same key become one INCRBY with the net delta
+- SADD/SREM on the same key become one SADD and one SREM (last operation per member wins)
+- HSET/HMSET on the same key become one HSET (last value per field wins)
+- EXPIRE and SET keep the last value per key
+- DEL (and SET) discard earlier pending writes to the key, then run first on flush
+
+Keys read by the admission check (BATCH_SYNC_PREFIXES) are never deferred, so the
+per-pod limit stays strongly consistent: deferring a write to them is rejected.
+
+While Redis is unreachable, writes keep coalescing into the one batch awaiting retry, so
+the backlog grows with the number of distinct keys, not with the outage length. It is
+dropped only after BATCH_MAX_RETRY_SECONDS (default 300, longer than a Redis failover)
+without a successful flush.
+
+Delivery is at-least-once: a batch whose flush fails is retried whole, so if the
+connection drops after Redis applied part of the pipeline, those commands run again.
+DEL, SET, SADD/SREM, HSET and EXPIRE converge to the same state; INCRBY deltas (the
+attempt and event counters) can be applied twice and may overcount after such a failure.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from redis.exceptions import RedisError
+
+logger = logging.getLogger('redis-bridge.writebehind')
+
+COALESCIBLE = ('INCR', 'DECR', 'INCRBY', 'DECRBY', 'SADD', 'SREM', 'HSET', 'HMSET', 'EXPIRE', 'DEL', 'SET')
+
+
+class Batch:
+    """Pending writes, already coalesced per key"""
+
+    __slots__ = ('deletes', 'sets', 'deltas', 'members', 'fields', 'expires', 'ops', 'started')
+
+    def __init__(self):
+        self.deletes: Dict[str, None] = {}            # ordered set of keys
+        self.sets: Dict[str, Tuple] = {}              # key -> (value, *options)
+        self.deltas: Dict[str, int] = {}
+        self.members: Dict[str, Dict[str, bool]] = {}  # key -> member -> added?
+        self.fields: Dict[str, Dict[str, Any]] = {}
+        self.expires: Dict[str, Any] = {}
+        self.ops = 0
+        self.started = 0.0
+
+    def __len__(self) -> int:
+        return self.ops
+
+    def merge(self, newer: 'Batch') -> None:
+        """Apply the writes of a newer batch on top of this one"""
+        ops = self.ops + newer.ops
+        started = self.started if self.ops else newer.started
+        # newer.commands() reproduces newer's per-key outcome when replayed in order
+        for command in newer.commands():
+            self.add(command)
+        self.ops, self.started = ops, started
+
+    def _forget(self, key: str) -> None:
+        for pending in (self.sets, self.deltas, self.members, self.fields, self.expires):
+            pending.pop(key, None)
+
+    def add(self, command: Sequence[Any]) -> None:
+        name, key, args = str(command[0]).upper(), str(command[1]), command[2:]
+        if name in ('INCR', 'DECR'):
+            self.deltas[key] = self.deltas.get(key, 0) + (1 if name == 'INCR' else -1)
+        elif name in ('INCRBY', 'DECRBY'):
+            amount = int(args[0])
+            self.deltas[key] = self.deltas.get(key, 0) + (amount if name == 'INCRBY' else -amount)
+        elif name in ('SADD', 'SREM'):
+            members = self.members.setdefault(key, {})
+            for member in args:
+                members[str(member)] = name == 'SADD'
+        elif name in ('HSET', 'HMSET'):
+            fields = self.fields.setdefault(key, {})
+            for field, value in zip(args[::2], args[1::2]):
+                fields[str(field)] = value
+        elif name == 'EXPIRE':
+            self.expires[key] = args[0]
+        elif name == 'SET':
+            # SET replaces the value and clears any TTL, like Redis does
+            self._forget(key)
+            self.sets[key] = tuple(args)
+        elif name == 'DEL':
+            self._forget(key)
+            self.deletes.pop(key, None)
+            self.deletes[key] = None
+        if not self.ops:
+            self.started = time.monotonic()
+        self.ops += 1
+
+    def commands(self) -> List[Tuple]:
+        """Coalesced commands in an order that preserves the per-key outcome"""
+        commands: List[Tuple] = []
+        if self.deletes:
+            commands.append(('DEL', *self.deletes))
+        commands.extend(('SET', key, *args) for key, args in self.sets.items())
+        commands.extend(('INCRBY', key, delta) for key, delta in self.deltas.items() if delta)
+        for key, members in self.members.items():
+            added = [m for m, is_added in members.items() if is_added]
+            removed = [m for m, is_added in members.items() if not is_added]
+            if added:
+                commands.append(('SADD', key, *added))
+            if removed:
+                commands.append(('SREM', key, *removed))
+        for key, fields in self.fields.items():
+            flat = [item for pair in fields.items() for item in pair]
+            commands.append(('HSET', key, *flat))
+        commands.extend(('EXPIRE', key, seconds) for key, seconds in self.expires.items())
+        return commands
+
+
+def validate(command: Sequence[Any], sync_prefixes: Sequence[str]) -> None:
+    """Raise ValueError unless `command` may be deferred"""
+    name = str(command[0]).upper() if command else ''
+    if name not in COALESCIBLE:
+        raise ValueError(f'{name or "empty command"} cannot be deferred (allowed: {", ".join(COALESCIBLE)})')
+    if len(command) < 2:
+        raise ValueError(f'{name} needs a key')
+    key = str(command[1])
+    if any(key.startswith(prefix) for prefix in sync_prefixes):
+        raise ValueError(f'{key} is read by the admission check and must be written synchronously')
+    arity = len(command) - 2
+    if (name in ('INCR', 'DECR', 'DEL') and arity != 0) \
+            or (name in ('INCRBY', 'DECRBY', 'EXPIRE') and arity != 1) \
+            or (name in ('SADD', 'SREM') and arity < 1) \
+            or (name in ('HSET', 'HMSET') and (arity < 2 or arity % 2)) \
+            or (name == 'SET' and arity < 1):
+        raise ValueError(f'wrong number of arguments for {name}')
+    if name in ('INCRBY', 'DECRBY', 'EXPIRE'):
+        int(command[2])
+
+
+class WriteBehind:
+    """Coalesces deferred writes and flushes them periodically as one pipeline"""
+
+    def __init__(self, execute: Callable[[List[Tuple]], Awaitable[List[Any]]]):
+        self.execute = execute
+        self.enabled = os.getenv('BATCH_MODE', 'on').lower() not in ('off', 'false', '0')
+        self.flush_interval = float(os.getenv('BATCH_FLUSH_MS', '50')) / 1000
+        self.max_ops = int(os.getenv('BATCH_MAX_OPS', '1000'))
+        self.sync_prefixes = tuple(p for p in os.getenv(
+            'BATCH_SYNC_PREFIXES', 'ws:pod_conn:,ws:rate_limit:').split(',') if p)
+        self.batch = Batch()
+        # Writes whose flush failed (Redis unreachable); later writes are merged into it
+        self.pending: Optional[Batch] = None
+        self.max_retry_seconds = float(os.getenv('BATCH_MAX_RETRY_SECONDS', '300'))
+        self._full: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flushed_since_failure = True
+
+        self.ops_queued = 0
+        self.commands_flushed = 0
+        self.flushes = 0
+        self.flush_failures = 0
+        self.ops_dropped = 0
+        self.flush_lag = 0.0
+        self.flush_lag_max = 0.0
+
+    def validate(self, commands: Sequence[Sequence[Any]]) -> None:
+        for command in commands:
+            validate(command, self.sync_prefixes)
+
+    def submit(self, commands: Sequence[Sequence[Any]]) -> int:
+        """Queue already-validated commands; returns the number of pending operations"""
+        for command in commands:
+            self.batch.add(command)
+        self.ops_queued += len(commands)
+        if len(self.batch) >= self.max_ops and self._full is not None:
+            self._full.set()
+        return len(self.batch)
+
+    def oldest_pending_seconds(self) -> float:
+        oldest = self.pending if self.pending is not None else self.batch
+        return time.monotonic() - oldest.started if len(oldest) else 0.0
+
+    async def flush(self) -> None:
+        if len(self.batch):
+            if self.pending is None:
+                self.pending = self.batch
+            else:
+                self.pending.merge(self.batch)
+            self.batch = Batch()
+        batch = self.pending
+        if batch is None:
+            return
+        commands = batch.commands()
+        try:
+            if commands:
+                await self.execute(commands)
+        except (RedisError, OSError) as e:
+            if self._flushed_since_failure:
+                logger.warning(f"Write-behind flush of {len(commands)} commands failed, "
+                               f"retrying every {self.flush_interval * 1000:.0f}ms: {e}")
+            self.flush_failures += 1
+            self._flushed_since_failure = False
+            age = time.monotonic() - batch.started
+            if age > self.max_retry_seconds:
+                logger.error(f"Dropping {len(batch)} deferred writes unflushed for {age:.0f}s "
+                             f"(BATCH_MAX_RETRY_SECONDS={self.max_retry_seconds:g})")
+                self.ops_dropped += len(batch)
+                self.pending = None
+            return
+        self.pending = None
+        self._flushed_since_failure = True
+        self.flushes += 1
+        self.commands_flushed += len(commands)
+        self.flush_lag = time.monotonic() - batch.started
+        self.flush_lag_max = max(self.flush_lag_max, self.flush_lag)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # Keep flushing: a dead task would let the pending batch grow without bound
+                self.flush_failures += 1
+                logger.exception("Write-behind flush failed unexpectedly; pending writes are kept")
+
+    def start(self) -> None:
+        if self.enabled:
+            # Created here so the event belongs to the loop aiohttp runs the app on
+            self._full = asyncio.Event()
+            self._task = asyncio.ensure_future(self.run())
+            logger.info(f"Write-behind batching every {self.flush_interval * 1000:.0f}ms "
+                        f"or {self.max_ops} ops (synchronous prefixes: {', '.join(self.sync_prefixes)})")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def render(self) -> str:
+        lines = []
+        for name, kind, help_text, value in (
+            ('redis_bridge_batch_ops_queued_total', 'counter', 'Writes accepted for write-behind', self.ops_queued),
+            ('redis_bridge_batch_commands_flushed_total', 'counter', 'Redis commands sent after coalescing', self.commands_flushed),
+            ('redis_bridge_batch_flushes_total', 'counter', 'Write-behind flushes', self.flushes),
+            ('redis_bridge_batch_flush_failures_total', 'counter', 'Write-behind flushes that failed and will be retried', self.flush_failures),
+            ('redis_bridge_batch_ops_dropped_total', 'counter', 'Deferred writes dropped after BATCH_MAX_RETRY_SECONDS of flush failures', self.ops_dropped),
+            ('redis_bridge_batch_pending_ops', 'gauge', 'Deferred writes not yet flushed',
+             len(self.batch) + (len(self.pending) if self.pending is not None else 0)),
+            ('redis_bridge_batch_oldest_pending_seconds', 'gauge', 'Age of the oldest unflushed write', round(self.oldest_pending_seconds(), 6)),
+            ('redis_bridge_batch_flush_lag_seconds', 'gauge', 'First write to flush completion, last flush', round(self.flush_lag, 6)),
+            ('redis_bridge_batch_flush_lag_max_seconds', 'gauge', 'First write to flush completion, worst flush', round(self.flush_lag_max, 6)),
+        ):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
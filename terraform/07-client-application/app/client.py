@@ -7,7 +7,28 @@ This client application:
 2. Attempts 1 new connection per 10 seconds
 3. Randomly sends messages over existing connections every 10-20 seconds
 4. Logs responses (timestamp, server pod IP)
-5. Provides HTTP health endpoint for Kubernetes health checks
+5. Provides HTTP health and Prometheus metrics endpoints on the same asyncio loop
+
+WIRE_FORMAT=binary negotiates the compact framing from framing.py and falls back
+to JSON when the server does not accept the subprotocol.
+
+Send times for all connections come from one shared timer wheel (scheduler.py);
+each connection only has a reader task that waits for replies without a timeout.
+
+WS_COMPRESSION selects the permessage-deflate offer (compression.py). Logs are JSON lines
+written by a background thread; per-response lines are sampled (logutil.py).
+
+Closed or failed connections are replaced after a jittered backoff that honours close
+codes and retry hints (reconnect.py), so clients do not reconnect in lockstep.
+
+VIRTUAL_PODS=N hosts N pod identities (headers, connection budget, backoff) in one pod
+(identities.py); CLIENT_WORKERS=K shards them across K processes whose metrics are
+aggregated by a supervisor on the health port (workers.py).
+
+TRACE_CAPTURE_PATH records connection opens, message sizes, gaps and closes as a compact
+binary trace (traffic.py); CLIENT_MODE=replay plays such a trace back at REPLAY_SPEED (replay.py).
+
+/debug/profile, /debug/slow-callbacks and /debug/tasks profile the event loop on demand (profiling.py).
 """
 
 import asyncio
@@ -19,41 +40,168 @@ import os
 import signal
 import sys
 from datetime import datetime
-from typing import List, Dict, Set
-from http.server import HTTPServer, BaseHTTPRequestHandler
-import threading
+from typing import Dict, Optional, Set
 import socket
 import time
+import itertools
+
+from admin import AdminServer, Request, Response, json_response
+from compression import CompressionPolicy
+from framing import BINARY_SUBPROTOCOL, BROADCAST, SEQ_MASK, FramingError, decode_reply, encode_ping
+from identities import PodIdentity, identities_from_env
+from latency import LatencyRecorder
+from loadgen import LoadGenerator, load_mode_enabled, schedule_from_env
+from logutil import attach_metrics, configure_logging, message_sampler, shutdown_logging
+from metrics import FAST_BUCKETS, LATENCY_BUCKETS, LoopLagMonitor, Registry
+from profiling import DebugEndpoints, forward_debug_routes
+from reconnect import DELAY_BUCKETS
+from replay import TraceReplayer, replay_mode_enabled, replayer_from_env
+from runtime import loop_backend, loop_report, run, startup
+from scheduler import Timer, TimerWheel
+from traffic import CLIENT_MESSAGE, CLOSE, OPEN, SERVER_MESSAGE, message_size, trace_writer_from_env
+from workers import WorkerChannel, WorkerSupervisor
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging (queue-backed; see logutil.py)
+configure_logging()
 logger = logging.getLogger(__name__)
+startup.mark('imports')
+
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+
+# Without a reply for this long, a connection sends again
+RESEND_TIMEOUT = 5.0
+
+PING_HEADER_BYTES = len(encode_ping(0, 0))
+
+
+class ConnectionState:
+    """Per-connection send state driven by the shared timer wheel"""
+
+    __slots__ = ('websocket', 'connection_id', 'identity', 'timer')
+
+    def __init__(self, websocket, connection_id: int, identity: PodIdentity):
+        self.websocket = websocket
+        self.connection_id = connection_id
+        self.identity = identity
+        self.timer: Optional[Timer] = None
+
+    def cancel(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+
+class ClientMetrics:
+    """Hot-path counters and histograms for the WebSocket client"""
+    
+    def __init__(self):
+        self.registry = Registry(prefix='ws_client_')
+        r = self.registry
+        self.connections_active = r.gauge('connections_active', 'Currently open WebSocket connections')
+        self.connections_opened = r.counter('connections_opened_total', 'WebSocket connections established')
+        self.connections_failed = r.counter('connections_failed_total', 'WebSocket connection attempts that failed')
+        self.connections_closed = r.counter('connections_closed_total', 'WebSocket connections closed')
+        self.messages_sent = r.counter('messages_sent_total', 'Messages sent to the server')
+        self.messages_received = r.counter('messages_received_total', 'Messages received from the server')
+        self.bytes_sent = r.counter('message_bytes_sent_total', 'Payload size of sent messages')
+        self.bytes_received = r.counter('message_bytes_received_total', 'Payload size of received messages')
+        self.json_encode_seconds = r.histogram('json_encode_seconds', 'Time spent encoding request JSON', FAST_BUCKETS)
+        self.json_decode_seconds = r.histogram('json_decode_seconds', 'Time spent decoding response JSON', FAST_BUCKETS)
+        self.connect_seconds = r.histogram('connect_seconds', 'WebSocket handshake latency', LATENCY_BUCKETS)
+        self.broadcasts_received = r.counter('broadcasts_received_total', 'Server-initiated broadcasts received')
+        self.wire_fallbacks = r.counter('wire_format_fallbacks_total', 'Connections that fell back to JSON because the binary subprotocol was refused')
+        self.rtt_seconds = r.histogram('rtt_seconds', 'Request/reply round-trip latency', LATENCY_BUCKETS)
+        self.outstanding_requests = r.gauge('outstanding_requests', 'Requests waiting for a reply')
+        self.send_queue_bytes = r.gauge('send_queue_bytes', 'Bytes buffered for sending across all connections')
+        self.send_queue_bytes_max = r.gauge('send_queue_bytes_max', 'Largest per-connection send buffer')
+        self.sends_deferred = r.counter('sends_deferred_total', 'Scheduled sends postponed because the socket was backed up')
+        self.scheduler_timers = r.gauge('scheduler_timers', 'Send timers pending in the timer wheel')
+        self.close_codes = r.counter('close_codes_total', 'Connections closed, by the close code the server sent (none: no close frame)', ['code'])
+        self.reconnect_delay_seconds = r.histogram('reconnect_delay_seconds', 'Delay applied before the next connection attempt', DELAY_BUCKETS)
+        self.scheduler_late_ticks = r.gauge('scheduler_late_ticks', 'Timer wheel ticks processed more than one tick late')
+        self.identities = r.gauge('identities', 'Pod identities hosted (VIRTUAL_PODS, or 1)')
+        self.identities_connected = r.gauge('identities_connected', 'Identities with at least one open connection')
+        self.identities_full = r.gauge('identities_full', 'Identities holding their whole MAX_CONNECTIONS budget')
+        self.loop_lag = LoopLagMonitor(r)
+        startup.attach_metrics(r)
 
 class WebSocketClient:
-    def __init__(self, client_id: str, envoy_endpoint: str):
+    def __init__(self, client_id: str, envoy_endpoint: str, shard: int = 0, shards: int = 1):
         self.client_id = client_id
         self.envoy_endpoint = envoy_endpoint
-        self.connections: List[websockets.WebSocketServerProtocol] = []
+        self.connections: Set[websockets.WebSocketClientProtocol] = set()
         self.max_connections = int(os.getenv('MAX_CONNECTIONS', '5'))
         self.connection_interval = int(os.getenv('CONNECTION_INTERVAL', '10'))  # seconds
-        self.message_interval_min = int(os.getenv('MESSAGE_INTERVAL_MIN', '10'))  # seconds
-        self.message_interval_max = int(os.getenv('MESSAGE_INTERVAL_MAX', '20'))  # seconds
+        self.message_interval_min = float(os.getenv('MESSAGE_INTERVAL_MIN', '10'))  # seconds
+        self.message_interval_max = float(os.getenv('MESSAGE_INTERVAL_MAX', '20'))  # seconds
+        # Optional filler so message size can be varied (bench/ large-messages scenario)
+        self.payload_bytes = int(os.getenv('MESSAGE_PAYLOAD_BYTES', '0'))
+        self.payload = 'x' * self.payload_bytes
+        self.payload_raw = self.payload.encode()
         self.running = False
         self.connection_tasks: Set[asyncio.Task] = set()
         self.message_tasks: Set[asyncio.Task] = set()
+        self.load_generator: Optional[LoadGenerator] = None
+        self.replayer: Optional[TraceReplayer] = None
+        self.shard = shard
+        self.shards = shards
+        self.stop_requested: Optional[asyncio.Event] = None
+        self.status_interval = float(os.getenv('STATUS_INTERVAL', '10'))  # seconds
+        # Sends are skipped (and retried a tick later) while a socket has this much unsent data
+        self.send_high_water = int(os.getenv('SEND_HIGH_WATER', str(64 * 1024)))
+        self.scheduler = TimerWheel()
+        self.wire_format = os.getenv('WIRE_FORMAT', 'json').lower()
+        self.connection_ids = itertools.count(1)
+        if self.wire_format not in ('json', 'binary'):
+            raise ValueError(f"Unknown WIRE_FORMAT: {self.wire_format}")
+        
+        # Latency tracking: every message carries a sequence number and send time;
+        # replies are matched back through the outstanding map
+        self.latency = LatencyRecorder()
+        self.sequence = itertools.count(1)
+        self.outstanding: Dict[int, int] = {}  # seq -> monotonic send time (ns)
+        self.reply_timeout_ns = int(float(os.getenv('LATENCY_REPLY_TIMEOUT', '30')) * 1e9)
+        self.latency_report_interval = float(os.getenv('LATENCY_REPORT_INTERVAL', '60'))
+        self.latency_dump_path = os.getenv('LATENCY_DUMP_PATH')
+        if self.latency_dump_path and shards > 1:
+            self.latency_dump_path += f".w{shard}"
+        
+        self.metrics = ClientMetrics()
+        self.metrics.connections_active.set_function(lambda: len(self.connections))
+        self.metrics.outstanding_requests.set_function(lambda: len(self.outstanding))
+        self.metrics.scheduler_timers.set_function(lambda: len(self.scheduler))
+        self.metrics.scheduler_late_ticks.set_function(lambda: self.scheduler.late_ticks)
+        self.metrics.registry.add_collector(self._collect_queue_depths)
+        self.compression = CompressionPolicy(registry=self.metrics.registry)
+        self.message_log = message_sampler()
+        self.trace = trace_writer_from_env(f".w{shard}" if shards > 1 else '')
+        attach_metrics(self.metrics.registry)
+        self.debug = DebugEndpoints(self.metrics.registry)
         
         # Get pod info
         self.pod_name = os.getenv('HOSTNAME', 'unknown-pod')
         self.pod_ip = self.get_pod_ip()
+        self.identities = identities_from_env(client_id, self.pod_name, self.pod_ip, self.max_connections,
+                                              shard, shards)
+        self.metrics.identities.set(len(self.identities))
+        self.metrics.identities_connected.set_function(
+            lambda: sum(1 for identity in self.identities if identity.connections))
+        self.metrics.identities_full.set_function(
+            lambda: sum(1 for identity in self.identities if len(identity.connections) >= identity.max_connections))
         
         logger.info(f"Client {self.client_id} initialized:")
-        logger.info(f"  Max connections: {self.max_connections}")
+        logger.info(f"  Max connections: {self.max_connections}" + (" per identity" if len(self.identities) > 1 else
+                    f" per pod, {self.identities[0].max_connections} in this worker" if shards > 1 else ""))
         logger.info(f"  Connection interval: {self.connection_interval}s")
-        logger.info(f"  Message interval: {self.message_interval_min}-{self.message_interval_max}s")
+        logger.info(f"  Message interval: {self.message_interval_min:g}-{self.message_interval_max:g}s")
+        if self.payload_bytes:
+            logger.info(f"  Message payload: {self.payload_bytes} bytes")
         logger.info(f"  Pod: {self.pod_name} ({self.pod_ip})")
+        logger.info(f"  Wire format: {self.wire_format}")
+        if len(self.identities) > 1 or shards > 1:
+            logger.info(f"  Identities: {len(self.identities)} (worker {shard} of {shards}), "
+                        f"{self.identities[0].pod_name} ... {self.identities[-1].pod_name}")
 
     def get_pod_ip(self) -> str:
         """Get the pod's IP address"""
@@ -63,113 +211,326 @@ class WebSocketClient:
             logger.warning(f"Could not determine pod IP: {e}")
             return 'unknown'
 
-    async def create_connection(self, connection_id: int) -> bool:
-        """Create a single WebSocket connection"""
+    @property
+    def connection_budget(self) -> int:
+        """Connections wanted across all identities"""
+        return sum(identity.max_connections for identity in self.identities)
+
+    async def create_connection(self, connection_id: int, identity: Optional[PodIdentity] = None):
+        """Create a single WebSocket connection (round-robin over the identities unless one is given);
+        returns the connection, or None if it failed"""
+        if identity is None:
+            identity = self.identities[connection_id % len(self.identities)]
         try:
-            logger.info(f"Attempting to create connection #{connection_id} to {self.envoy_endpoint}")
+            logger.info("Attempting to create connection #%d (%s) to %s",
+                        connection_id, identity.pod_name, self.envoy_endpoint)
             
-            headers = {
-                'X-Client-ID': self.client_id,
-                'X-Pod-Name': self.pod_name,
-                'X-Pod-IP': self.pod_ip,
-                'X-Connection-ID': str(connection_id)
-            }
+            headers = identity.headers(connection_id)
             
+            connect_started = time.monotonic_ns()
             websocket = await websockets.connect(
                 self.envoy_endpoint,
                 extra_headers=headers,
+                subprotocols=[BINARY_SUBPROTOCOL] if self.wire_format == 'binary' else None,
                 ping_interval=30,
                 ping_timeout=10,
-                close_timeout=10
+                close_timeout=10,
+                **self.compression.client_kwargs()
             )
+            connect_micros = (time.monotonic_ns() - connect_started) // 1000
+            self.latency.connect.record(connect_micros)
+            self.metrics.connect_seconds.observe(connect_micros / 1e6)
+            self.metrics.connections_opened.inc()
+            startup.mark('first_connection')
+            if self.wire_format == 'binary' and websocket.subprotocol != BINARY_SUBPROTOCOL:
+                self.metrics.wire_fallbacks.inc()
+                logger.warning(f"Server refused {BINARY_SUBPROTOCOL} on connection #{connection_id}; using JSON")
             
-            self.connections.append(websocket)
+            self.connections.add(websocket)
+            identity.connections.add(websocket)
+            if self.trace is not None:
+                self.trace.record(OPEN, connection_id)
             logger.info(f"Successfully created connection #{connection_id}. Total: {len(self.connections)}")
             
             # Start message handler for this connection
             message_task = asyncio.create_task(
-                self.handle_messages(websocket, connection_id)
+                self.handle_messages(websocket, connection_id, connect_started, identity)
             )
             self.message_tasks.add(message_task)
+            message_task.add_done_callback(self.message_tasks.discard)
             
-            return True
+            return websocket
             
         except Exception as e:
-            logger.error(f"Failed to create connection #{connection_id}: {e}")
-            return False
+            self.metrics.connections_failed.inc()
+            delay = identity.reconnect.after_failure(e)
+            self.schedule_reconnect(identity, delay)
+            logger.error(f"Failed to create connection #{connection_id}: {e} (next attempt in {delay:.1f}s)")
+            return None
+
+    def schedule_reconnect(self, identity: PodIdentity, delay: float) -> None:
+        """Hold back the identity's next connection attempt for at least `delay` seconds"""
+        self.metrics.reconnect_delay_seconds.observe(delay)
+        identity.next_attempt = max(identity.next_attempt, time.monotonic() + delay)
+        if identity.slot_freed is not None:
+            identity.slot_freed.set()
 
-    async def handle_messages(self, websocket, connection_id: int):
-        """Handle sending and receiving messages for a connection"""
+    async def handle_messages(self, websocket, connection_id: int, connect_started: Optional[int] = None,
+                              identity: Optional[PodIdentity] = None):
+        """Reader task for one connection; sends are paced by the shared timer wheel"""
+        if identity is None:
+            identity = self.identities[0]
+        state = ConnectionState(websocket, connection_id, identity)
+        first_reply = True
+        # Binary replies carry no identity; the server sends it once in the handshake
+        handshake_pod_ip = websocket.response_headers.get('X-Server-Pod-IP', 'unknown')
+        # Replayed connections send when the trace says so, not on their own schedule
+        paced = self.replayer is None
         try:
             # Send initial message
-            await self.send_message(websocket, connection_id)
+            if paced:
+                self.send_due(state)
             
-            while self.running and not websocket.closed:
-                try:
-                    # Wait for message from server or timeout
-                    message = await asyncio.wait_for(
-                        websocket.recv(), 
-                        timeout=5.0
-                    )
-                    
-                    # Parse and log the response
-                    try:
-                        data = json.loads(message)
-                        server_pod_ip = data.get('server_pod_ip', 'unknown')
-                        timestamp = data.get('timestamp', 'unknown')
-                        logger.info(f"Response from server {server_pod_ip} at {timestamp} (connection #{connection_id})")
-                    except json.JSONDecodeError:
-                        logger.info(f"Non-JSON response on connection #{connection_id}: {message}")
-                    
-                    # Schedule next message after random interval
-                    await asyncio.sleep(random.randint(self.message_interval_min, self.message_interval_max))
-                    await self.send_message(websocket, connection_id)
-                    
-                except asyncio.TimeoutError:
-                    # No message received, send a ping/message
-                    await self.send_message(websocket, connection_id)
-                    await asyncio.sleep(1)
+            # No timeout here: a missing reply is handled by the RESEND_TIMEOUT timer
+            async for message in websocket:
+                received_at = time.monotonic_ns()
+                self.metrics.messages_received.inc()
+                size = message_size(message)
+                self.metrics.bytes_received.inc(size)
+                if self.trace is not None:
+                    self.trace.record(SERVER_MESSAGE, connection_id, size)
+                
+                # Parse and log the response
+                if isinstance(message, bytes):
+                    is_reply = self.process_binary_reply(message, connection_id, handshake_pod_ip, received_at)
+                else:
+                    is_reply = self.process_reply(message, connection_id, received_at)
+                if not is_reply:
+                    # Server-initiated broadcast: does not pace this connection's requests
+                    continue
+
+                if first_reply:
+                    # The connection works end to end: stop escalating reconnect delays
+                    identity.reconnect.reset()
+                    startup.mark('first_reply')
+                    if connect_started is not None:
+                        self.latency.first_message.record((received_at - connect_started) // 1000)
+                first_reply = False
+                if not paced:
+                    continue
+                
+                # Schedule next message after random interval
+                state.cancel()
+                state.timer = self.scheduler.schedule(
+                    random.uniform(self.message_interval_min, self.message_interval_max) * identity.interval_scale,
+                    self.send_due, state)
                     
         except websockets.exceptions.ConnectionClosed:
             logger.info(f"Connection #{connection_id} closed by server")
         except Exception as e:
             logger.error(f"Error handling messages for connection #{connection_id}: {e}")
         finally:
-            # Remove from connections list
+            state.cancel()
+            # Remove from active connections
             if websocket in self.connections:
-                self.connections.remove(websocket)
-                logger.info(f"Connection #{connection_id} removed. Total: {len(self.connections)}")
+                self.connections.discard(websocket)
+                identity.connections.discard(websocket)
+                self.metrics.connections_closed.inc()
+                received = websocket.close_rcvd
+                code = received.code if received is not None else None
+                self.metrics.close_codes.labels(code if code is not None else 'none').inc()
+                if self.trace is not None:
+                    self.trace.record(CLOSE, connection_id, code or 0)
+                if self.running:
+                    delay = identity.reconnect.after_close(code, received.reason if received is not None else '')
+                    self.schedule_reconnect(identity, delay)
+                    logger.info(f"Connection #{connection_id} removed (close code {code}). "
+                                f"Total: {len(self.connections)}; next attempt in {delay:.1f}s")
+                else:
+                    logger.info(f"Connection #{connection_id} removed. Total: {len(self.connections)}")
+
+    def send_due(self, state: ConnectionState) -> None:
+        """Timer wheel callback: send the connection's next message and arm the resend timer"""
+        state.timer = None
+        websocket = state.websocket
+        if not self.running or not websocket.open:
+            return
+        transport = websocket.transport
+        if transport is not None and transport.get_write_buffer_size() > self.send_high_water:
+            # Socket backed up: try again on the next tick instead of queueing more
+            self.metrics.sends_deferred.inc()
+            state.timer = self.scheduler.schedule(self.scheduler.tick, self.send_due, state)
+            return
+        self.send_message(websocket, state.connection_id, state.identity)
+        state.timer = self.scheduler.schedule(RESEND_TIMEOUT, self.send_due, state)
+
+    def process_reply(self, message: str, connection_id: int, received_at: int) -> bool:
+        """Decode a JSON reply, record its round trip and log it; False for broadcasts"""
+        try:
+            started = time.perf_counter()
+            data = json.loads(message)
+            self.metrics.json_decode_seconds.observe(time.perf_counter() - started)
+            if data.get('type') == 'broadcast':
+                self.metrics.broadcasts_received.inc()
+                logger.info("Broadcast (topic=%s) from server %s (connection #%d)",
+                            data.get('topic'), data.get('pod_ip', 'unknown'), connection_id)
+                return False
+            server_pod_ip = data.get('pod_ip', 'unknown')
+            self.record_reply(data, server_pod_ip, received_at)
+            if self.message_log.allow(connection_id):
+                logger.info("Response from server %s at %s (connection #%d)",
+                            server_pod_ip, data.get('timestamp', 'unknown'), connection_id)
+        except json.JSONDecodeError:
+            logger.info("Non-JSON response on connection #%d: %s", connection_id, message)
+        return True
+
+    def process_binary_reply(self, frame: bytes, connection_id: int, server_pod_ip: str,
+                             received_at: int) -> bool:
+        """Decode a binary REPLY frame and record its round trip; False for broadcasts"""
+        if frame[:1] == bytes([BROADCAST]):
+            self.metrics.broadcasts_received.inc()
+            logger.info("Binary broadcast (%d bytes) from server %s (connection #%d)",
+                        len(frame), server_pod_ip, connection_id)
+            return False
+        try:
+            seq, _, _, _ = decode_reply(frame)
+        except FramingError as e:
+            logger.info("Malformed binary response on connection #%d: %s", connection_id, e)
+            return True
+        self.match_reply(seq, server_pod_ip, received_at)
+        if self.message_log.allow(connection_id):
+            logger.info("Binary response from server %s (connection #%d)", server_pod_ip, connection_id)
+        return True
+
+    def record_reply(self, data: dict, server_pod_ip: str, received_at: int) -> None:
+        """Match a JSON reply to its request by the echoed sequence number"""
+        echoed = data.get('received_message')
+        seq = echoed.get('seq') if isinstance(echoed, dict) else None
+        self.match_reply(seq, server_pod_ip, received_at)
+
+    def match_reply(self, seq: Optional[int], server_pod_ip: str, received_at: int) -> None:
+        """Match a reply to its request by sequence number and record the round trip"""
+        sent_at = self.outstanding.pop(seq, None) if seq is not None else None
+        if sent_at is None:
+            self.latency.unmatched_replies += 1
+            return
+        rtt_micros = (received_at - sent_at) // 1000
+        self.latency.record_rtt(server_pod_ip, rtt_micros)
+        self.metrics.rtt_seconds.observe(rtt_micros / 1e6)
+
+    def _collect_queue_depths(self) -> None:
+        """Sample per-connection send buffers at scrape time rather than on every send"""
+        total = largest = 0
+        for websocket in self.connections:
+            transport = websocket.transport
+            size = transport.get_write_buffer_size() if transport is not None else 0
+            total += size
+            if size > largest:
+                largest = size
+        self.metrics.send_queue_bytes.set(total)
+        self.metrics.send_queue_bytes_max.set(largest)
+
+    def http_health(self, request: Request) -> Response:
+        """Kubernetes liveness/readiness endpoint"""
+        return json_response({
+            "status": "healthy",
+            "timestamp": datetime.now().isoformat(),
+            "client_id": self.client_id,
+            "pod_name": self.pod_name,
+            "pod_ip": self.pod_ip,
+            "active_connections": len(self.connections),
+            "identities": len(self.identities),
+            "identities_connected": self.metrics.identities_connected.value,
+            "loop": loop_report(self.metrics.loop_lag),
+            "startup_seconds": startup.phases
+        })
 
-    async def send_message(self, websocket, connection_id: int):
-        """Send a message to the server"""
+    def http_metrics(self, request: Request) -> Response:
+        """Prometheus scrape endpoint"""
+        return Response(self.metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    def expire_outstanding(self) -> None:
+        """Drop requests whose reply never arrived (closed connections, lost frames)"""
+        cutoff = time.monotonic_ns() - self.reply_timeout_ns
+        expired = [seq for seq, sent_at in self.outstanding.items() if sent_at < cutoff]
+        for seq in expired:
+            del self.outstanding[seq]
+        self.latency.lost_replies += len(expired)
+
+    def send_message(self, websocket, connection_id: int, identity: Optional[PodIdentity] = None,
+                     size: Optional[int] = None):
+        """Send a message to the server (written straight to the transport, no coroutine);
+        `size` pads it to that many bytes (trace replay) instead of MESSAGE_PAYLOAD_BYTES"""
+        if identity is None:
+            identity = self.identities[connection_id % len(self.identities)]
         try:
+            # Wrapped to 32 bits so JSON and binary connections share one outstanding map
+            seq = next(self.sequence) & SEQ_MASK
+            sent_at = time.monotonic_ns()
+            if websocket.subprotocol == BINARY_SUBPROTOCOL:
+                payload_raw = self.payload_raw if size is None else b'x' * max(0, size - PING_HEADER_BYTES)
+                frame = encode_ping(seq, sent_at, payload_raw)
+                self.outstanding[seq] = sent_at
+                websocket.write_frame_sync(True, OP_BINARY, frame)
+                self.metrics.messages_sent.inc()
+                self.metrics.bytes_sent.inc(len(frame))
+                if self.trace is not None:
+                    self.trace.record(CLIENT_MESSAGE, connection_id, len(frame))
+                logger.debug("Sent binary message from connection #%d", connection_id)
+                return
+
             message = {
                 "type": "ping",
-                "client_id": self.client_id,
-                "pod_name": self.pod_name,
-                "pod_ip": self.pod_ip,
+                "seq": seq,
+                "sent_ns": sent_at,
+                "client_id": identity.client_id,
+                "pod_name": identity.pod_name,
+                "pod_ip": identity.pod_ip,
                 "connection_id": connection_id,
                 "timestamp": datetime.now().isoformat(),
-                "message": f"Hello from {self.client_id} connection #{connection_id}"
+                "message": f"Hello from {identity.client_id} connection #{connection_id}"
             }
+            if size is not None:
+                # `, "payload": ""` plus the filler brings the message to the traced size
+                filler = size - len(json.dumps(message)) - 15
+                if filler > 0:
+                    message["payload"] = 'x' * filler
+            elif self.payload_bytes:
+                message["payload"] = self.payload
             
-            await websocket.send(json.dumps(message))
-            logger.debug(f"Sent message from connection #{connection_id}")
+            started = time.perf_counter()
+            payload = json.dumps(message)
+            self.metrics.json_encode_seconds.observe(time.perf_counter() - started)
+            self.outstanding[seq] = sent_at
+            frame = payload.encode()
+            websocket.write_frame_sync(True, OP_TEXT, frame)
+            self.metrics.messages_sent.inc()
+            self.metrics.bytes_sent.inc(len(frame))
+            if self.trace is not None:
+                self.trace.record(CLIENT_MESSAGE, connection_id, len(frame))
+            logger.debug("Sent message from connection #%d", connection_id)
             
         except Exception as e:
             logger.error(f"Failed to send message on connection #{connection_id}: {e}")
 
-    async def connection_manager(self):
-        """Manage connection creation at specified intervals"""
-        connection_count = 0
+    async def connection_manager(self, identity: PodIdentity):
+        """Keep an identity's max_connections open: one attempt per CONNECTION_INTERVAL, held back by its reconnect policy"""
+        if len(self.identities) > 1:
+            # Spread the identities' first attempts instead of a handshake burst at startup
+            await asyncio.sleep(random.uniform(0, self.connection_interval))
         
         while self.running:
             try:
-                current_connections = len(self.connections)
+                current_connections = len(identity.connections)
                 
-                if current_connections < self.max_connections:
-                    connection_count += 1
-                    success = await self.create_connection(connection_count)
+                if current_connections < identity.max_connections:
+                    wait = identity.next_attempt - time.monotonic()
+                    if wait > 0:
+                        # Re-check afterwards: another close may have pushed next_attempt further
+                        await asyncio.sleep(wait)
+                        continue
+                    identity.attempts += 1
+                    success = await self.create_connection(next(self.connection_ids), identity)
                     
                     if success:
                         logger.info(f"Total active connections: {len(self.connections)}")
@@ -177,8 +538,12 @@ class WebSocketClient:
                     # Wait before attempting next connection
                     await asyncio.sleep(self.connection_interval)
                 else:
-                    # All connections established, wait longer
-                    await asyncio.sleep(30)
+                    # All connections established: wait until one is closed
+                    identity.slot_freed.clear()
+                    try:
+                        await asyncio.wait_for(identity.slot_freed.wait(), timeout=30)
+                    except asyncio.TimeoutError:
+                        pass
                     
             except Exception as e:
                 logger.error(f"Error in connection manager: {e}")
@@ -188,116 +553,247 @@ class WebSocketClient:
         """Start the WebSocket client"""
         logger.info(f"Starting WebSocket client {self.client_id}")
         logger.info(f"Target endpoint: {self.envoy_endpoint}")
-        logger.info(f"Will attempt {self.max_connections} connections")
+        logger.info(f"Compression: {self.compression.describe()}")
         
         self.running = True
+        self.stop_requested = asyncio.Event()
+        for identity in self.identities:
+            identity.slot_freed = asyncio.Event()
+        self.scheduler.start()
         
-        # Start connection manager
-        connection_task = asyncio.create_task(self.connection_manager())
-        self.connection_tasks.add(connection_task)
+        # Start one connection manager per identity, the open-loop load generator in load mode,
+        # or the trace replayer in replay mode
+        if load_mode_enabled():
+            self.load_generator = LoadGenerator(self, schedule_from_env())
+            self.connection_tasks.add(asyncio.create_task(self.load_generator.run()))
+        elif replay_mode_enabled():
+            self.replayer = replayer_from_env(self, self.shard, self.shards)
+            self.connection_tasks.add(asyncio.create_task(self.replayer.run()))
+        else:
+            logger.info(f"Will attempt {self.max_connections} connections for each of {len(self.identities)} identities")
+            for identity in self.identities:
+                self.connection_tasks.add(asyncio.create_task(self.connection_manager(identity)))
+        
+        loop = asyncio.get_running_loop()
+        next_latency_report = loop.time() + self.latency_report_interval
         
         try:
-            # Run until stopped
+            # Run until stopped, waking only to log status
             while self.running:
-                await asyncio.sleep(1)
+                try:
+                    await asyncio.wait_for(self.stop_requested.wait(), timeout=self.status_interval)
+                    break
+                except asyncio.TimeoutError:
+                    pass
                 
                 # Log status periodically
-                if len(self.connections) > 0:
+                if self.load_generator is not None:
+                    logger.info(f"Status: {self.load_generator.summary()}")
+                elif self.replayer is not None:
+                    logger.info(f"Status: {self.replayer.summary()}")
+                elif len(self.connections) > 0:
                     logger.info(f"Status: {len(self.connections)} active connections")
+                
+                if loop.time() >= next_latency_report:
+                    next_latency_report = loop.time() + self.latency_report_interval
+                    self.expire_outstanding()
+                    for line in self.latency.report_lines():
+                        logger.info(f"Latency {line}")
                     
         except KeyboardInterrupt:
             logger.info("Received shutdown signal")
         finally:
             await self.stop()
 
+    def request_stop(self) -> None:
+        """Ask start() to return; safe to call from a signal handler on the loop"""
+        self.running = False
+        if self.stop_requested is not None:
+            self.stop_requested.set()
+
     async def stop(self):
         """Stop the WebSocket client"""
         logger.info("Stopping WebSocket client...")
         self.running = False
+        await self.scheduler.stop()
         
         # Cancel all tasks
         for task in self.connection_tasks:
             task.cancel()
-        for task in self.message_tasks:
+        if self.load_generator is not None:
+            await self.load_generator.stop()
+        if self.replayer is not None:
+            await self.replayer.stop()
+        for task in list(self.message_tasks):
             task.cancel()
             
         # Close all connections
         close_tasks = []
-        for websocket in self.connections[:]:  # Create a copy to avoid modification during iteration
+        for websocket in list(self.connections):  # Create a copy to avoid modification during iteration
             close_tasks.append(websocket.close())
             
         if close_tasks:
             await asyncio.gather(*close_tasks, return_exceptions=True)
             
         self.connections.clear()
+        self.expire_outstanding()
+        self.latency.dump(self.latency_dump_path)
+        if self.trace is not None:
+            self.trace.close()
         logger.info("WebSocket client stopped")
 
-class HealthHandler(BaseHTTPRequestHandler):
-    """HTTP health check handler"""
-    
-    def do_GET(self):
-        if self.path == '/health':
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            
-            status = {
-                "status": "healthy",
-                "timestamp": datetime.now().isoformat(),
-                "client_id": os.getenv('CLIENT_ID', 'unknown'),
-                "pod_name": os.getenv('HOSTNAME', 'unknown'),
-                "pod_ip": os.getenv('POD_IP', 'unknown')
-            }
-            
-            self.wfile.write(json.dumps(status).encode())
-        else:
-            self.send_response(404)
-            self.end_headers()
-    
-    def log_message(self, format, *args):
-        # Suppress default HTTP logging
+async def start_admin_server(client: WebSocketClient, port: int) -> AdminServer:
+    """Start the HTTP health/metrics server on the running event loop"""
+    admin = AdminServer('0.0.0.0', port)
+    admin.route('GET', '/health', client.http_health)
+    admin.route('GET', '/metrics', client.http_metrics)
+    client.debug.attach(admin)
+    await admin.start()
+    startup.mark('health_server')
+    client.metrics.loop_lag.start()
+    return admin
+
+def client_config():
+    """Get (envoy_endpoint, client_id, health_port) from environment variables"""
+    return (
+        os.getenv('ENVOY_ENDPOINT', 'ws://envoy-proxy-service.default.svc.cluster.local:80'),
+        os.getenv('CLIENT_ID', f'client-{random.randint(1000, 9999)}'),
+        int(os.getenv('HEALTH_PORT', '8081')),
+    )
+
+def client_worker_count() -> int:
+    """CLIENT_WORKERS, capped at VIRTUAL_PODS: a worker without an identity would have nothing to run"""
+    workers = int(os.getenv('CLIENT_WORKERS', '1'))
+    virtual_pods = int(os.getenv('VIRTUAL_PODS', '0'))
+    if 0 < virtual_pods < workers:
+        logger.warning(f"CLIENT_WORKERS={workers} exceeds VIRTUAL_PODS={virtual_pods}; "
+                       f"running {virtual_pods} workers")
+        workers = virtual_pods
+        # Workers are spawned with this environment and shard by it
+        os.environ['CLIENT_WORKERS'] = str(workers)
+    return workers
+
+def run_worker(index: int, conn) -> None:
+    """Entry point of one worker process in CLIENT_WORKERS=N mode"""
+    try:
+        run(worker_main(index, conn))
+    except KeyboardInterrupt:
         pass
+    finally:
+        # multiprocessing children skip atexit: flush the log queue here
+        shutdown_logging()
 
-def start_health_server(port: int):
-    """Start HTTP health check server"""
-    server = HTTPServer(('0.0.0.0', port), HealthHandler)
-    thread = threading.Thread(target=server.serve_forever, daemon=True)
-    thread.start()
-    logger.info(f"Health check server started on port {port}")
-    return server
+async def worker_main(index: int, conn) -> None:
+    """Run this worker's shard of the identities and report stats to the supervisor"""
+    envoy_endpoint, client_id, _ = client_config()
+    client = WebSocketClient(client_id, envoy_endpoint, shard=index, shards=int(os.getenv('CLIENT_WORKERS', '1')))
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, client.request_stop)
+    client.metrics.loop_lag.start()
+    
+    channel = WorkerChannel(conn)
+    channel.on('debug', client.debug.call)
+    channel.attach()
+    interval = float(os.getenv('WORKER_STATS_INTERVAL', '1'))
+    publisher = asyncio.create_task(channel.publish_stats(client.metrics.registry.snapshot, interval))
+    try:
+        await client.start()
+    finally:
+        publisher.cancel()
+        channel.send('stats', client.metrics.registry.snapshot())
+
+async def supervise(workers: int) -> None:
+    """Run CLIENT_WORKERS=N worker processes and serve aggregated health/metrics"""
+    envoy_endpoint, client_id, health_port = client_config()
+    # Workers are spawned with this environment: pin the generated client ID for all of them
+    os.environ['CLIENT_ID'] = client_id
+    pod_ip = os.getenv('POD_IP', 'unknown')
+    pod_name = os.getenv('HOSTNAME', 'unknown-pod')
+    supervisor = WorkerSupervisor(workers, run_worker)
+    
+    registry = Registry(prefix='ws_client_')
+    registry.gauge('workers', 'Configured worker processes').set(workers)
+    registry.gauge('workers_alive', 'Running worker processes').set_function(
+        lambda: sum(1 for w in supervisor.workers if w.alive))
+    registry.gauge('worker_restarts', 'Worker restarts since startup').set_function(
+        lambda: sum(w.restarts for w in supervisor.workers))
+    
+    def http_health(request: Request) -> Response:
+        workers_status = supervisor.worker_status('ws_client_connections_active')
+        alive = sum(1 for w in workers_status if w['alive'])
+        status = 'healthy' if alive else 'unhealthy'
+        return json_response({
+            "status": status,
+            "timestamp": datetime.now().isoformat(),
+            "client_id": client_id,
+            "pod_name": pod_name,
+            "pod_ip": pod_ip,
+            "active_connections": sum(w['connected_clients'] for w in workers_status),
+            "identities": sum(supervisor.sample(w.snapshot, 'ws_client_identities') for w in supervisor.workers),
+            "identities_connected": sum(supervisor.sample(w.snapshot, 'ws_client_identities_connected')
+                                        for w in supervisor.workers),
+            "loop": {"backend": loop_backend()},
+            "startup_seconds": startup.phases,
+            "workers": workers_status
+        }, 200 if status == 'healthy' else 503)
+    
+    def http_metrics(request: Request) -> Response:
+        return Response(supervisor.render_metrics(registry.snapshot()),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+    
+    admin = AdminServer('0.0.0.0', health_port)
+    admin.route('GET', '/health', http_health)
+    admin.route('GET', '/metrics', http_metrics)
+    # Profiles, slow callbacks and tasks are per event loop: served by one worker (?worker=N)
+    forward_debug_routes(admin, supervisor)
+    await admin.start()
+    startup.mark('health_server')
+    
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+    
+    logger.info(f"Starting {workers} client worker processes for {client_id} -> {envoy_endpoint}")
+    runner = asyncio.create_task(supervisor.run())
+    await stop.wait()
+    logger.info("Supervisor stopping workers...")
+    await supervisor.stop(timeout=15)
+    runner.cancel()
+    await admin.stop()
+    logger.info("Application shutdown complete")
 
 async def main():
     """Main application entry point"""
     # Configuration from environment variables
-    envoy_endpoint = os.getenv('ENVOY_ENDPOINT', 'ws://envoy-proxy-service.default.svc.cluster.local:80')
-    client_id = os.getenv('CLIENT_ID', f'client-{random.randint(1000, 9999)}')
-    health_port = int(os.getenv('HEALTH_PORT', '8081'))
-    
-    # Start health check server
-    health_server = start_health_server(health_port)
+    envoy_endpoint, client_id, health_port = client_config()
     
-    # Create and start WebSocket client
+    # Create WebSocket client and start its health check and metrics server
     client = WebSocketClient(client_id, envoy_endpoint)
+    admin = await start_admin_server(client, health_port)
     
-    # Handle shutdown signals
-    def signal_handler(signum, frame):
+    # Handle shutdown signals on the loop, so the status wait wakes up immediately
+    def signal_handler(signum):
         logger.info(f"Received signal {signum}")
-        client.running = False
+        client.request_stop()
     
-    signal.signal(signal.SIGTERM, signal_handler)
-    signal.signal(signal.SIGINT, signal_handler)
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, signal_handler, signum)
     
     try:
         await client.start()
     except Exception as e:
         logger.error(f"Application error: {e}")
     finally:
-        health_server.shutdown()
+        await admin.stop()
         logger.info("Application shutdown complete")
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        workers = client_worker_count()
+        run(supervise(workers) if workers > 1 else main())
     except KeyboardInterrupt:
         logger.info("Application interrupted")
     except Exception as e:
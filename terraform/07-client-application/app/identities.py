@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Client identities: the pod itself, or VIRTUAL_PODS synthetic pods hosted by one process
+
+The Envoy Lua trackers count connections per pod (X-Pod-Name / X-Pod-IP), so exercising
+MAX_CONNECTIONS_PER_POD at scale needs many distinct pod identities. With VIRTUAL_PODS=N
+the client hosts N identities, each with:
+1. Its own handshake headers: X-Client-ID `<CLIENT_ID>-vNNNNN`, X-Pod-Name
+   `<VIRTUAL_POD_PREFIX>-NNNNN` and X-Pod-IP VIRTUAL_POD_IP_BASE + N + 1 (the base
+   address itself is never used)
+2. Its own connection budget (MAX_CONNECTIONS per identity), reconnect backoff and
+   connection attempt pacing
+3. Its own message interval: MESSAGE_INTERVAL_MIN/MAX scaled by a per-identity factor in
+   [1 - VIRTUAL_POD_INTERVAL_SPREAD, 1 + VIRTUAL_POD_INTERVAL_SPREAD], fixed by the index
+
+With CLIENT_WORKERS=K the identities are sharded across K processes by index modulo K
+(the client runs at most VIRTUAL_PODS workers, so every shard has an identity).
+VIRTUAL_PODS=0 (default) keeps the single identity of the real pod; with K workers its
+MAX_CONNECTIONS budget is split between them, so the pod still holds at most MAX_CONNECTIONS.
+"""
+
+import asyncio
+import ipaddress
+import os
+import random
+from typing import Dict, List, Optional, Set
+
+from reconnect import ReconnectPolicy
+
+
+class PodIdentity:
+    """One (real or virtual) client pod: headers, connection budget and reconnect state"""
+
+    __slots__ = ('index', 'client_id', 'pod_name', 'pod_ip', 'max_connections', 'interval_scale',
+                 'connections', 'reconnect', 'next_attempt', 'slot_freed', 'attempts')
+
+    def __init__(self, index: int, client_id: str, pod_name: str, pod_ip: str, max_connections: int,
+                 interval_scale: float = 1.0):
+        self.index = index
+        self.client_id = client_id
+        self.pod_name = pod_name
+        self.pod_ip = pod_ip
+        self.max_connections = max_connections
+        self.interval_scale = interval_scale
+        self.connections: Set = set()
+        self.reconnect = ReconnectPolicy()
+        self.next_attempt = 0.0  # time.monotonic() before which no new connection is attempted
+        self.slot_freed: Optional[asyncio.Event] = None
+        self.attempts = 0
+
+    def headers(self, connection_id: int) -> Dict[str, str]:
+        return {
+            'X-Client-ID': self.client_id,
+            'X-Pod-Name': self.pod_name,
+            'X-Pod-IP': self.pod_ip,
+            'X-Connection-ID': str(connection_id)
+        }
+
+
+def identities_from_env(client_id: str, pod_name: str, pod_ip: str, max_connections: int,
+                        shard: int = 0, shards: int = 1) -> List[PodIdentity]:
+    """The identities hosted by worker `shard` of `shards`"""
+    count = int(os.getenv('VIRTUAL_PODS', '0'))
+    if 0 < count <= shard:
+        raise ValueError(f"Worker {shard} of {shards} has no identities: VIRTUAL_PODS={count} "
+                         f"must be at least CLIENT_WORKERS")
+    if count <= 0:
+        if shards > 1:
+            client_id = f"{client_id}-w{shard}"
+            # One pod identity across all workers: share its budget instead of multiplying it
+            max_connections = max_connections // shards + (1 if shard < max_connections % shards else 0)
+        return [PodIdentity(0, client_id, pod_name, pod_ip, max_connections)]
+    prefix = os.getenv('VIRTUAL_POD_PREFIX', f'{pod_name}-vpod')
+    base_ip = ipaddress.ip_address(os.getenv('VIRTUAL_POD_IP_BASE', '10.250.0.0'))
+    spread = float(os.getenv('VIRTUAL_POD_INTERVAL_SPREAD', '0'))
+    identities = []
+    for index in range(shard, count, shards):
+        # Seeded by index so an identity keeps its schedule across restarts and shardings
+        scale = random.Random(index).uniform(1 - spread, 1 + spread) if spread else 1.0
+        identities.append(PodIdentity(index, f"{client_id}-v{index:05d}", f"{prefix}-{index:05d}",
+                                      str(base_ip + index + 1), max_connections, scale))
+    return identities
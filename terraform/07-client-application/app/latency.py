@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Latency recording for the WebSocket client
+
+Log-linear (HDR-style) histograms:
+1. Values below 2^SUB_BUCKET_BITS are counted exactly
+2. Above that, every power-of-two range is split into 2^(SUB_BUCKET_BITS-1) linear
+   sub-buckets, so the relative error stays below 1/2^(SUB_BUCKET_BITS-1)
+3. Counts live in a flat list that only grows to the largest value seen,
+   about 1.4k slots for a 60 second range at microsecond resolution
+"""
+
+import json
+import logging
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+
+
+class LatencyHistogram:
+    """Log-linear histogram of non-negative integer values (microseconds)"""
+
+    SUB_BUCKET_BITS = 7
+
+    __slots__ = ('counts', 'total', 'min', 'max', 'sum')
+
+    def __init__(self):
+        self.counts: List[int] = []
+        self.total = 0
+        self.min: Optional[int] = None
+        self.max = 0
+        self.sum = 0
+
+    @classmethod
+    def index_for(cls, value: int) -> int:
+        sub_count = 1 << cls.SUB_BUCKET_BITS
+        if value < sub_count:
+            return value
+        half = sub_count >> 1
+        shift = value.bit_length() - cls.SUB_BUCKET_BITS
+        return sub_count + (shift - 1) * half + ((value >> shift) - half)
+
+    @classmethod
+    def bucket_bounds(cls, index: int):
+        """Lowest and highest value that map to the bucket at `index`"""
+        sub_count = 1 << cls.SUB_BUCKET_BITS
+        if index < sub_count:
+            return index, index
+        half = sub_count >> 1
+        offset = index - sub_count
+        shift = offset // half + 1
+        top = offset % half + half
+        return top << shift, ((top + 1) << shift) - 1
+
+    def record(self, value: int) -> None:
+        if value < 0:
+            value = 0
+        index = self.index_for(value)
+        counts = self.counts
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += 1
+        self.total += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def merge(self, other: 'LatencyHistogram') -> None:
+        if len(other.counts) > len(self.counts):
+            self.counts.extend([0] * (len(other.counts) - len(self.counts)))
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+
+    def percentile(self, percentile: float) -> int:
+        """Highest value equivalent to the given percentile (0 when empty)"""
+        if self.total == 0:
+            return 0
+        threshold = max(1, int(round(self.total * percentile / 100.0)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= threshold:
+                return min(self.bucket_bounds(index)[1], self.max)
+        return self.max
+
+    def mean(self) -> float:
+        return self.sum / self.total if self.total else 0.0
+
+    def summary(self) -> Dict[str, float]:
+        """Count, mean and percentiles in milliseconds"""
+        result = {'count': self.total, 'mean_ms': round(self.mean() / 1000.0, 3)}
+        for p in PERCENTILES:
+            result[f"p{p:g}_ms"] = round(self.percentile(p) / 1000.0, 3)
+        result['max_ms'] = round(self.max / 1000.0, 3)
+        return result
+
+    def to_dict(self) -> Dict:
+        """Sparse, mergeable representation for dumps"""
+        return {
+            'sub_bucket_bits': self.SUB_BUCKET_BITS,
+            'total': self.total,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'counts': {str(i): c for i, c in enumerate(self.counts) if c},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'LatencyHistogram':
+        if data.get('sub_bucket_bits', cls.SUB_BUCKET_BITS) != cls.SUB_BUCKET_BITS:
+            raise ValueError("histogram precision mismatch")
+        histogram = cls()
+        counts = {int(i): c for i, c in data.get('counts', {}).items()}
+        if counts:
+            histogram.counts = [0] * (max(counts) + 1)
+            for index, count in counts.items():
+                histogram.counts[index] = count
+        histogram.total = data.get('total', sum(counts.values()))
+        histogram.sum = data.get('sum', 0)
+        histogram.min = data.get('min')
+        histogram.max = data.get('max', 0)
+        return histogram
+
+    @classmethod
+    def merged(cls, histograms: Iterable['LatencyHistogram']) -> 'LatencyHistogram':
+        result = cls()
+        for histogram in histograms:
+            result.merge(histogram)
+        return result
+
+
+def format_summary(name: str, histogram: LatencyHistogram) -> str:
+    s = histogram.summary()
+    return (
+        f"{name}: n={s['count']} p50={s['p50_ms']}ms p90={s['p90_ms']}ms "
+        f"p99={s['p99_ms']}ms p99.9={s['p99.9_ms']}ms max={s['max_ms']}ms"
+    )
+
+
+class LatencyRecorder:
+    """Round-trip, connect and time-to-first-message histograms for one client"""
+
+    def __init__(self):
+        self.rtt_by_pod: Dict[str, LatencyHistogram] = {}
+        self.connect = LatencyHistogram()
+        self.first_message = LatencyHistogram()
+        self.lost_replies = 0
+        self.unmatched_replies = 0
+
+    def record_rtt(self, pod_ip: str, micros: int) -> None:
+        histogram = self.rtt_by_pod.get(pod_ip)
+        if histogram is None:
+            histogram = self.rtt_by_pod[pod_ip] = LatencyHistogram()
+        histogram.record(micros)
+
+    def merged_rtt(self) -> LatencyHistogram:
+        return LatencyHistogram.merged(self.rtt_by_pod.values())
+
+    def report_lines(self) -> List[str]:
+        lines = [format_summary("rtt (all pods)", self.merged_rtt())]
+        for pod_ip in sorted(self.rtt_by_pod):
+            lines.append(format_summary(f"rtt pod {pod_ip}", self.rtt_by_pod[pod_ip]))
+        lines.append(format_summary("connect", self.connect))
+        lines.append(format_summary("first message", self.first_message))
+        if self.lost_replies or self.unmatched_replies:
+            lines.append(f"lost replies={self.lost_replies} unmatched replies={self.unmatched_replies}")
+        return lines
+
+    def to_dict(self) -> Dict:
+        return {
+            'summary': {
+                'rtt': self.merged_rtt().summary(),
+                'rtt_by_pod': {pod: h.summary() for pod, h in sorted(self.rtt_by_pod.items())},
+                'connect': self.connect.summary(),
+                'first_message': self.first_message.summary(),
+                'lost_replies': self.lost_replies,
+                'unmatched_replies': self.unmatched_replies,
+            },
+            'histograms': {
+                'rtt': self.merged_rtt().to_dict(),
+                'rtt_by_pod': {pod: h.to_dict() for pod, h in self.rtt_by_pod.items()},
+                'connect': self.connect.to_dict(),
+                'first_message': self.first_message.to_dict(),
+            },
+        }
+
+    def dump(self, path: Optional[str]) -> None:
+        """Log the final report and optionally write histograms as JSON"""
+        for line in self.report_lines():
+            logger.info(f"Latency {line}")
+        if path:
+            try:
+                with open(path, 'w') as f:
+                    json.dump(self.to_dict(), f, indent=2)
+                logger.info(f"Latency histograms written to {path}")
+            except OSError as e:
+                logger.error(f"Could not write latency histograms to {path}: {e}")
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Open-loop load generator for the WebSocket client
+
+Drives WebSocketClient.create_connection() from an arrival schedule instead of
+the one-connection-per-interval connection manager:
+1. Arrivals follow a constant, step, Poisson or burst schedule (connections/sec)
+2. Arrival times are absolute, so a saturated event loop catches up instead of drifting
+3. Concurrent handshakes are bounded by a semaphore; excess arrivals wait in a bounded backlog
+4. Arrivals are skipped once the target number of concurrent connections is reached
+"""
+
+import asyncio
+import logging
+import os
+import random
+import resource
+from typing import Iterator, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class ArrivalSchedule:
+    """Base class for arrival schedules; yields gaps (seconds) between arrivals"""
+
+    name = "base"
+
+    def gaps(self) -> Iterator[float]:
+        raise NotImplementedError
+
+    def describe(self) -> str:
+        return self.name
+
+
+class ConstantSchedule(ArrivalSchedule):
+    """Fixed arrival rate"""
+
+    name = "constant"
+
+    def __init__(self, rate: float):
+        if rate <= 0:
+            raise ValueError("constant schedule requires LOAD_RATE > 0")
+        self.rate = rate
+
+    def gaps(self) -> Iterator[float]:
+        gap = 1.0 / self.rate
+        while True:
+            yield gap
+
+    def describe(self) -> str:
+        return f"constant {self.rate:g}/s"
+
+
+class PoissonSchedule(ArrivalSchedule):
+    """Exponentially distributed gaps with the given mean rate"""
+
+    name = "poisson"
+
+    def __init__(self, rate: float, seed: Optional[int] = None):
+        if rate <= 0:
+            raise ValueError("poisson schedule requires LOAD_RATE > 0")
+        self.rate = rate
+        self.random = random.Random(seed)
+
+    def gaps(self) -> Iterator[float]:
+        while True:
+            yield self.random.expovariate(self.rate)
+
+    def describe(self) -> str:
+        return f"poisson mean {self.rate:g}/s"
+
+
+class StepSchedule(ArrivalSchedule):
+    """Rate starts at `rate` and increases by `increment` every `step_seconds`, up to `max_rate`"""
+
+    name = "step"
+
+    def __init__(self, rate: float, increment: float, step_seconds: float, max_rate: float = 0):
+        if rate <= 0 or step_seconds <= 0:
+            raise ValueError("step schedule requires LOAD_RATE > 0 and LOAD_STEP_SECONDS > 0")
+        self.rate = rate
+        self.increment = increment
+        self.step_seconds = step_seconds
+        self.max_rate = max_rate
+
+    def rate_at(self, elapsed: float) -> float:
+        rate = self.rate + int(elapsed // self.step_seconds) * self.increment
+        if self.max_rate > 0:
+            rate = min(rate, self.max_rate)
+        return max(rate, 1e-6)
+
+    def gaps(self) -> Iterator[float]:
+        # Rate is derived from schedule time, not wall time, so the ramp stays
+        # exact even when the loop falls behind
+        elapsed = 0.0
+        while True:
+            gap = 1.0 / self.rate_at(elapsed)
+            elapsed += gap
+            yield gap
+
+    def describe(self) -> str:
+        ceiling = f" up to {self.max_rate:g}/s" if self.max_rate > 0 else ""
+        return f"step {self.rate:g}/s +{self.increment:g}/s every {self.step_seconds:g}s{ceiling}"
+
+
+class BurstSchedule(ArrivalSchedule):
+    """`size` simultaneous arrivals every `interval` seconds"""
+
+    name = "burst"
+
+    def __init__(self, size: int, interval: float):
+        if size <= 0 or interval <= 0:
+            raise ValueError("burst schedule requires LOAD_BURST_SIZE > 0 and LOAD_BURST_INTERVAL > 0")
+        self.size = size
+        self.interval = interval
+
+    def gaps(self) -> Iterator[float]:
+        while True:
+            yield self.interval
+            for _ in range(self.size - 1):
+                yield 0.0
+
+    def describe(self) -> str:
+        return f"burst {self.size} every {self.interval:g}s"
+
+
+def schedule_from_env() -> ArrivalSchedule:
+    """Build the arrival schedule from LOAD_* environment variables"""
+    kind = os.getenv('LOAD_ARRIVAL', 'constant').lower()
+    rate = float(os.getenv('LOAD_RATE', '100'))
+
+    if kind == 'constant':
+        return ConstantSchedule(rate)
+    if kind == 'poisson':
+        seed = os.getenv('LOAD_SEED')
+        return PoissonSchedule(rate, int(seed) if seed else None)
+    if kind == 'step':
+        return StepSchedule(
+            rate,
+            float(os.getenv('LOAD_STEP_INCREMENT', str(rate))),
+            float(os.getenv('LOAD_STEP_SECONDS', '10')),
+            float(os.getenv('LOAD_MAX_RATE', '0')),
+        )
+    if kind == 'burst':
+        return BurstSchedule(
+            int(os.getenv('LOAD_BURST_SIZE', '1000')),
+            float(os.getenv('LOAD_BURST_INTERVAL', '10')),
+        )
+    raise ValueError(f"Unknown LOAD_ARRIVAL: {kind}")
+
+
+def raise_nofile_limit() -> int:
+    """Raise the soft open-file limit to the hard limit; returns the new soft limit"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        target = hard if hard != resource.RLIM_INFINITY else max(soft, 1048576)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            soft = target
+        except (ValueError, OSError) as e:
+            logger.warning(f"Could not raise RLIMIT_NOFILE: {e}")
+    return soft
+
+
+class LoadGenerator:
+    """Open-loop connection arrivals driving an existing WebSocketClient"""
+
+    # Arrivals launched back-to-back before yielding to the loop while catching up
+    CATCH_UP_BATCH = 256
+    # Slip beyond timer resolution that counts an arrival as late
+    LATE_THRESHOLD = 0.001
+
+    def __init__(self, client, schedule: ArrivalSchedule):
+        self.client = client
+        self.schedule = schedule
+        self.target_connections = int(os.getenv('LOAD_TARGET_CONNECTIONS', str(client.connection_budget)))
+        self.max_handshakes = int(os.getenv('LOAD_MAX_HANDSHAKES', '500'))
+        self.max_backlog = int(os.getenv('LOAD_MAX_BACKLOG', '10000'))
+        self.duration = float(os.getenv('LOAD_DURATION', '0'))  # 0 = run until stopped
+
+        self.handshake_slots = asyncio.Semaphore(self.max_handshakes)
+        self.pending: Set[asyncio.Task] = set()
+        self.next_connection_id = 0
+
+        # Counters
+        self.arrivals = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.capped = 0   # skipped because target concurrency was reached
+        self.shed = 0     # dropped because the handshake backlog was full
+        self.late = 0     # launched after their scheduled time
+        self.max_lag = 0.0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self.pending)
+
+    async def _arrival(self, connection_id: int) -> None:
+        async with self.handshake_slots:
+            if await self.client.create_connection(connection_id):
+                self.succeeded += 1
+            else:
+                self.failed += 1
+
+    def _launch(self) -> None:
+        self.arrivals += 1
+        if len(self.client.connections) + self.in_flight >= self.target_connections:
+            self.capped += 1
+            return
+        if self.in_flight >= self.max_backlog:
+            self.shed += 1
+            return
+        self.next_connection_id += 1
+        task = asyncio.create_task(self._arrival(self.next_connection_id))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def run(self) -> None:
+        """Launch arrivals on schedule until stopped or LOAD_DURATION elapses"""
+        loop = asyncio.get_running_loop()
+        nofile = raise_nofile_limit()
+        logger.info(
+            f"Load mode: {self.schedule.describe()}, target {self.target_connections} connections, "
+            f"max {self.max_handshakes} concurrent handshakes, RLIMIT_NOFILE {nofile}"
+        )
+        if nofile < self.target_connections + 64:
+            logger.warning(f"RLIMIT_NOFILE {nofile} is below the connection target {self.target_connections}")
+
+        start = loop.time()
+        deadline = start + self.duration if self.duration > 0 else None
+        scheduled = start
+        burst = 0
+
+        for gap in self.schedule.gaps():
+            if not self.client.running:
+                break
+            scheduled += gap
+            if deadline is not None and scheduled > deadline:
+                break
+
+            now = loop.time()
+            if scheduled > now:
+                burst = 0
+                await asyncio.sleep(scheduled - now)
+            else:
+                # Due or behind schedule: launch immediately, yielding periodically
+                # so handshakes and message handlers keep making progress
+                lag = now - scheduled
+                if gap > 0 and lag > self.LATE_THRESHOLD:
+                    self.late += 1
+                    if lag > self.max_lag:
+                        self.max_lag = lag
+                burst += 1
+                if burst >= self.CATCH_UP_BATCH:
+                    burst = 0
+                    await asyncio.sleep(0)
+
+            self._launch()
+
+        logger.info(f"Load schedule finished: {self.summary()}")
+
+    def summary(self) -> str:
+        return (
+            f"arrivals={self.arrivals} ok={self.succeeded} failed={self.failed} "
+            f"capped={self.capped} shed={self.shed} in_flight={self.in_flight} "
+            f"active={len(self.client.connections)} late={self.late} max_lag={self.max_lag * 1000:.1f}ms"
+        )
+
+    async def stop(self) -> None:
+        for task in list(self.pending):
+            task.cancel()
+        if self.pending:
+            await asyncio.gather(*self.pending, return_exceptions=True)
+
+
+def load_mode_enabled() -> bool:
+    return os.getenv('CLIENT_MODE', 'steady').lower() == 'load'
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Queue-backed logging shared by the WebSocket server and client
+
+1. Records are put on a bounded queue by a QueueHandler on the event loop and written to
+   stdout by a QueueListener thread; when the queue is full the record is dropped and
+   counted instead of blocking the loop
+2. Messages are formatted in the writer thread: call sites pass %-style arguments (and
+   `extra` fields) rather than pre-formatted strings, so records that are filtered out or
+   dropped are never formatted
+3. LOG_FORMAT=json (default) writes one JSON object per line, with `extra` fields as
+   top-level keys; LOG_FORMAT=text keeps the classic "time - name - level - message" lines
+4. Per-message events go through a Sampler (LOG_MESSAGE_SAMPLE): `all`, `off`, `every:N`
+   (1 in N events) or `rate:N` (the first N events per second per connection)
+
+LOG_LEVEL (default INFO) and LOG_QUEUE_SIZE (default 10000) set the level and queue bound.
+attach_metrics() exports dropped/sampled-out counts and the queue depth.
+
+This file is shared between the server and client applications: keep both copies identical.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Hashable, List, Optional
+
+from metrics import Counter, Registry
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else on a record came from `extra`
+_RESERVED = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, msg, extra fields, exc"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks and leaves formatting to the listener thread"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = Counter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The base class formats here, on the caller's thread. Only tracebacks are rendered
+        # early (they reference frames that will not outlive the caller); everything else
+        # is formatted by the writer.
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped.inc()
+
+
+class Sampler:
+    """Decides which per-message events are logged (see LOG_MESSAGE_SAMPLE)"""
+
+    def __init__(self, spec: Optional[str] = None):
+        spec = (spec or os.getenv('LOG_MESSAGE_SAMPLE', 'rate:1')).lower()
+        self.spec = spec
+        self.every = 0      # 1-in-N mode
+        self.per_second = 0  # first-N-per-second-per-key mode
+        self.enabled = spec != 'off'
+        if spec.startswith('every:'):
+            self.every = int(spec[6:])
+        elif spec.startswith('rate:'):
+            self.per_second = int(spec[5:])
+        elif spec not in ('all', 'off'):
+            raise ValueError(f"Unknown LOG_MESSAGE_SAMPLE: {spec} (all, off, every:N or rate:N)")
+        if spec.startswith(('every:', 'rate:')) and max(self.every, self.per_second) < 1:
+            raise ValueError(f"LOG_MESSAGE_SAMPLE {spec}: N must be at least 1")
+        self.seen = 0
+        self.window = 0
+        self.counts: Dict[Hashable, int] = {}
+        self.suppressed = Counter()
+
+    def allow(self, key: Hashable = None) -> bool:
+        if not self.enabled:
+            return False
+        if self.every:
+            self.seen += 1
+            if self.seen % self.every == 1 or self.every == 1:
+                return True
+        elif self.per_second:
+            second = int(time.monotonic())
+            if second != self.window:
+                # Only the current second matters: old counts are dropped wholesale
+                self.window = second
+                self.counts.clear()
+            count = self.counts.get(key, 0)
+            if count < self.per_second:
+                self.counts[key] = count + 1
+                return True
+        else:
+            return True
+        self.suppressed.inc()
+        return False
+
+
+class _Pipeline:
+    """Module state: the installed handler/listener and where sampled-out events are counted"""
+    handler: Optional[DroppingQueueHandler] = None
+    listener: Optional[logging.handlers.QueueListener] = None
+    samplers: List[Sampler] = []
+    sampled_out: Any = None
+
+
+def configure_logging() -> None:
+    """Route the root logger through the queue; safe to call more than once"""
+    if _Pipeline.listener is not None:
+        return
+    output = logging.StreamHandler(sys.stdout)
+    if os.getenv('LOG_FORMAT', 'json').lower() == 'text':
+        output.setFormatter(logging.Formatter(TEXT_FORMAT))
+    else:
+        output.setFormatter(JsonFormatter())
+    log_queue: queue.Queue = queue.Queue(int(os.getenv('LOG_QUEUE_SIZE', '10000')))
+    handler = DroppingQueueHandler(log_queue)
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    listener = logging.handlers.QueueListener(log_queue, output)
+    listener.start()
+    _Pipeline.handler, _Pipeline.listener = handler, listener
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Write out queued records and stop the writer thread"""
+    listener = _Pipeline.listener
+    if listener is not None:
+        _Pipeline.listener = None
+        listener.stop()
+
+
+def message_sampler(spec: Optional[str] = None) -> Sampler:
+    """A Sampler whose suppressed events are counted by attach_metrics()"""
+    sampler = Sampler(spec)
+    if _Pipeline.sampled_out is not None:
+        sampler.suppressed = _Pipeline.sampled_out
+    _Pipeline.samplers.append(sampler)
+    return sampler
+
+
+def attach_metrics(registry: Registry) -> None:
+    """Export dropped and sampled-out records; counts from before the call are carried over"""
+    dropped = registry.counter('log_records_dropped_total', 'Log records dropped because the log queue was full')
+    sampled_out = registry.counter('log_events_sampled_out_total', 'Per-message log events skipped by LOG_MESSAGE_SAMPLE')
+    handler = _Pipeline.handler
+    if handler is not None:
+        dropped.inc(handler.dropped.value)
+        handler.dropped = dropped
+        registry.gauge('log_queue_depth', 'Log records waiting for the writer thread').set_function(handler.queue.qsize)
+    for sampler in _Pipeline.samplers:
+        sampled_out.inc(sampler.suppressed.value)
+        sampler.suppressed = sampled_out
+    _Pipeline.sampled_out = sampled_out
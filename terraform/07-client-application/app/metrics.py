@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Prometheus-style metrics for the WebSocket server and client
+
+Shared between 05-server-application/app and 07-client-application/app; keep
+both copies identical.
+
+Hot-path updates are plain attribute arithmetic on pre-created objects:
+1. Counter.inc() and Gauge.set() are a single attribute update
+2. Histogram.observe() is one bisect over a short bucket list plus two additions
+3. Labeled children are created once and cached; hot paths hold on to the child
+4. Expensive values (queue depths, totals over all connections) are computed
+   by collector callbacks at scrape time, never per message
+"""
+
+import asyncio
+import logging
+import math
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Buckets (seconds) for sub-millisecond hot-path timings such as JSON encode/decode
+FAST_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+# Buckets (seconds) for network latencies and event-loop lag
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """Monotonically increasing value"""
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class Gauge:
+    """Value that can go up and down, or be computed at scrape time"""
+
+    __slots__ = ('value', 'function')
+
+    def __init__(self):
+        self.value = 0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is not None:
+            try:
+                return self.function()
+            except Exception as e:
+                logger.debug(f"Gauge callback failed: {e}")
+                return 0
+        return self.value
+
+
+class Histogram:
+    """Cumulative-bucket histogram (bucket counts are stored non-cumulative)"""
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricFamily:
+    """A named metric with optional labels; unlabeled families have a single child"""
+
+    def __init__(self, kind: str, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 factory: Callable = Counter, aggregate: str = 'sum'):
+        self.kind = kind
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.aggregate = aggregate  # how gauges combine across processes: 'sum' or 'max'
+        self._factory = factory
+        self.children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self.children[()] = factory()
+
+    def labels(self, *values: str):
+        """Get (or create) the child for the given label values; cache the result on hot paths"""
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        child = self.children.get(key)
+        if child is None:
+            child = self.children[key] = self._factory()
+        return child
+
+    # Unlabeled shortcuts
+    def _only(self):
+        return self.children[()]
+
+    def inc(self, amount: float = 1) -> None:
+        self._only().inc(amount)
+
+    def set(self, value: float) -> None:
+        self._only().set(value)
+
+    def dec(self, amount: float = 1) -> None:
+        self._only().dec(amount)
+
+    def observe(self, value: float) -> None:
+        self._only().observe(value)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._only().set_function(function)
+
+    @property
+    def value(self) -> float:
+        child = self._only()
+        return child.get() if isinstance(child, Gauge) else child.value
+
+    def snapshot(self) -> Dict:
+        """Plain-data copy of all children, suitable for pickling and merging"""
+        samples = []
+        for key, child in self.children.items():
+            if self.kind == 'histogram':
+                value = {'bounds': list(child.bounds), 'counts': list(child.counts),
+                         'sum': child.sum, 'count': child.count}
+            else:
+                value = child.get() if isinstance(child, Gauge) else child.value
+            samples.append((list(key), value))
+        return {'name': self.name, 'kind': self.kind, 'help': self.help,
+                'labelnames': list(self.labelnames), 'aggregate': self.aggregate,
+                'samples': samples}
+
+
+def _render_family(family: Dict) -> List[str]:
+    name, labelnames = family['name'], family['labelnames']
+    lines = [f"# HELP {name} {family['help']}", f"# TYPE {name} {family['kind']}"]
+    for key, value in family['samples']:
+        if family['kind'] == 'histogram':
+            cumulative = 0
+            for bound, count in zip(value['bounds'] + [math.inf], value['counts']):
+                cumulative += count
+                labels = _format_labels(labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{name}_bucket{labels} {cumulative}")
+            labels = _format_labels(labelnames, key)
+            lines.append(f"{name}_sum{labels} {_format_value(value['sum'])}")
+            lines.append(f"{name}_count{labels} {value['count']}")
+        else:
+            lines.append(f"{name}{_format_labels(labelnames, key)} {_format_value(value)}")
+    return lines
+
+
+def render_snapshot(snapshot: List[Dict]) -> str:
+    """Prometheus text exposition of a registry snapshot"""
+    lines: List[str] = []
+    for family in snapshot:
+        lines.extend(_render_family(family))
+    return "\n".join(lines) + "\n"
+
+
+def merge_snapshots(snapshots: Iterable[List[Dict]], include_gauges: bool = True) -> List[Dict]:
+    """Combine snapshots from several processes into one.
+
+    Counters and histograms are summed; gauges are summed or maxed according
+    to their family's `aggregate` setting, or dropped when include_gauges is False.
+    """
+    merged: Dict[str, Dict] = {}
+    for snapshot in snapshots:
+        for family in snapshot:
+            if family['kind'] == 'gauge' and not include_gauges:
+                continue
+            target = merged.get(family['name'])
+            if target is None:
+                target = merged[family['name']] = dict(family, samples=[])
+                target['_index'] = {}
+            index = target['_index']
+            for key, value in family['samples']:
+                slot = index.get(tuple(key))
+                if slot is None:
+                    if isinstance(value, dict):
+                        value = dict(value, counts=list(value['counts']))
+                    index[tuple(key)] = len(target['samples'])
+                    target['samples'].append((key, value))
+                    continue
+                current = target['samples'][slot][1]
+                if family['kind'] == 'histogram':
+                    current['counts'] = [a + b for a, b in zip(current['counts'], value['counts'])]
+                    current['sum'] += value['sum']
+                    current['count'] += value['count']
+                elif family['kind'] == 'gauge' and family.get('aggregate') == 'max':
+                    target['samples'][slot] = (key, max(current, value))
+                else:
+                    target['samples'][slot] = (key, current + value)
+    result = []
+    for family in merged.values():
+        family.pop('_index')
+        result.append(family)
+    return result
+
+
+class Registry:
+    """Collection of metric families rendered in the Prometheus text format"""
+
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self.families: Dict[str, MetricFamily] = {}
+        self.collectors: List[Callable[[], None]] = []
+
+    def _register(self, family: MetricFamily) -> MetricFamily:
+        if family.name in self.families:
+            raise ValueError(f"Duplicate metric {family.name}")
+        self.families[family.name] = family
+        return family
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> MetricFamily:
+        return self._register(MetricFamily('counter', self.prefix + name, help_text, labelnames, Counter))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+              aggregate: str = 'sum') -> MetricFamily:
+        return self._register(MetricFamily('gauge', self.prefix + name, help_text, labelnames, Gauge, aggregate))
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                  labelnames: Sequence[str] = ()) -> MetricFamily:
+        bounds = tuple(sorted(buckets))
+        return self._register(MetricFamily(
+            'histogram', self.prefix + name, help_text, labelnames, lambda: Histogram(bounds)))
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """Register a callback that refreshes gauges right before each scrape"""
+        self.collectors.append(collector)
+
+    def collect(self) -> None:
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+
+    def snapshot(self) -> List[Dict]:
+        self.collect()
+        return [family.snapshot() for family in self.families.values()]
+
+    def render(self) -> str:
+        return render_snapshot(self.snapshot())
+
+
+class LoopLagMonitor:
+    """Measures event-loop lag as the oversleep of a periodic timer"""
+
+    def __init__(self, registry: Registry, interval: float = 0.5):
+        self.interval = interval
+        self.lag = registry.gauge('event_loop_lag_seconds', 'Most recent event-loop lag', aggregate='max')
+        self.lag_max = registry.gauge('event_loop_lag_max_seconds', 'Largest event-loop lag observed', aggregate='max')
+        self.lag_histogram = registry.histogram('event_loop_lag_hist_seconds', 'Event-loop lag distribution')
+        self.task: Optional[asyncio.Task] = None
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.lag.set(lag)
+            if lag > self.lag_max.value:
+                self.lag_max.set(lag)
+            self.lag_histogram.observe(lag)
+
+    def start(self) -> asyncio.Task:
+        self.task = asyncio.create_task(self.run())
+        return self.task
+
+    def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
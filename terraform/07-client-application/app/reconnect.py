@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Reconnect scheduling for the WebSocket client
+
+Clients that lose their connections at the same moment (a rolling deploy drains a server
+pod) must not all come back at the same moment, or the reconnect wave trips Envoy's
+local_ratelimit and the Redis admission limits. Every reconnect therefore waits a delay:
+1. Expected closes (1000 normal, 1001 going away / server draining, 1012 service restart)
+   wait uniform(0, RECONNECT_BASE) and do not escalate
+2. Anything else (1006 abnormal, 1008 policy/slow consumer, 1011, 1013 try again later,
+   failed handshakes) escalates exponentially with full jitter:
+   uniform(0, min(RECONNECT_MAX, RECONNECT_BASE * 2^attempt))
+3. A retry hint is added on top: `Retry-After` on a rejected handshake (429/503) or
+   `retry_after=N` in the close reason (sent by a draining server). Adding rather than
+   taking the maximum keeps clients that got the same hint from retrying together
+
+The escalation resets once a connection has received its first reply.
+"""
+
+import os
+import random
+import re
+from typing import Optional
+
+import websockets
+
+EXPECTED_CLOSE_CODES = frozenset({1000, 1001, 1012})
+
+DELAY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+
+_RETRY_AFTER_REASON = re.compile(r'retry_after=(\d+(?:\.\d+)?)')
+
+
+def close_retry_hint(reason: str) -> float:
+    """Seconds from a `retry_after=N` close reason, 0 without one"""
+    match = _RETRY_AFTER_REASON.search(reason or '')
+    return float(match.group(1)) if match else 0.0
+
+
+def handshake_retry_hint(error: BaseException) -> float:
+    """Seconds from the Retry-After header of a rejected handshake, 0 without one"""
+    headers = getattr(error, 'headers', None)
+    value = headers.get('Retry-After') if headers is not None else None
+    try:
+        return max(0.0, float(value)) if value else 0.0
+    except ValueError:
+        # HTTP-date form: not worth parsing here, fall back to the backoff
+        return 0.0
+
+
+class ReconnectPolicy:
+    """Exponential backoff with full jitter; one instance per pod identity (PodIdentity.reconnect), shared by its connections"""
+
+    def __init__(self, base: Optional[float] = None, cap: Optional[float] = None):
+        self.base = base if base is not None else float(os.getenv('RECONNECT_BASE', '1'))
+        self.cap = cap if cap is not None else float(os.getenv('RECONNECT_MAX', '60'))
+        self.attempt = 0
+
+    def reset(self) -> None:
+        self.attempt = 0
+
+    def _escalate(self) -> float:
+        delay = random.uniform(0, min(self.cap, self.base * (2 ** self.attempt)))
+        self.attempt = min(self.attempt + 1, 32)
+        return delay
+
+    def after_close(self, code: Optional[int], reason: str = '') -> float:
+        """Delay before replacing a connection the server closed with `code`"""
+        if code in EXPECTED_CLOSE_CODES:
+            delay = random.uniform(0, self.base)
+        else:
+            delay = self._escalate()
+        return close_retry_hint(reason) + delay
+
+    def after_failure(self, error: BaseException) -> float:
+        """Delay before retrying a failed connection attempt"""
+        delay = self._escalate()
+        if isinstance(error, websockets.exceptions.InvalidStatusCode):
+            delay += handshake_retry_hint(error)
+        return delay
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Time-accurate replay of a captured traffic trace (traffic.py) for the WebSocket client
+
+CLIENT_MODE=replay drives WebSocketClient from REPLAY_TRACE instead of the connection
+manager and its random message intervals:
+1. Every OPEN in the trace opens a connection, every CLIENT_MESSAGE sends a ping padded to
+   the recorded size and every CLOSE closes the connection (server-to-client records are
+   only used for the trace summary)
+2. Event times are absolute offsets from the start of the replay divided by REPLAY_SPEED, so
+   REPLAY_SPEED=10 plays a 10-minute capture in one minute and a busy loop catches up rather
+   than drifting; events that fire late are counted
+3. REPLAY_COPIES=N replays every traced connection N times in parallel (shared between
+   CLIENT_WORKERS by copy index), REPLAY_LOOP=true starts the trace over when it ends
+4. Messages for a connection whose handshake is still in flight are sent once it completes
+
+Replies are matched and timed like any other ping, so the latency report applies as is.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional, Set, Tuple
+
+from traffic import CLIENT_MESSAGE, CLOSE, OPEN, read_trace
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayConnection:
+    """One replayed connection: its WebSocket once the handshake is done, sends queued until then"""
+
+    __slots__ = ('connection_id', 'websocket', 'pending', 'close_code')
+
+    def __init__(self, connection_id: int):
+        self.connection_id = connection_id
+        self.websocket = None
+        self.pending: List[int] = []  # message sizes sent while the handshake was in flight
+        self.close_code: Optional[int] = None  # CLOSE seen while the handshake was in flight
+
+
+def close_code_to_send(code: int) -> int:
+    """Codes a client may put in a close frame; anything else (1006, none, ...) becomes 1000"""
+    return code if code in (1000, 1001) or 3000 <= code <= 4999 else 1000
+
+
+class TraceReplayer:
+    """Replays one trace file against an existing WebSocketClient"""
+
+    # Events dispatched back-to-back before yielding to the loop while catching up
+    CATCH_UP_BATCH = 256
+    # Slip beyond timer resolution that counts an event as late
+    LATE_THRESHOLD = 0.001
+
+    def __init__(self, client, path: str, speed: float = 1.0, copies: int = 1, repeat: bool = False,
+                 shard: int = 0, shards: int = 1):
+        if speed <= 0:
+            raise ValueError("REPLAY_SPEED must be > 0")
+        self.client = client
+        self.path = path
+        self.speed = speed
+        self.copies = [copy for copy in range(copies) if copy % shards == shard]
+        self.repeat = repeat
+        self.connections: Dict[Tuple[int, int], ReplayConnection] = {}
+        self.handshakes: Set[asyncio.Task] = set()
+
+        # Counters
+        self.passes = 0
+        self.opened = 0
+        self.failed = 0
+        self.sent = 0
+        self.skipped = 0  # messages for connections that failed or were already closed
+        self.closed = 0
+        self.late = 0
+        self.max_lag = 0.0
+
+    async def run(self) -> None:
+        # No up-front summary: reading a large trace here would stall the loop before the
+        # first event (`python traffic.py FILE` prints it offline)
+        logger.info(f"Replay mode: {self.path} at {self.speed:g}x, copies {self.copies}, "
+                    f"loop={'on' if self.repeat else 'off'}")
+        loop = asyncio.get_running_loop()
+        while self.client.running:
+            self.passes += 1
+            start = loop.time()
+            burst = 0
+            for offset, kind, traced, value in read_trace(self.path):
+                if not self.client.running:
+                    return
+                due = start + offset / self.speed
+                now = loop.time()
+                if due > now:
+                    burst = 0
+                    await asyncio.sleep(due - now)
+                else:
+                    lag = now - due
+                    if lag > self.LATE_THRESHOLD:
+                        self.late += 1
+                        if lag > self.max_lag:
+                            self.max_lag = lag
+                    burst += 1
+                    if burst >= self.CATCH_UP_BATCH:
+                        burst = 0
+                        await asyncio.sleep(0)
+                for copy in self.copies:
+                    self.dispatch(kind, (traced, copy), value)
+            logger.info(f"Replay pass {self.passes} finished: {self.summary()}")
+            if not self.repeat:
+                return
+            await self.close_all()
+
+    def dispatch(self, kind: int, key: Tuple[int, int], value: int) -> None:
+        if kind == OPEN:
+            self.open(key)
+        elif kind == CLIENT_MESSAGE:
+            self.send(key, value)
+        elif kind == CLOSE:
+            self.close(key, value)
+
+    def open(self, key: Tuple[int, int]) -> None:
+        connection = self.connections[key] = ReplayConnection(next(self.client.connection_ids))
+        task = asyncio.create_task(self._handshake(key, connection))
+        self.handshakes.add(task)
+        task.add_done_callback(self.handshakes.discard)
+
+    async def _handshake(self, key: Tuple[int, int], connection: ReplayConnection) -> None:
+        websocket = await self.client.create_connection(connection.connection_id)
+        if websocket is None:
+            self.failed += 1
+            self.skipped += len(connection.pending)
+            if self.connections.get(key) is connection:
+                del self.connections[key]
+            return
+        self.opened += 1
+        connection.websocket = websocket
+        pending, connection.pending = connection.pending, []
+        for size in pending:
+            self.send(key, size, connection)
+        if connection.close_code is not None:
+            self.close(key, connection.close_code, connection)
+
+    def send(self, key: Tuple[int, int], size: int, connection: Optional[ReplayConnection] = None) -> None:
+        connection = connection or self.connections.get(key)
+        if connection is None:
+            self.skipped += 1
+            return
+        websocket = connection.websocket
+        if websocket is None:
+            connection.pending.append(size)
+        elif websocket.open:
+            self.client.send_message(websocket, connection.connection_id, size=size)
+            self.sent += 1
+        else:
+            self.skipped += 1
+
+    def close(self, key: Tuple[int, int], code: int, connection: Optional[ReplayConnection] = None) -> None:
+        connection = connection or self.connections.get(key)
+        if connection is None:
+            return
+        if connection.websocket is None:
+            connection.close_code = code
+            return
+        if self.connections.get(key) is connection:
+            del self.connections[key]
+        self.closed += 1
+        asyncio.create_task(connection.websocket.close(close_code_to_send(code)))
+
+    async def close_all(self) -> None:
+        """Close what the trace left open, before the next pass opens its own connections"""
+        await self.stop()
+        open_sockets = [c.websocket for c in self.connections.values() if c.websocket is not None]
+        self.connections.clear()
+        if open_sockets:
+            await asyncio.gather(*(ws.close() for ws in open_sockets), return_exceptions=True)
+
+    def summary(self) -> str:
+        return (
+            f"passes={self.passes} opened={self.opened} failed={self.failed} sent={self.sent} "
+            f"skipped={self.skipped} closed={self.closed} handshaking={len(self.handshakes)} "
+            f"active={len(self.client.connections)} late={self.late} max_lag={self.max_lag * 1000:.1f}ms"
+        )
+
+    async def stop(self) -> None:
+        for task in list(self.handshakes):
+            task.cancel()
+        if self.handshakes:
+            await asyncio.gather(*self.handshakes, return_exceptions=True)
+
+
+def replay_mode_enabled() -> bool:
+    return os.getenv('CLIENT_MODE', 'steady').lower() == 'replay'
+
+
+def replayer_from_env(client, shard: int = 0, shards: int = 1) -> TraceReplayer:
+    path = os.getenv('REPLAY_TRACE')
+    if not path:
+        raise ValueError("CLIENT_MODE=replay requires REPLAY_TRACE")
+    return TraceReplayer(
+        client,
+        path,
+        float(os.getenv('REPLAY_SPEED', '1')),
+        int(os.getenv('REPLAY_COPIES', '1')),
+        os.getenv('REPLAY_LOOP', 'false').lower() in ('1', 'true', 'yes'),
+        shard,
+        shards,
+    )
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Shared send scheduler for the WebSocket client
+
+One hashed timer wheel drives the send times of every connection instead of a
+sleep/timeout handle per connection:
+1. Time is divided into ticks of SCHEDULER_TICK_MS; a timer due in N ticks goes into
+   slot (now + N) % slots with the number of full wheel turns still to wait
+2. One task wakes once per tick, fires the timers in the current slot and goes back
+   to sleep, so loop wake-ups depend on the tick, not on the number of connections
+3. When no timers are pending the task waits on an event instead of ticking
+4. Cancelling a timer only marks it; it is dropped when its slot comes round
+
+Delays are rounded up to whole ticks counted from the current tick, which may already be
+partly elapsed: a timer fires within one tick of its delay, early or late (plus any loop
+stall, counted in late_ticks).
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Timer:
+    """A scheduled callback; returned by TimerWheel.schedule()"""
+
+    __slots__ = ('deadline', 'rounds', 'callback', 'argument', 'cancelled')
+
+    def __init__(self, deadline: int, rounds: int, callback: Callable[[Any], None], argument: Any):
+        self.deadline = deadline
+        self.rounds = rounds
+        self.callback = callback
+        self.argument = argument
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class TimerWheel:
+    """Hashed timer wheel; callbacks run on the event loop and must not block"""
+
+    def __init__(self, tick: Optional[float] = None, slots: Optional[int] = None):
+        self.tick = tick if tick is not None else float(os.getenv('SCHEDULER_TICK_MS', '10')) / 1000
+        self.slots: List[List[Timer]] = [[] for _ in range(slots or int(os.getenv('SCHEDULER_SLOTS', '512')))]
+        self.current = 0          # ticks processed so far
+        self.started_at = 0.0     # loop time of tick 0
+        self.pending = 0
+        self.fired = 0
+        self.late_ticks = 0       # ticks that were processed after their time had passed
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return self.pending
+
+    def schedule(self, delay: float, callback: Callable[[Any], None], argument: Any = None) -> Timer:
+        """Run callback(argument) about `delay` seconds from now (whole ticks from the current tick)"""
+        ticks = max(1, -int(-delay // self.tick))
+        deadline = self.current + ticks
+        timer = Timer(deadline, (ticks - 1) // len(self.slots), callback, argument)
+        self.slots[deadline % len(self.slots)].append(timer)
+        self.pending += 1
+        if self.pending == 1 and self._wakeup is not None:
+            self._wakeup.set()
+        return timer
+
+    def _advance(self) -> None:
+        """Process one tick: fire due timers in the current slot, keep the rest"""
+        self.current += 1
+        slot = self.slots[self.current % len(self.slots)]
+        if not slot:
+            return
+        due, keep = [], []
+        for timer in slot:
+            if timer.cancelled:
+                self.pending -= 1
+            elif timer.rounds:
+                timer.rounds -= 1
+                keep.append(timer)
+            else:
+                due.append(timer)
+        # Callbacks may schedule into this same slot (a full turn later); swap first
+        self.slots[self.current % len(self.slots)] = keep
+        self.pending -= len(due)
+        for timer in due:
+            self.fired += 1
+            try:
+                timer.callback(timer.argument)
+            except Exception as e:
+                logger.error(f"Timer callback failed: {e}")
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self.started_at = loop.time()
+        while True:
+            if not self.pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                # Idle time is skipped: the wheel resumes from the current tick
+                self.started_at = loop.time() - self.current * self.tick
+            due = self.started_at + (self.current + 1) * self.tick
+            delay = due - loop.time()
+            if delay < -self.tick:
+                self.late_ticks += 1
+            # sleep(0) still yields, so catching up after a stall never starves the readers
+            await asyncio.sleep(max(0.0, delay))
+            self._advance()
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Compact binary traffic traces: capture (server and client) and streaming read (client replay)
+
+With TRACE_CAPTURE_PATH set, every connection open, message and close is appended to a trace
+file as a fixed 13-byte record:
+
+    kind (u8) | connection (u32) | gap since the previous record in µs (u32) | value (u32)
+
+- OPEN: a connection was established (value 0)
+- CLIENT_MESSAGE / SERVER_MESSAGE: a message in that direction, value = size in bytes
+- CLOSE: the connection closed, value = close code (0 if none)
+- GAP: no event, only carries a gap too long for one record
+
+Connection numbers are local to the trace. The file starts with a 16-byte header (magic,
+version and the wall-clock start time). Records go through a 64 KiB write buffer and
+capture stops at TRACE_MAX_BYTES (default 256 MiB), so a busy pod writes about 13 bytes per
+message and never fills its disk. With worker processes each worker writes PATH.wN.
+
+`python traffic.py FILE` prints a summary of a trace.
+
+This file is shared between the server and client applications: keep both copies identical.
+"""
+
+import logging
+import os
+import struct
+import sys
+import time
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'WSTR'
+VERSION = 1
+HEADER = struct.Struct('<4sBxxxd')  # magic, version, start time (unix seconds)
+RECORD = struct.Struct('<BIII')
+
+GAP, OPEN, CLIENT_MESSAGE, SERVER_MESSAGE, CLOSE = range(5)
+KINDS = ('gap', 'open', 'client_message', 'server_message', 'close')
+
+MAX_GAP_US = 0xFFFFFFFF
+READ_RECORDS = 4096
+
+
+class TraceWriter:
+    """Appends records for one process; all calls come from its event loop"""
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.file: Optional[BinaryIO] = open(path, 'wb', buffering=64 * 1024)
+        self.file.write(HEADER.pack(MAGIC, VERSION, time.time()))
+        self.written = HEADER.size
+        self.last_ns = time.monotonic_ns()
+        self.connections = 0
+        self.records = 0
+
+    def open_connection(self) -> int:
+        """Record an OPEN; returns the trace's number for the connection"""
+        self.connections += 1
+        self.record(OPEN, self.connections)
+        return self.connections
+
+    def record(self, kind: int, connection: int, value: int = 0) -> None:
+        if self.file is None:
+            return
+        now = time.monotonic_ns()
+        gap = (now - self.last_ns) // 1000
+        self.last_ns = now
+        write = self.file.write
+        while gap > MAX_GAP_US:
+            write(RECORD.pack(GAP, 0, MAX_GAP_US, 0))
+            gap -= MAX_GAP_US
+            self.written += RECORD.size
+        write(RECORD.pack(kind, connection, gap, value))
+        self.written += RECORD.size
+        self.records += 1
+        if self.written >= self.max_bytes:
+            logger.warning(f"Trace {self.path} reached TRACE_MAX_BYTES ({self.max_bytes}); capture stopped")
+            self.close()
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            logger.info(f"Trace written to {self.path}: {self.records} records, {self.connections} connections")
+
+
+def message_size(message) -> int:
+    """Size in bytes of a WebSocket message as received or sent (text frames are UTF-8)"""
+    return len(message) if isinstance(message, (bytes, bytearray)) else len(message.encode())
+
+
+def trace_writer_from_env(suffix: str = '') -> Optional[TraceWriter]:
+    """TraceWriter for TRACE_CAPTURE_PATH (+ suffix), or None when capture is off"""
+    path = os.getenv('TRACE_CAPTURE_PATH')
+    if not path:
+        return None
+    try:
+        writer = TraceWriter(path + suffix, int(os.getenv('TRACE_MAX_BYTES', str(256 * 1024 * 1024))))
+    except OSError as e:
+        logger.error(f"Could not open trace {path + suffix}: {e}")
+        return None
+    logger.info(f"Capturing traffic trace to {writer.path}")
+    return writer
+
+
+def read_trace(path: str) -> Iterator[Tuple[float, int, int, int]]:
+    """(seconds since the trace started, kind, connection, value) per record, read incrementally"""
+    with open(path, 'rb') as f:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size or header[:4] != MAGIC:
+            raise ValueError(f"{path} is not a traffic trace")
+        magic, version, _ = HEADER.unpack(header)
+        if version != VERSION:
+            raise ValueError(f"{path}: unsupported trace version {version}")
+        elapsed_us = 0
+        while True:
+            chunk = f.read(RECORD.size * READ_RECORDS)
+            usable = len(chunk) - len(chunk) % RECORD.size  # a torn last record is ignored
+            if not usable:
+                return
+            for kind, connection, gap, value in RECORD.iter_unpack(chunk[:usable]):
+                elapsed_us += gap
+                if kind != GAP:
+                    yield elapsed_us / 1e6, kind, connection, value
+
+
+def summarize(path: str) -> Dict[str, float]:
+    counts = dict.fromkeys(KINDS[1:], 0)
+    bytes_by_kind = {'client_message': 0, 'server_message': 0}
+    elapsed = 0.0
+    for elapsed, kind, _, value in read_trace(path):
+        counts[KINDS[kind]] += 1
+        if KINDS[kind] in bytes_by_kind:
+            bytes_by_kind[KINDS[kind]] += value
+    summary = {'seconds': round(elapsed, 3), 'connections': counts['open'], 'closes': counts['close'],
+               'client_messages': counts['client_message'], 'server_messages': counts['server_message'],
+               'client_bytes': bytes_by_kind['client_message'], 'server_bytes': bytes_by_kind['server_message']}
+    if elapsed:
+        summary['client_messages_per_sec'] = round(counts['client_message'] / elapsed, 1)
+    return summary
+
+
+if __name__ == '__main__':
+    for trace_path in sys.argv[1:]:
+        print(trace_path)
+        for key, number in summarize(trace_path).items():
+            print(f"  {key}: {number}")
@@ -1,6 +1,12 @@
 #!/bin/bash
 # Envoy WebSocket Monitoring Script
 # Assumes: kubectl port-forward svc/envoy-proxy-service 9901:9901 is running
+# Point-in-time snapshot; for per-second rates over time use bench/envoy_stats.py (see below)
+
+ADMIN=${ENVOY_ADMIN:-http://localhost:9901}
+# One fetch of each, shared by all sections below
+STATS=$(curl -s "$ADMIN/stats")
+CONFIG_DUMP=$(curl -s "$ADMIN/config_dump")
 
 echo "====================================================================="
 echo "            ENVOY WEBSOCKET METRICS & CONFIGURATION"
@@ -9,7 +15,7 @@ echo ""
 
 echo "1. === CIRCUIT BREAKER CONFIGURATION (Max Connections per Pod) ==="
 echo "---------------------------------------------------------------------"
-curl -s http://localhost:9901/config_dump | jq '.configs[1].static_clusters[0].cluster.circuit_breakers.thresholds[0]' | \
+echo "$CONFIG_DUMP" | jq '.configs[1].static_clusters[0].cluster.circuit_breakers.thresholds[0]' | \
 jq '{
   "Max Connections": .max_connections,
   "Max Pending Requests": .max_pending_requests, 
@@ -20,7 +26,7 @@ echo ""
 
 echo "2. === RATE LIMITING CONFIGURATION ===="
 echo "---------------------------------------------------------------------"
-curl -s http://localhost:9901/config_dump | jq -r '
+echo "$CONFIG_DUMP" | jq -r '
 .configs[] | 
 select(.["@type"] == "type.googleapis.com/envoy.admin.v3.ListenersConfigDump") |
 .static_listeners[0].listener.filter_chains[0].filters[0].typed_config.http_filters[] |
@@ -35,7 +41,7 @@ echo ""
 
 echo "3. === CURRENT CIRCUIT BREAKER STATISTICS ===="
 echo "---------------------------------------------------------------------"
-curl -s http://localhost:9901/stats | grep -E "cluster\.websocket_cluster\.circuit_breakers" | \
+echo "$STATS" | grep -E "cluster\.websocket_cluster\.circuit_breakers" | \
 awk '{
   if ($1 ~ /cx_open/) print "🔴 Connections Circuit Breaker Open: " $2
   else if ($1 ~ /cx_pool_full/) print "🟠 Connection Pool Full: " $2  
@@ -48,7 +54,7 @@ echo ""
 
 echo "4. === WEBSOCKET CONNECTION STATISTICS ===="
 echo "---------------------------------------------------------------------"
-curl -s http://localhost:9901/stats | grep -E "cluster\.websocket_cluster\." | \
+echo "$STATS" | grep -E "cluster\.websocket_cluster\." | \
 grep -E "(cx_|upstream_cx_)" | \
 awk '{
   if ($1 ~ /upstream_cx_total/) print "📊 Total Upstream Connections Created: " $2
@@ -64,7 +70,7 @@ echo ""
 
 echo "5. === REQUEST AND RESPONSE STATISTICS ===="
 echo "---------------------------------------------------------------------"
-curl -s http://localhost:9901/stats | grep -E "cluster\.websocket_cluster\." | \
+echo "$STATS" | grep -E "cluster\.websocket_cluster\." | \
 grep -E "(upstream_rq_|retry_)" | \
 awk '{
   if ($1 ~ /upstream_rq_total/) print "📋 Total Requests: " $2
@@ -81,7 +87,7 @@ echo ""
 
 echo "6. === RATE LIMITING STATISTICS ===="
 echo "---------------------------------------------------------------------"
-curl -s http://localhost:9901/stats | grep -E "http\..*\.local_rate_limit" | \
+echo "$STATS" | grep -E "http\..*\.local_rate_limit" | \
 awk '{
   if ($1 ~ /enabled/) print "✅ Rate Limiting Enabled: " $2
   else if ($1 ~ /enforced/) print "🚫 Rate Limiting Enforced: " $2
@@ -93,7 +99,7 @@ echo ""
 
 echo "7. === WEBSOCKET UPGRADE STATISTICS ===="
 echo "---------------------------------------------------------------------"
-curl -s http://localhost:9901/stats | grep -E "(websocket|upgrade)" | \
+echo "$STATS" | grep -E "(websocket|upgrade)" | \
 awk '{
   if ($1 ~ /websocket/) print "🔌 WebSocket: " $1 " = " $2
   else if ($1 ~ /upgrade/) print "⬆️ Upgrade: " $1 " = " $2
@@ -102,7 +108,7 @@ echo ""
 
 echo "8. === HEALTH CHECK STATUS ===="
 echo "---------------------------------------------------------------------"
-curl -s http://localhost:9901/stats | grep -E "cluster\.websocket_cluster\.health_check" | \
+echo "$STATS" | grep -E "cluster\.websocket_cluster\.health_check" | \
 awk '{
   if ($1 ~ /attempt/) print "🏥 Health Check Attempts: " $2
   else if ($1 ~ /success/) print "✅ Health Check Success: " $2
@@ -114,17 +120,17 @@ echo ""
 
 echo "9. === ENDPOINT HEALTH STATUS ===="
 echo "---------------------------------------------------------------------"
-curl -s http://localhost:9901/clusters | grep -A 20 "websocket_cluster" | \
+curl -s "$ADMIN/clusters" | grep -A 20 "websocket_cluster" | \
 grep -E "(healthy|unhealthy|no_traffic)" | head -10
 echo ""
 
 echo "10. === CURRENT CONFIGURATION SUMMARY ===="
 echo "---------------------------------------------------------------------"
 echo "Based on locals.tf and live config:"
-curl -s http://localhost:9901/config_dump | jq -r '.configs[1].static_clusters[0].cluster.circuit_breakers.thresholds[0]' | \
+echo "$CONFIG_DUMP" | jq -r '.configs[1].static_clusters[0].cluster.circuit_breakers.thresholds[0]' | \
 jq -r '"Max Connections per Server Pod: " + (.max_connections | tostring)'
 
-curl -s http://localhost:9901/config_dump | jq -r '
+echo "$CONFIG_DUMP" | jq -r '
 .configs[] | 
 select(.["@type"] == "type.googleapis.com/envoy.admin.v3.ListenersConfigDump") |
 .static_listeners[0].listener.filter_chains[0].filters[0].typed_config.http_filters[] |
@@ -136,11 +142,12 @@ echo ""
 echo "====================================================================="
 echo "                    MONITORING COMMANDS"
 echo "====================================================================="
-echo "Watch live connection changes:"
-echo "  watch -n 2 'curl -s http://localhost:9901/stats | grep cluster.websocket_cluster.upstream_cx_active'"
+echo "Watch circuit breakers, rate limiting, cx_active and Lua stats with per-second rates:"
+echo "  python bench/envoy_stats.py --target localhost:9901 --print"
 echo ""
-echo "Monitor rate limiting:"
-echo "  watch -n 1 'curl -s http://localhost:9901/stats | grep local_rate_limit'"
+echo "Same for every Envoy pod at once (Prometheus /metrics on :9902):"
+echo "  ENVOY_STATS_TARGETS=\$(kubectl get pods -l app=envoy-proxy -o jsonpath='{range .items[*]}{.status.podIP}:9901,{end}') \\"
+echo "    python bench/envoy_stats.py --interval 0.5"
 echo ""
 echo "View cluster health:"
 echo "  curl -s http://localhost:9901/clusters"
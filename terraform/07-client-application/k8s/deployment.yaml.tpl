@@ -18,6 +18,10 @@ spec:
         app: ${app_name}
         component: websocket-client
         version: ${app_version}
+      annotations:
+        prometheus.io/scrape: "true"
+        prometheus.io/port: "${container_port}"
+        prometheus.io/path: "/metrics"
     spec:
       containers:
       - name: websocket-client
@@ -47,6 +51,12 @@ spec:
           value: "${message_interval_min}"
         - name: MESSAGE_INTERVAL_MAX
           value: "${message_interval_max}"
+        - name: WIRE_FORMAT
+          value: "${wire_format}"
+        - name: VIRTUAL_PODS
+          value: "${virtual_pods}"
+        - name: CLIENT_WORKERS
+          value: "${client_workers}"
         resources:
           requests:
             cpu: ${cpu_request}
@@ -14,6 +14,9 @@ locals {
   connection_interval  = 10    # Seconds between connection attempts
   message_interval_min = 10    # Minimum seconds between messages
   message_interval_max = 20    # Maximum seconds between messages
+  wire_format          = "json" # "json" or "binary" (envoy-poc.bin.v1 subprotocol)
+  virtual_pods         = 0      # Pod identities hosted per client pod (0: just the pod itself)
+  client_workers       = 1      # Processes the identities are sharded across
   
   # ECR Configuration
   ecr_repository_name = "cfndev-envoy-proxy-poc-client"
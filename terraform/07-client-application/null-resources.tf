@@ -50,6 +50,9 @@ resource "null_resource" "deploy_client_app" {
       connection_interval  = local.connection_interval
       message_interval_min = local.message_interval_min
       message_interval_max = local.message_interval_max
+      wire_format          = local.wire_format
+      virtual_pods         = local.virtual_pods
+      client_workers       = local.client_workers
       cpu_request          = local.cpu_request
       memory_request       = local.memory_request
       cpu_limit            = local.cpu_limit
@@ -24,6 +24,9 @@ echo "Image Tag: $IMAGE_TAG"
 echo "Logging in to Amazon ECR..."
 aws ecr get-login-password --region $REGION --profile $PROFILE | docker login --username AWS --password-stdin $ECR_REPOSITORY
 
+# Shared modules must match the server's copies
+"$(dirname "${BASH_SOURCE[0]}")/../../05-server-application/scripts/check-shared-files.sh"
+
 # Build Docker image
 echo "Building Docker image..."
 cd app